@@ -0,0 +1,117 @@
+# arrays.py
+
+import operator
+from array import array
+from itertools import repeat
+
+from rope import Rope
+
+# Numeric arrays: a Nova array is a NovaArray over an array.array of machine integers ('q') or
+# doubles ('d'). Arithmetic and comparison operators apply element-wise in one VM instruction
+# (array op array of the same length, or array op number), with the per-element loop running in C.
+# Comparisons give an integer array of 0/1. Arrays are immutable values.
+
+INT_TYPECODE = 'q'
+FLOAT_TYPECODE = 'd'
+NUMBER_TYPES = (int, float, bool)
+
+
+def is_number(value): return type(value) in NUMBER_TYPES
+
+def typecode_of(values):
+    return FLOAT_TYPECODE if any(type(value) is float for value in values) else INT_TYPECODE
+
+def make_array(typecode, values):
+    try:
+        return NovaArray(array(typecode, values))
+    except OverflowError:
+        raise Exception("Integer overflow in array value") from None
+
+class NovaArray:
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+    @classmethod
+    def from_values(cls, values):
+        #Array literal: every element must be a number
+        for value in values:
+            if not is_number(value): raise Exception(f"Array elements must be numbers, got {value!r}")
+        return make_array(typecode_of(values), values)
+
+    def __len__(self): return len(self.data)
+    def __iter__(self): return iter(self.data)
+    def __sizeof__(self): return object.__sizeof__(self) + self.data.__sizeof__()
+
+    def __str__(self): return f"[{', '.join(map(str, self.data))}]"
+    __repr__ = __str__
+
+    def __bool__(self):
+        raise Exception("The truth value of an array is ambiguous; use len(), min() or max()")
+
+    def elementwise(self, other, op, symbol, typecode=None, reflected=False):
+        if type(other) is NovaArray:
+            if len(other.data) != len(self.data):
+                raise Exception(f"Array length mismatch for '{symbol}': {len(self.data)} and {len(other.data)}")
+            right, float_operand = other.data, other.data.typecode == FLOAT_TYPECODE
+        elif is_number(other):
+            right, float_operand = repeat(other), type(other) is float
+        else:
+            raise Exception(f"Cannot apply '{symbol}' to an array and {type(other).__name__}")
+        if typecode is None:
+            typecode = FLOAT_TYPECODE if float_operand or self.data.typecode == FLOAT_TYPECODE else INT_TYPECODE
+        values = map(op, right, self.data) if reflected else map(op, self.data, right)
+        return make_array(typecode, values)
+
+    def __add__(self, other): return self.elementwise(other, operator.add, '+')
+    def __sub__(self, other): return self.elementwise(other, operator.sub, '-')
+    def __mul__(self, other): return self.elementwise(other, operator.mul, '*')
+    def __truediv__(self, other): return self.elementwise(other, operator.truediv, '/', FLOAT_TYPECODE)
+    def __radd__(self, other): return self.elementwise(other, operator.add, '+', reflected=True)
+    def __rsub__(self, other): return self.elementwise(other, operator.sub, '-', reflected=True)
+    def __rmul__(self, other): return self.elementwise(other, operator.mul, '*', reflected=True)
+    def __rtruediv__(self, other): return self.elementwise(other, operator.truediv, '/', FLOAT_TYPECODE, True)
+
+    # Python reflects comparisons itself: 1 < a calls a.__gt__(1)
+    def __eq__(self, other): return self.elementwise(other, operator.eq, '==', INT_TYPECODE)
+    def __ne__(self, other): return self.elementwise(other, operator.ne, '!=', INT_TYPECODE)
+    def __lt__(self, other): return self.elementwise(other, operator.lt, '<', INT_TYPECODE)
+    def __gt__(self, other): return self.elementwise(other, operator.gt, '>', INT_TYPECODE)
+
+    # Element-wise __eq__ makes arrays unhashable, so calls with array arguments are never memoized
+    __hash__ = None
+
+def index_value(target, index):
+    #target[index] for arrays and strings, indices 0 .. len - 1
+    if type(target) is Rope: target = str(target)
+    if type(target) is not NovaArray and type(target) is not str:
+        raise Exception(f"Cannot index a {type(target).__name__}")
+    if type(index) is not int: raise Exception(f"Index must be an integer, got {index!r}")
+    if not 0 <= index < len(target): raise Exception(f"Index {index} out of range for length {len(target)}")
+    return target.data[index] if type(target) is NovaArray else target[index]
+
+def expect_array(name, value):
+    if type(value) is not NovaArray: raise Exception(f"{name}() expects an array, got {value!r}")
+    if not value.data and name != 'sum': raise Exception(f"{name}() of an empty array")
+    return value.data
+
+def builtin_len(value):
+    if type(value) is not NovaArray and type(value) is not str and type(value) is not Rope:
+        raise Exception(f"len() expects an array or a string, got {value!r}")
+    return len(value)
+
+def builtin_range(n):
+    if type(n) is not int: raise Exception(f"range() expects an integer, got {n!r}")
+    return NovaArray(array(INT_TYPECODE, range(n)))
+
+# Built-in functions, all taking one argument. Their names are reserved: the compiler emits
+# a BUILTIN instruction for them instead of a CALL.
+BUILTIN_FUNCTIONS = {
+    'len': builtin_len,
+    'sum': lambda value: sum(expect_array('sum', value)),
+    'min': lambda value: min(expect_array('min', value)),
+    'max': lambda value: max(expect_array('max', value)),
+    'mean': lambda value: sum(expect_array('mean', value)) / len(value.data),
+    'range': builtin_range,
+}
@@ -0,0 +1,138 @@
+# batch.py
+
+import contextlib
+import io
+import os
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from lexer import Lexer
+from parser import Parser
+from interpreter import ClosureCompiler
+from cache import load_program
+from regcompiler import compile_source as compile_registers
+from regvm import RegisterVM
+from vm import VM, DEFAULT_MEMO_SIZE, DEFAULT_TIER_THRESHOLD
+
+NOVA_SUFFIX = '.nova'
+
+
+class ScriptTimeout(Exception):
+    pass
+
+def collect_paths(inputs):
+    #Expands directories into the .nova files below them; files are taken as given
+    paths = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                paths.extend(os.path.join(root, name) for name in sorted(files) if name.endswith(NOVA_SUFFIX))
+        else:
+            paths.append(path)
+    return paths
+
+def on_timeout(signum, frame):
+    raise ScriptTimeout('time limit exceeded')
+
+@contextlib.contextmanager
+def time_limit(seconds):
+    #Interrupts the worker after `seconds` of wall time; a no-op without SIGALRM (Windows)
+    if not seconds or not hasattr(signal, 'setitimer'):
+        yield
+        return
+    previous = signal.signal(signal.SIGALRM, on_timeout)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+def run_file(path, engine='vm', opt_level=0, memo_size=DEFAULT_MEMO_SIZE,
+             tier_threshold=DEFAULT_TIER_THRESHOLD, timeout=None, limits=None):
+    #Compiles and runs one script in the calling process, capturing what it prints.
+    #Never raises: failures are reported in the returned result dict.
+    result = {'path': path, 'ok': False, 'error': None, 'output': '', 'compile_s': 0.0, 'run_s': 0.0}
+    output = io.StringIO()
+    stage = 'compile'
+    start = time.perf_counter()
+    try:
+        with time_limit(timeout), contextlib.redirect_stdout(output):
+            with open(path, 'r', encoding='utf-8') as f:
+                source = f.read()
+            if engine == 'closure':
+                program = ClosureCompiler(path=path).compile_program(Parser(Lexer(source).iter_tokens(), keep_tokens=False).parse())
+            elif engine == 'register':
+                program = RegisterVM(*compile_registers(source, path)).run
+            else:
+                bytecode, functions, local_names = load_program(path, source, opt_level)
+                program = VM(bytecode, functions, local_names, memo_size=memo_size,
+                             tier_threshold=tier_threshold, limits=limits).run
+            result['compile_s'] = time.perf_counter() - start
+            stage, start = 'run', time.perf_counter()
+            program()
+        result['ok'] = True
+    except Exception as e:
+        result['error'] = f"{'Compile' if stage == 'compile' else 'Runtime'} Error: {e}"
+    if stage == 'run': result['run_s'] = time.perf_counter() - start
+    result['output'] = output.getvalue()
+    return result
+
+def worker_error(path, error):
+    return {'path': path, 'ok': False, 'error': f"Worker Error: {error!r}", 'output': '', 'compile_s': 0.0, 'run_s': 0.0}
+
+def run_batch(paths, jobs=None, **options):
+    #Runs every script in a pool of `jobs` worker processes (default: one per core) and yields
+    #result dicts in completion order. Script errors never escape run_file. A worker process
+    #that dies breaks the pool, failing every script still queued in it; those are run again
+    #in isolation, so only the script that crashed is reported as a worker error.
+    broken = []
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(run_file, path, **options): path for path in paths}
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except BrokenProcessPool:
+                broken.append(futures[future])
+            except Exception as e:
+                yield worker_error(futures[future], e)
+    yield from run_isolated(broken, jobs, **options)
+
+def run_isolated(paths, jobs=None, **options):
+    #Runs every script in a one-worker pool of its own, `jobs` pools at a time, so a crash
+    #fails no other script
+    pending = list(reversed(paths))
+    running = {}
+    limit = jobs or os.cpu_count() or 1
+    try:
+        while pending or running:
+            while pending and len(running) < limit:
+                path = pending.pop()
+                executor = ProcessPoolExecutor(max_workers=1)
+                running[executor.submit(run_file, path, **options)] = (path, executor)
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, executor = running.pop(future)
+                executor.shutdown()
+                try:
+                    yield future.result()
+                except Exception as e:
+                    yield worker_error(path, e)
+    finally:
+        for path, executor in running.values(): executor.shutdown(cancel_futures=True)
+
+def summarize(results, wall_s):
+    failed = [result for result in results if not result['ok']]
+    return {
+        'files': len(results),
+        'passed': len(results) - len(failed),
+        'failed': len(failed),
+        'wall_s': wall_s,
+        'compile_s': sum(result['compile_s'] for result in results),
+        'run_s': sum(result['run_s'] for result in results),
+        'slowest': sorted(((result['compile_s'] + result['run_s'], result['path']) for result in results),
+                          reverse=True)[:10],
+    }
@@ -0,0 +1,259 @@
+# benchmarks/run.py
+#
+# Times every stage of the pipeline separately on the workloads in this directory:
+#   lex       Lexer.tokenize            -> tokens/s
+#   parse     Parser.parse              -> tokens/s
+#   compile   Compiler.compile
+#   vm        VM.run, memoization and native tier off (raw dispatch) -> instructions/s
+#   vm_tuned  VM.run with the default memo/tier settings
+#   regvm     the register VM (regcompiler.py + regvm.py)  -> register instructions/s
+#   closure   the closure-compiled tree walker
+#   interpreter  Interpreter.visit, for the workloads its subset of Nova can run
+# Each stage reports its best time over --repeat runs and its tracemalloc peak from one more run.
+#
+#   python benchmarks/run.py                    compare against baseline.json, exit 1 on a regression
+#   python benchmarks/run.py --strict           ... also on a slowdown or memory growth
+#   python benchmarks/run.py --update-baseline  record the current numbers as the new baseline
+#
+# A regression is a stage that ran in the baseline and fails now. Timings and tracemalloc peaks
+# depend on the machine and the Python version, so by default they are compared and reported
+# as warnings only; pass --strict on the machine that recorded the baseline to fail on them.
+
+import argparse
+import contextlib
+import glob
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from lexer import Lexer
+from parser import Parser
+from compiler import Compiler
+from interpreter import Interpreter, ClosureCompiler
+from profiler import Profiler
+from vm import VM
+from regcompiler import RegisterCompiler
+from regvm import RegisterVM
+
+BASELINE_PATH = os.path.join(HERE, 'baseline.json')
+# A stage regresses when it is this much slower (or uses this much more memory) than the baseline
+DEFAULT_THRESHOLD = 0.25
+# Times below this are dominated by noise and never count as regressions
+MIN_COMPARED_SECONDS = 0.005
+GENERATED_STATEMENTS = 5000
+
+
+def generated_source(statements=GENERATED_STATEMENTS):
+    #A large straight-line script (lets, arithmetic, ifs, prints) that every engine can run
+    lines = ['// generated', 'let v0 = 1']
+    for n in range(1, statements):
+        if n % 10 == 0:
+            lines.append(f'if v{n - 1} > {n} {{\n    print "big"\n}} else {{\n    print v{n - 1}\n}}')
+            lines.append(f'let v{n} = v{n - 1} - {n}')
+        else:
+            lines.append(f'let v{n} = v{n - 1} + {n} * 2 - v{n // 2}')
+    return '\n'.join(lines) + '\n'
+
+def workloads():
+    sources = {}
+    for path in sorted(glob.glob(os.path.join(HERE, '*.nova'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            sources[os.path.splitext(os.path.basename(path))[0]] = f.read()
+    sources['generated'] = generated_source()
+    return sources
+
+@contextlib.contextmanager
+def quiet():
+    #Program output would swamp the report and time the terminal instead of the engine
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+def stages(source):
+    #(stage name, setup, run): setup builds fresh inputs outside the timed region
+    def tokens(): return Lexer(source).tokenize()
+    def tree(): return Parser(tokens()).parse()
+    def program():
+        compiler = Compiler()
+        compiler.compile(tree())
+        return compiler
+    def vm(**options):
+        compiler = program()
+        return lambda: VM(compiler.bytecode, compiler.functions, compiler.local_names, **options)
+    def register_vm():
+        program = RegisterCompiler().compile_program(tree())
+        return lambda: RegisterVM(*program)
+    return [
+        ('lex', lambda: Lexer(source), lambda lexer: lexer.tokenize()),
+        ('parse', tokens, lambda tokens: Parser(tokens).parse()),
+        ('compile', tree, lambda node: Compiler().compile(node)),
+        ('vm', vm(memo_size=0, tier_threshold=0), lambda machine: machine.run()),
+        ('vm_tuned', vm(), lambda machine: machine.run()),
+        ('regvm', register_vm(), lambda machine: machine.run()),
+        ('closure', lambda: ClosureCompiler().compile_program(tree()), lambda program: program()),
+        ('interpreter', tree, lambda node: Interpreter().visit(node)),
+    ]
+
+def measure(setup, run, repeat):
+    #Returns (best seconds, peak bytes), or the exception if the stage cannot run this workload
+    best = None
+    try:
+        with quiet():
+            for _ in range(repeat):
+                value = setup()
+                start = time.perf_counter()
+                run(value)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            value = setup()
+            tracemalloc.start()
+            try:
+                run(value)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+    except Exception as e:
+        return e
+    return best, peak
+
+def count_instructions(source):
+    #Instructions the raw-dispatch VM executes, counted by one profiled run
+    compiler = Compiler()
+    compiler.compile(Parser(Lexer(source).tokenize()).parse())
+    profiler = Profiler()
+    with quiet():
+        VM(compiler.bytecode, compiler.functions, compiler.local_names,
+           memo_size=0, tier_threshold=0, profiler=profiler).run()
+    return sum(profiler.op_counts)
+
+def count_register_instructions(source):
+    #Instructions the register VM executes, counted through wrapped handlers
+    machine = RegisterVM(*RegisterCompiler().compile_program(Parser(Lexer(source).tokenize()).parse()))
+    count = 0
+    def counting(handler):
+        def run(a, b, c):
+            nonlocal count
+            count += 1
+            handler(a, b, c)
+        return run
+    machine.handlers = [counting(handler) for handler in machine.handlers]
+    with quiet():
+        machine.run()
+    return count
+
+def benchmark(name, source, repeat):
+    ntokens = len(Lexer(source).tokenize())
+    result = {'tokens': ntokens, 'instructions': count_instructions(source),
+              'register_instructions': count_register_instructions(source), 'stages': {}, 'skipped': {}}
+    for stage, setup, run in stages(source):
+        measured = measure(setup, run, repeat)
+        if isinstance(measured, Exception):
+            # e.g. the Interpreter has no while/fun support
+            result['skipped'][stage] = f'{type(measured).__name__}: {measured}'
+            continue
+        seconds, peak = measured
+        entry = {'seconds': seconds, 'peak_bytes': peak}
+        if stage in ('lex', 'parse'):
+            entry['tokens_per_s'] = ntokens / seconds
+        if stage in ('vm', 'vm_tuned'):
+            # vm_tuned skips memoized and native calls, so its rate is relative to the raw count
+            entry['instructions_per_s'] = result['instructions'] / seconds
+        if stage == 'regvm':
+            entry['instructions_per_s'] = result['register_instructions'] / seconds
+        result['stages'][stage] = entry
+    return result
+
+def report(results, out=sys.stdout):
+    for name, result in results.items():
+        print(f"{name}: {result['tokens']} tokens, {result['instructions']} stack / "
+              f"{result['register_instructions']} register instructions", file=out)
+        for stage, entry in result['stages'].items():
+            rate = ''
+            if 'tokens_per_s' in entry: rate = f"{entry['tokens_per_s']:>14,.0f} tokens/s"
+            if 'instructions_per_s' in entry: rate = f"{entry['instructions_per_s']:>14,.0f} instr/s"
+            print(f"  {stage:<12} {entry['seconds'] * 1000:>10.2f} ms {entry['peak_bytes'] / 1024:>10.1f} KiB {rate}",
+                  file=out)
+        for stage, reason in result['skipped'].items():
+            print(f"  {stage:<12} skipped ({reason})", file=out)
+
+def compare(results, baseline, threshold):
+    #Returns (regressions, slowdowns): messages for the stages that ran in the baseline and now
+    #fail, and for the stages that got slower or use more memory than `threshold` allows.
+    #Stages new since the baseline are not compared.
+    regressions, slowdowns = [], []
+    for name, result in results.items():
+        for stage, reason in result['skipped'].items():
+            if stage in baseline.get(name, {}).get('stages', {}):
+                regressions.append(f"{name}/{stage}: no longer runs ({reason})")
+        for stage, entry in result['stages'].items():
+            old = baseline.get(name, {}).get('stages', {}).get(stage)
+            if old is None: continue
+            if entry['seconds'] > MIN_COMPARED_SECONDS and entry['seconds'] > old['seconds'] * (1 + threshold):
+                slowdowns.append(f"{name}/{stage}: {old['seconds'] * 1000:.2f} ms -> {entry['seconds'] * 1000:.2f} ms")
+            if entry['peak_bytes'] > old['peak_bytes'] * (1 + threshold) + 4096:
+                slowdowns.append(f"{name}/{stage}: peak {old['peak_bytes']} -> {entry['peak_bytes']} bytes")
+    return regressions, slowdowns
+
+def parse_args():
+    arg_parser = argparse.ArgumentParser(description='Benchmark the Nova lexer, parser, compiler and engines.')
+    arg_parser.add_argument('workloads', nargs='*', help='workload names to run (default: all)')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='timed runs per stage; the best one counts')
+    arg_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                            help='allowed slowdown / memory growth before a stage counts as a regression')
+    arg_parser.add_argument('--strict', action='store_true',
+                            help='also fail on slowdowns and memory growth (compare on the baseline\'s machine)')
+    arg_parser.add_argument('--baseline', default=BASELINE_PATH, help='baseline JSON file')
+    arg_parser.add_argument('--update-baseline', action='store_true', help='write the results as the new baseline')
+    arg_parser.add_argument('--json', metavar='JSON_FILE', help='also write the results to this file')
+    return arg_parser.parse_args()
+
+def main():
+    args = parse_args()
+    sources = workloads()
+    unknown = [name for name in args.workloads if name not in sources]
+    if unknown:
+        print(f"Error: unknown workload(s) {', '.join(unknown)}; available: {', '.join(sources)}")
+        return 2
+    results = {name: benchmark(name, source, args.repeat)
+               for name, source in sources.items() if not args.workloads or name in args.workloads}
+    report(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"\nBaseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; run with --update-baseline to create one")
+        return 0
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        regressions, slowdowns = compare(results, json.load(f), args.threshold)
+    if slowdowns:
+        kind = 'regression(s)' if args.strict else 'warning(s), machine dependent'
+        print(f"\n{len(slowdowns)} {kind}: slower or larger by over {args.threshold:.0%}:")
+        for message in slowdowns:
+            print(f"  {message}")
+    if regressions:
+        print(f"\n{len(regressions)} regression(s):")
+        for message in regressions:
+            print(f"  {message}")
+    if regressions or (args.strict and slowdowns): return 1
+    print("\nNo regressions against the baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
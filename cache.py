@@ -0,0 +1,182 @@
+# cache.py
+
+import hashlib
+import marshal
+import os
+import sys
+
+from lexer import Lexer
+from parser import Parser
+from tree import FunctionDefNode, ImportNode
+from compiler import Compiler, COMPILER_VERSION
+from linker import check_calls
+from opcodes import JUMP_OPCODES
+from optimizer import Optimizer
+
+# On-disk format of a .novac file: the magic bytes followed by a marshalled tuple
+#   (compiler version, python cache tag, optimization level, source sha256, dependencies,
+#    bytecode, functions, local_names)
+# dependencies maps the path of every imported module (directly or not) to the sha256 of the
+# source it was compiled from: imported code is linked into the bytecode, so the file is stale
+# as soon as any of those modules changes.
+CACHE_MAGIC = b'NOVC'
+CACHE_SUFFIX = '.novac'
+MODULE_SUFFIX = '.nova'
+
+
+def cache_path(source_path):
+    #The cache file lives next to the source: examples/test.nova -> examples/test.novac
+    return os.path.splitext(source_path)[0] + CACHE_SUFFIX
+
+def source_hash(source):
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+def file_hash(path):
+    #sha256 of a source file, None if it cannot be read
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return source_hash(f.read())
+    except (OSError, ValueError):
+        return None
+
+def file_stamps(paths):
+    #{path: (mtime, size)}, the cheap freshness check of in-memory modules; None for a missing file
+    stamps = {}
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        stamps[path] = (stat.st_mtime_ns, stat.st_size)
+    return stamps
+
+class Module:
+    #A compiled module: bytecode holding only function definitions, linked into importers
+    __slots__ = ('path', 'bytecode', 'jumps', 'functions', 'dependencies', 'stamps')
+
+    def __init__(self, path, bytecode, functions, dependencies):
+        self.path = path
+        self.bytecode = bytecode
+        self.jumps = [i for i, (opcode, arg) in enumerate(bytecode) if opcode in JUMP_OPCODES]  # to relocate
+        self.functions = functions
+        self.dependencies = dependencies   # path -> source sha256, this module included
+        self.stamps = file_stamps(dependencies)
+
+class ModuleLoader:
+    #Resolves `import name` to name.nova, in the importing file's directory (the current
+    #directory for source without a file) and then in search_path. Every module is compiled
+    #once: the result is kept in memory for as long as the loader lives and in a .novac file
+    #next to the module, so importing a large library costs a lookup, not a compile.
+    def __init__(self, search_path=()):
+        self.search_path = list(search_path)
+        self.modules = {}     # absolute path -> Module
+        self.loading = []     # modules being compiled, innermost last
+
+    def resolve(self, name, directory=None):
+        for base in [directory or os.getcwd()] + self.search_path:
+            path = os.path.join(base, name + MODULE_SUFFIX)
+            if os.path.isfile(path): return os.path.abspath(path)
+        raise Exception(f"Module '{name}' not found")
+
+    def load(self, name, directory=None):
+        path = self.resolve(name, directory)
+        module = self.modules.get(path)
+        if module is not None and module.stamps is not None and module.stamps == file_stamps(module.dependencies):
+            return module
+        if path in self.loading: raise Exception(f"Circular import of module '{name}'")
+        self.loading.append(path)
+        try:
+            module = self.modules[path] = self.compile_module(path)
+        finally:
+            self.loading.pop()
+        return module
+
+    def parse_module(self, name, directory=None):
+        #(path, syntax tree) of a module, for the engines that compile from the tree (closure,
+        #register). The module is loaded first, so it is found, checked and cached like any import.
+        module = self.load(name, directory)
+        with open(module.path, 'r', encoding='utf-8') as f:
+            return module.path, Parser(Lexer(f.read()).iter_tokens(), keep_tokens=False).parse()
+
+    def compile_module(self, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            source = f.read()
+        digest = source_hash(source)
+        cached = read_cache(cache_path(path), digest)
+        if cached is not None:
+            bytecode, functions, local_names, dependencies = cached
+            # A cache written by running the module as a script does not list the module itself
+            return Module(path, bytecode, functions, dict(dependencies, **{path: digest}))
+        node = Parser(Lexer(source).iter_tokens(), keep_tokens=False).parse()
+        for statement in node.statements:
+            if not isinstance(statement, (FunctionDefNode, ImportNode)):
+                raise Exception(f"Module '{path}' may only contain functions and imports")
+        compiler = Compiler(self, path)
+        compiler.compile(node)
+        check_calls(compiler.calls, compiler.functions, source)
+        dependencies = dict(compiler.dependencies)
+        dependencies[path] = digest
+        write_cache(cache_path(path), digest, 0, compiler.bytecode, compiler.functions, [], dependencies)
+        return Module(path, compiler.bytecode, compiler.functions, dependencies)
+
+# Shared by every compilation in this process that does not bring its own loader
+DEFAULT_LOADER = ModuleLoader()
+
+def compile_program(source, opt_level=0, path=None, loader=None):
+    #Runs the full lexer -> parser -> compiler (-> optimizer) pipeline.
+    #Returns (bytecode, functions, local_names, dependencies); imports resolve relative to path.
+    compiler = Compiler(loader if loader is not None else DEFAULT_LOADER, path)
+    compiler.compile(Parser(Lexer(source).iter_tokens(), keep_tokens=False).parse())
+    check_calls(compiler.calls, compiler.functions, source)
+    bytecode, functions = compiler.bytecode, compiler.functions
+    if opt_level:
+        bytecode, functions = Optimizer(opt_level).optimize(bytecode, functions)
+    return bytecode, functions, compiler.local_names, compiler.dependencies
+
+def compile_source(source, opt_level=0, path=None, loader=None):
+    #(bytecode, functions, local_names)
+    return compile_program(source, opt_level, path, loader)[:3]
+
+def read_cache(path, digest, opt_level=0):
+    #Returns (bytecode, functions, local_names, dependencies), or None if the file is missing,
+    #stale or corrupt
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    if not data.startswith(CACHE_MAGIC): return None
+    try:
+        (version, tag, level, cached_digest, dependencies,
+         bytecode, functions, local_names) = marshal.loads(data[len(CACHE_MAGIC):])
+    except (EOFError, ValueError, TypeError):
+        return None
+    if (version != COMPILER_VERSION or tag != sys.implementation.cache_tag
+            or level != opt_level or cached_digest != digest):
+        return None
+    if any(file_hash(module) != module_digest for module, module_digest in dependencies.items()):
+        return None
+    return bytecode, functions, local_names, dependencies
+
+def write_cache(path, digest, opt_level, bytecode, functions, local_names, dependencies=None):
+    #Writes atomically so concurrent runs never see a half-written file; failures are ignored
+    payload = (COMPILER_VERSION, sys.implementation.cache_tag, opt_level, digest, dependencies or {},
+               bytecode, functions, local_names)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(CACHE_MAGIC + marshal.dumps(payload))
+        os.replace(tmp_path, path)
+    except OSError:
+        try: os.remove(tmp_path)
+        except OSError: pass
+
+def load_program(source_path, source, opt_level=0, loader=None):
+    #Loads compiled code from the .novac cache, compiling and refreshing the cache on a miss.
+    #Returns (bytecode, functions, local_names).
+    path, digest = cache_path(source_path), source_hash(source)
+    program = read_cache(path, digest, opt_level)
+    if program is None:
+        program = compile_program(source, opt_level, source_path, loader)
+        write_cache(path, digest, opt_level, *program)
+    return program[:3]
@@ -1,13 +1,43 @@
-#from tree import NumberNode, StringNode, BoolNode, VarAccessNode, VarAssignNode, BinOpNode, PrintNode, StatementsNode, IfNode
-from tree import NumberNode, StringNode, BoolNode, VarAccessNode, VarAssignNode, BinOpNode, PrintNode, StatementsNode, IfNode, WhileNode
+import os
 
+from tree import NumberNode, StringNode, BoolNode, VarAccessNode, VarAssignNode, BinOpNode, PrintNode, StatementsNode, IfNode, WhileNode, FunctionCallNode, ArrayNode, IndexNode
+from opcodes import OP_PUSH, OP_JUMP, OP_JUMP_IF_FALSE, OP_STORE_LOCAL, OP_LOAD_LOCAL, OP_PRINT, OP_CALL, OP_RETURN, OP_TAIL_CALL, OP_BUILD_ARRAY, OP_INDEX, OP_BUILTIN, OP_POP, BINARY_OPS
+from arrays import BUILTIN_FUNCTIONS
+
+
+# Bumped whenever the emitted bytecode or function table format changes,
+# so stale .novac cache files are rejected.
+COMPILER_VERSION = 7
+
+# Statements that are expressions leave their value on the stack, which is popped
+EXPRESSION_NODES = (NumberNode, StringNode, BoolNode, VarAccessNode, BinOpNode, FunctionCallNode, ArrayNode, IndexNode)
 
 #    The compiler, responsible for translating the AST into bytecode.
 
 class Compiler:
-    def __init__(self):
+    def __init__(self, loader=None, path=None):
         self.bytecode = []
         self.functions = {}
+        # Imports: the module loader (cache.ModuleLoader), the source file imports are resolved
+        # relative to, and the source digest of every module linked in, directly or not
+        self.loader = loader
+        self.path = path
+        self.dependencies = {}
+        self.imported = set()
+        # (name, argument count, source offset) of every call emitted, for linker.check_calls
+        self.calls = []
+        # Slot tables: names in slot order, and name -> slot for the scope being compiled.
+        # Top-level code and each function body get their own scope.
+        self.local_names = []
+        self.slots = {}
+
+    def slot(self, name):
+        #Resolve a variable name to its slot in the current scope, allocating one on first use
+        slot = self.slots.get(name)
+        if slot is None:
+            slot = self.slots[name] = len(self.local_names)
+            self.local_names.append(name)
+        return slot
 
     def compile(self, node):
         method_name = f'visit_{type(node).__name__}'
@@ -17,72 +47,116 @@ class Compiler:
     def no_visit_method(self, node):
         raise Exception(f'No visit method for {type(node).__name__}')
 
-    def visit_NumberNode(self, node): self.bytecode.append(('PUSH', node.value))
-    def visit_StringNode(self, node): self.bytecode.append(('PUSH', node.value))
-    def visit_BoolNode(self, node): self.bytecode.append(('PUSH', node.value))
-    def visit_VarAccessNode(self, node): self.bytecode.append(('LOAD', node.name))
+    def visit_NumberNode(self, node): self.bytecode.append((OP_PUSH, node.value))
+    def visit_StringNode(self, node): self.bytecode.append((OP_PUSH, node.value))
+    def visit_BoolNode(self, node): self.bytecode.append((OP_PUSH, node.value))
+    def visit_VarAccessNode(self, node): self.bytecode.append((OP_LOAD_LOCAL, self.slot(node.name)))
     
     def visit_VarAssignNode(self, node):
         self.compile(node.value_node)
-        self.bytecode.append(('STORE', node.name))
+        self.bytecode.append((OP_STORE_LOCAL, self.slot(node.name)))
 
     def visit_BinOpNode(self, node):
         self.compile(node.left_node)
         self.compile(node.right_node)
-        # FIX: Use word-based opcodes
-        if node.op == '+': self.bytecode.append(('ADD', None))
-        elif node.op == '-': self.bytecode.append(('SUB', None))
-        elif node.op == '*': self.bytecode.append(('MUL', None))
-        elif node.op == '/': self.bytecode.append(('DIV', None))
-        elif node.op in ('==', '!=', '<', '>'):
-            self.bytecode.append(('COMPARE', node.op))
-        else: raise Exception(f"Unknown operator {node.op}")
+        opcode = BINARY_OPS.get(node.op)
+        if opcode is None: raise Exception(f"Unknown operator {node.op}")
+        self.bytecode.append((opcode, None))
 
     def visit_PrintNode(self, node):
         self.compile(node.value_node)
-        self.bytecode.append(('PRINT', None))
+        self.bytecode.append((OP_PRINT, None))
 
     def visit_StatementsNode(self, node):
-        for stmt in node.statements: self.compile(stmt)
+        for stmt in node.statements:
+            self.compile(stmt)
+            # Otherwise a function would return with the value left below its result
+            if isinstance(stmt, EXPRESSION_NODES): self.bytecode.append((OP_POP, None))
 
     def visit_IfNode(self, node):
         self.compile(node.condition_node)
-        self.bytecode.append(('JUMP_IF_FALSE', 'placeholder'))
+        self.bytecode.append((OP_JUMP_IF_FALSE, 'placeholder'))
         false_idx = len(self.bytecode) - 1
         self.compile(node.if_body_node)
         jump_idx = -1
         if node.else_body_node:
-            self.bytecode.append(('JUMP', 'placeholder'))
+            self.bytecode.append((OP_JUMP, 'placeholder'))
             jump_idx = len(self.bytecode) - 1
-        self.bytecode[false_idx] = ('JUMP_IF_FALSE', len(self.bytecode))
+        self.bytecode[false_idx] = (OP_JUMP_IF_FALSE, len(self.bytecode))
         if node.else_body_node:
             self.compile(node.else_body_node)
-            self.bytecode[jump_idx] = ('JUMP', len(self.bytecode))
+            self.bytecode[jump_idx] = (OP_JUMP, len(self.bytecode))
 
     def visit_WhileNode(self, node):
         start_pos = len(self.bytecode)
         self.compile(node.condition_node)
-        self.bytecode.append(('JUMP_IF_FALSE', 'placeholder'))
+        self.bytecode.append((OP_JUMP_IF_FALSE, 'placeholder'))
         false_idx = len(self.bytecode) - 1
         self.compile(node.body_node)
-        self.bytecode.append(('JUMP', start_pos))
-        self.bytecode[false_idx] = ('JUMP_IF_FALSE', len(self.bytecode))
+        self.bytecode.append((OP_JUMP, start_pos))
+        self.bytecode[false_idx] = (OP_JUMP_IF_FALSE, len(self.bytecode))
 
     def visit_FunctionDefNode(self, node):
-        self.bytecode.append(('JUMP', 'placeholder'))
+        if node.name in BUILTIN_FUNCTIONS: raise Exception(f"'{node.name}' is a built-in function")
+        self.bytecode.append((OP_JUMP, 'placeholder'))
         jump_idx = len(self.bytecode) - 1
         start_pos = len(self.bytecode)
-        self.functions[node.name] = {'start_pos': start_pos, 'args': [t.value for t in node.arg_name_tokens]}
+        args = list(node.arg_names)
+        outer_scope = self.local_names, self.slots
+        # Arguments occupy the first slots of the function's frame
+        self.local_names, self.slots = list(args), {name: i for i, name in enumerate(args)}
+        self.functions[node.name] = {'start_pos': start_pos, 'args': args, 'locals': self.local_names}
         self.compile(node.body_node)
-        self.bytecode.append(('PUSH', None)) 
-        self.bytecode.append(('RETURN', None))
-        self.bytecode[jump_idx] = ('JUMP', len(self.bytecode))
+        self.local_names, self.slots = outer_scope
+        self.bytecode.append((OP_PUSH, None)) 
+        self.bytecode.append((OP_RETURN, None))
+        self.bytecode[jump_idx] = (OP_JUMP, len(self.bytecode))
 
     def visit_FunctionCallNode(self, node):
         for arg in node.arg_nodes: self.compile(arg)
-        self.bytecode.append(('CALL', node.name))
+        if node.name in BUILTIN_FUNCTIONS:
+            if len(node.arg_nodes) != 1: raise Exception(f"{node.name}() takes 1 argument, got {len(node.arg_nodes)}")
+            self.bytecode.append((OP_BUILTIN, node.name))
+            return
+        self.calls.append((node.name, len(node.arg_nodes), node.pos))
+        self.bytecode.append((OP_CALL, (node.name, len(node.arg_nodes))))
+
+    def visit_ArrayNode(self, node):
+        for element in node.element_nodes: self.compile(element)
+        self.bytecode.append((OP_BUILD_ARRAY, len(node.element_nodes)))
+
+    def visit_IndexNode(self, node):
+        self.compile(node.target_node)
+        self.compile(node.index_node)
+        self.bytecode.append((OP_INDEX, None))
+
+    def visit_ImportNode(self, node):
+        #Links a compiled module: its code is copied in behind a jump, with jump targets and
+        #function entries relocated, so it is never recompiled for an importer
+        if self.loader is None: raise Exception(f"Cannot import '{node.name}' without a module loader")
+        module = self.loader.load(node.name, os.path.dirname(self.path) if self.path else None)
+        self.dependencies.update(module.dependencies)
+        # A module's code already contains every module it imports
+        if module.path in self.imported: return
+        self.imported.update(module.dependencies)
+        self.bytecode.append((OP_JUMP, 'placeholder'))
+        jump_idx = len(self.bytecode) - 1
+        offset = len(self.bytecode)
+        self.bytecode.extend(module.bytecode)
+        for i in module.jumps:
+            opcode, arg = self.bytecode[offset + i]
+            self.bytecode[offset + i] = (opcode, arg + offset)
+        for name, info in module.functions.items():
+            self.functions[name] = dict(info, start_pos=info['start_pos'] + offset)
+        self.bytecode[jump_idx] = (OP_JUMP, len(self.bytecode))
 
     def visit_ReturnNode(self, node):
+        if isinstance(node.value_node, FunctionCallNode) and node.value_node.name not in BUILTIN_FUNCTIONS:
+            # return f(...) is a tail call: the callee reuses this frame and returns to our caller
+            for arg in node.value_node.arg_nodes: self.compile(arg)
+            self.calls.append((node.value_node.name, len(node.value_node.arg_nodes), node.value_node.pos))
+            self.bytecode.append((OP_TAIL_CALL, (node.value_node.name, len(node.value_node.arg_nodes))))
+            return
         self.compile(node.value_node)
-        self.bytecode.append(('RETURN', None))
+        self.bytecode.append((OP_RETURN, None))
 
@@ -0,0 +1,65 @@
+# embed.py
+
+from cache import compile_source, load_program
+from vm import DEFAULT_MEMO_SIZE, DEFAULT_TIER_THRESHOLD
+from image import load_image, make_vm
+
+
+class NovaProgram:
+    #A compiled Nova program for use from Python: compile once, then call its functions
+    #any number of times on one long-lived VM.
+    #
+    #    rules = NovaProgram.from_file('rules.nova')
+    #    rules.call('discount', 120, "gold")
+    #    discount = rules.function('discount'); discount(80, "silver")
+    #
+    #Memo caches and native code built by earlier calls are reused by later ones.
+    #Pass output=CollectorSink() (see output.py) to capture what the functions print.
+    #A NovaProgram is not thread-safe; give each thread its own instance.
+    #Worker processes serving the same program should load it with from_image(): the packed
+    #code is mapped from the file and shared between them instead of copied into each.
+    #Pass limits=Limits(...) (see limits.py) to bound every call and run() of untrusted code.
+    def __init__(self, bytecode, functions, local_names=(), memo_size=DEFAULT_MEMO_SIZE,
+                 tier_threshold=DEFAULT_TIER_THRESHOLD, output=None, limits=None):
+        self.bytecode = bytecode
+        self.functions = functions
+        self.local_names = local_names
+        self.vm = make_vm(bytecode, functions, local_names, memo_size=memo_size, tier_threshold=tier_threshold,
+                          output=output, limits=limits)
+
+    @classmethod
+    def from_source(cls, source, opt_level=0, loader=None, **options):
+        #Imports resolve relative to the current directory (see cache.ModuleLoader)
+        return cls(*compile_source(source, opt_level, loader=loader), **options)
+
+    @classmethod
+    def from_file(cls, path, opt_level=0, loader=None, **options):
+        #Goes through the .novac cache, so a warm start skips compilation
+        with open(path, 'r', encoding='utf-8') as f:
+            source = f.read()
+        return cls(*load_program(path, source, opt_level, loader), **options)
+
+    @classmethod
+    def from_image(cls, path, **options):
+        #Runs a packed image (see image.py) in place
+        return cls(*load_image(path).program(), **options)
+
+    def signatures(self):
+        #{function name: argument names}
+        return {name: list(info['args']) for name, info in self.functions.items()}
+
+    def call(self, name, *args):
+        return self.vm.call(name, *args)
+
+    def function(self, name):
+        #Returns a Python callable for one Nova function
+        if name not in self.functions: raise NameError(f"Function '{name}' is not defined.")
+        call = self.vm.call
+        return lambda *args: call(name, *args)
+
+    def run(self):
+        #Runs the program's top-level code once, from the start
+        self.vm.reset()
+        self.vm.call_stack[0].locals[:] = [None] * len(self.local_names)
+        self.vm.ip = 0
+        self.vm.run()
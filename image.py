@@ -0,0 +1,245 @@
+# image.py
+
+import marshal
+import mmap
+import struct
+from array import array
+
+from compiler import COMPILER_VERSION
+from opcodes import OP_PUSH, OP_CALL, OP_TAIL_CALL, OP_BUILTIN
+from vm import VM
+from linker import call_site
+from arrays import BUILTIN_FUNCTIONS
+
+# Packed program image (.novai). Instead of a list of (opcode, arg) tuples with the Python
+# constants inline, an image stores:
+#   - opcodes: one byte per instruction
+#   - operands: one int64 per instruction, NO_OPERAND where the compiled argument was None
+#   - a constant pool (PUSH operands index it) and a name table (CALL, TAIL_CALL and BUILTIN
+#     operands index it); jump targets, slots and array lengths are stored as they are
+#   - the function table and top-level slot names, which reference the name table
+#
+# Layout, all integers in native byte order (images are not portable across byte orders):
+#   header      IMAGE_HEADER: magic, format version, compiler version, instruction count, and
+#               (offset, size) of the constants, names and functions sections
+#   opcodes     at IMAGE_HEADER.size, padded to a multiple of 8 bytes
+#   operands    int64 array
+#   constants   marshalled tuple
+#   names       marshalled tuple of str
+#   functions   marshalled (top-level slot name indices, ((name, start, nargs, slot name indices), ...))
+#
+# load_image() maps the file read-only and executes the opcode and operand arrays in place,
+# so processes running the same image share its pages through the OS page cache. Only the
+# small tables are unmarshalled per process.
+IMAGE_MAGIC = b'NOVI'
+IMAGE_SUFFIX = '.novai'
+IMAGE_VERSION = 1
+IMAGE_HEADER = struct.Struct('=4sIIQQQQQQQ')
+NO_OPERAND = -1
+# Opcodes whose operand indexes the constant pool / the name table
+CONSTANT_OPCODES = frozenset((OP_PUSH,))
+NAME_OPCODES = frozenset((OP_CALL, OP_TAIL_CALL, OP_BUILTIN))
+
+
+class ImageError(Exception):
+    pass
+
+class PackedCode:
+    #Read-only bytecode over an opcode array and an operand array. Indexing decodes one
+    #instruction back to its compiled (opcode, arg) form, so the optimizer, purity analysis,
+    #the native tier and disassemble() work on it unchanged; PackedVM executes the raw arrays.
+    def __init__(self, ops, operands, constants, names):
+        self.ops = ops
+        self.operands = operands
+        self.constants = constants
+        self.names = names
+
+    def __len__(self): return len(self.ops)
+
+    def __getitem__(self, i):
+        if i < 0: i += len(self.ops)
+        opcode, operand = self.ops[i], self.operands[i]
+        if opcode in CONSTANT_OPCODES: return opcode, self.constants[operand]
+        if opcode in NAME_OPCODES: return opcode, self.names[operand]
+        return opcode, None if operand == NO_OPERAND else operand
+
+    def raw(self):
+        return RawInstructions(self.ops, self.operands)
+
+class RawInstructions:
+    #(opcode, operand) pairs as stored in the image, i.e. what PackedVM's handlers take
+    def __init__(self, ops, operands):
+        self.ops = ops
+        self.operands = operands
+
+    def __len__(self): return len(self.ops)
+    def __getitem__(self, i): return self.ops[i], self.operands[i]
+
+class Image:
+    #A loaded image: code is a PackedCode, functions/local_names as the Compiler produces them
+    def __init__(self, code, functions, local_names, mapping=None):
+        self.code = code
+        self.functions = functions
+        self.local_names = local_names
+        self.mapping = mapping
+
+    def program(self):
+        #(bytecode, functions, local_names), the arguments of VM / PackedVM / NovaProgram
+        return self.code, self.functions, self.local_names
+
+    def close(self):
+        #Releases the mapping; no VM running this image may be used afterwards
+        if self.mapping is None: return
+        self.code.ops.release()
+        self.code.operands.release()
+        self.mapping.close()
+        self.mapping = None
+
+def pack_program(bytecode, functions, local_names=()):
+    #Returns the image bytes for a compiled (and optionally optimized) program
+    constants, constant_index, names, name_index = [], {}, [], {}
+
+    def name(value):
+        index = name_index.get(value)
+        if index is None:
+            index = name_index[value] = len(names)
+            names.append(value)
+        return index
+
+    ops, operands = array('B'), array('q')
+    for opcode, arg in bytecode:
+        if opcode in CONSTANT_OPCODES:
+            key = (type(arg), arg)
+            operand = constant_index.get(key)
+            if operand is None:
+                operand = constant_index[key] = len(constants)
+                constants.append(arg)
+        elif opcode in NAME_OPCODES:
+            operand = name(arg)
+        elif arg is None:
+            operand = NO_OPERAND
+        elif type(arg) is int:
+            operand = arg
+        else:
+            raise ImageError(f"Cannot pack operand {arg!r} of opcode {opcode}")
+        ops.append(opcode)
+        operands.append(operand)
+    table = ([name(n) for n in local_names],
+             tuple((name(fname), info['start_pos'], len(info['args']), [name(n) for n in info['locals']])
+                   for fname, info in functions.items()))
+
+    sections = [marshal.dumps(tuple(constants)), marshal.dumps(tuple(names)), marshal.dumps(table)]
+    ops_size = -(-len(ops) // 8) * 8
+    offset = IMAGE_HEADER.size + ops_size + len(operands) * operands.itemsize
+    header = [IMAGE_MAGIC, IMAGE_VERSION, COMPILER_VERSION, len(ops)]
+    for section in sections:
+        header += [offset, len(section)]
+        offset += len(section)
+    return b''.join([IMAGE_HEADER.pack(*header), ops.tobytes(), bytes(ops_size - len(ops)), operands.tobytes()]
+                    + sections)
+
+def write_image(path, bytecode, functions, local_names=()):
+    with open(path, 'wb') as f:
+        f.write(pack_program(bytecode, functions, local_names))
+
+def unpack(buffer, mapping=None):
+    #Builds an Image over `buffer` (bytes or a mapping); the code arrays are views, not copies
+    if len(buffer) < IMAGE_HEADER.size: raise ImageError('Truncated image')
+    magic, version, compiler_version, count, *sections = IMAGE_HEADER.unpack_from(buffer)
+    if magic != IMAGE_MAGIC: raise ImageError('Not a Nova image')
+    if version != IMAGE_VERSION or compiler_version != COMPILER_VERSION:
+        raise ImageError('Image was built by a different Nova version; rebuild it')
+    start = IMAGE_HEADER.size + -(-count // 8) * 8
+    if len(buffer) < max([start + count * 8] + [offset + size for offset, size in zip(sections[::2], sections[1::2])]):
+        raise ImageError('Truncated image')
+    # The tables are read from copies and checked before any view of the code is taken: a
+    # mapping with views into it cannot be closed, so a bad image must fail without one
+    try:
+        constants, names, (local_indices, table) = (
+            marshal.loads(buffer[offset:offset + size]) for offset, size in zip(sections[::2], sections[1::2]))
+        functions = {}
+        for name_index, start_pos, nargs, slot_indices in table:
+            slot_names = [names[i] for i in slot_indices]
+            functions[names[name_index]] = {'start_pos': start_pos, 'args': slot_names[:nargs], 'locals': slot_names}
+        local_names = [names[i] for i in local_indices]
+    except (EOFError, ValueError, TypeError, IndexError) as e:
+        raise ImageError(f'Corrupt image: {e}')
+    view = memoryview(buffer)
+    ops = view[IMAGE_HEADER.size:IMAGE_HEADER.size + count]
+    operands = view[start:start + count * 8].cast('q')
+    view.release()
+    return Image(PackedCode(ops, operands, constants, names), functions, local_names, mapping)
+
+def load_image(path):
+    #Maps an image file read-only; every process mapping the same file shares its code pages
+    with open(path, 'rb') as f:
+        # An empty file cannot be mapped
+        if not f.read(IMAGE_HEADER.size): raise ImageError('Truncated image')
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        return unpack(mapping, mapping)
+    except Exception:
+        mapping.close()
+        raise
+
+class PackedVM(VM):
+    #VM executing a PackedCode in place. The shared code is never rewritten, so binary
+    #operations stay generic (their NO_OPERAND operand is not None, which is what triggers
+    #quickening) and calls are linked per name-table entry instead of per instruction.
+    def __init__(self, code, functions, local_names=(), **options):
+        self.constants, self.names = code.constants, code.names
+        self.call_sites = []    # name-table index -> CallSite, None for entries that are no call
+        super().__init__(code, functions, local_names, **options)
+
+    def executable_code(self, bytecode): return bytecode.raw()
+
+    def call_target(self, arg): return self.names[arg][0]
+
+    def builtin_name(self, arg): return self.names[arg]
+
+    def execute(self):
+        if self.limits is not None: return self.execute_limited()
+        if self.profiler is not None: return self.profiler.run(self)
+        ops, operands, handlers = self.bytecode.ops, self.bytecode.operands, self.handlers
+        end = len(ops)
+        while self.ip < end:
+            ip = self.ip
+            self.ip = ip + 1
+            handlers[ops[ip]](operands[ip])
+
+    def run_chunk(self, budget):
+        ops, operands, handlers = self.bytecode.ops, self.bytecode.operands, self.handlers
+        end = len(ops)
+        left = budget
+        try:
+            while left and self.ip < end:
+                ip = self.ip
+                self.ip = ip + 1
+                handlers[ops[ip]](operands[ip])
+                left -= 1
+        finally:
+            self.chunk_ran = budget - left
+        return budget - left
+
+    def op_push(self, arg): self.stack.append(self.constants[arg])
+
+    def op_builtin(self, arg): self.stack[-1] = BUILTIN_FUNCTIONS[self.names[arg]](self.stack[-1])
+
+    def link(self):
+        #Call entries of the name table are (name, argument count) pairs
+        functions, memo = self.functions, self.memo
+        self.call_sites = [call_site(entry, functions, memo) if type(entry) is tuple else None
+                           for entry in self.names]
+
+    def call_site(self, index):
+        site = self.call_sites[index]
+        if site is None: raise NameError(f"Function '{self.call_target(index)}' is not defined.")
+        return site
+
+    def op_call(self, arg): self.op_call_linked(self.call_site(arg))
+    def op_tail_call(self, arg): self.op_tail_call_linked(self.call_site(arg))
+
+def make_vm(bytecode, functions, local_names=(), **options):
+    #PackedVM for a PackedCode, VM for compiled bytecode
+    vm_class = PackedVM if isinstance(bytecode, PackedCode) else VM
+    return vm_class(bytecode, functions, local_names, **options)
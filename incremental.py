@@ -0,0 +1,196 @@
+# incremental.py
+
+import re
+from bisect import bisect_left, bisect_right
+
+from lexer import Lexer
+from parser import Parser
+from compiler import Compiler
+from linker import check_calls
+from cache import DEFAULT_LOADER, file_stamps
+from opcodes import JUMP_OPCODES
+
+# Incremental compilation for hosts that recompile the same, slowly changing source (hot
+# reloading of rule files, REPL sessions).
+#
+# The source is split into top-level units: each top-level function definition and each run
+# of statements between them. Units are found without lexing, by scanning for braces,
+# strings, comments and the `fun` keyword, and only the part of the source that differs from
+# the previous compile is rescanned. Units are keyed by their text and compiled on their own at
+# offset 0, so an unchanged unit reuses its bytecode. Linking relocates jump targets and
+# function entries; it only redoes the changed units, plus everything after them when their
+# code changed length.
+#
+# Top-level variables are shared by all statement units, so the top-level slot map is kept
+# across compiles: a name keeps its slot for the compiler's lifetime, and names no longer in
+# the source just keep an unused slot. Function bodies have their own slots as usual.
+# Calls are checked (linker.check_calls) against the whole program's functions on every
+# compile, since editing one function can break calls in units that did not change.
+# The result is unoptimized bytecode; run Optimizer over it if needed.
+
+UNIT_PATTERN = re.compile(r'(?=[{}"/f])(?:"[^"]*"?|//[^\n]*|[{}]|\bfun\b)')
+# Strings are compared in blocks of this many characters when looking for the edited region
+COMPARE_BLOCK = 4096
+
+
+def scan_units(source, pos=0):
+    #Yields (start, end, is_function) for the top-level units from pos on, which must be 0 or
+    #the end of a top-level function; blank runs between functions are skipped
+    start, depth, function_start = pos, 0, None
+    for m in UNIT_PATTERN.finditer(source, pos):
+        token = m.group()
+        if token == '{':
+            depth += 1
+        elif token == '}':
+            depth -= 1
+            if depth == 0 and function_start is not None:
+                yield function_start, m.end(), True
+                start, function_start = m.end(), None
+        elif token == 'fun' and depth == 0 and function_start is None:
+            if source[start:m.start()].strip(): yield start, m.start(), False
+            function_start = m.start()
+    if source[start:].strip(): yield start, len(source), False
+
+def split_units(source):
+    return [source[start:end] for start, end, is_function in scan_units(source)]
+
+def common_length(a, b, limit, from_end=False):
+    #Length of the common prefix (or suffix) of a and b, at most limit
+    def same(i, j):
+        if from_end: return a[len(a) - j:len(a) - i] == b[len(b) - j:len(b) - i]
+        return a[i:j] == b[i:j]
+    n = 0
+    while n + COMPARE_BLOCK <= limit and same(n, n + COMPARE_BLOCK): n += COMPARE_BLOCK
+    low, high = n, min(n + COMPARE_BLOCK, limit)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if same(n, middle): low = middle
+        else: high = middle - 1
+    return low
+
+class Unit:
+    #One compiled top-level unit, code starting at index 0
+    __slots__ = ('text', 'bytecode', 'jumps', 'functions', 'calls', 'dependencies', 'stamps')
+
+    def __init__(self, text, bytecode, functions, calls, dependencies):
+        self.text = text
+        self.bytecode = bytecode
+        self.jumps = [i for i, (opcode, arg) in enumerate(bytecode) if opcode in JUMP_OPCODES]
+        self.functions = functions
+        self.calls = calls                 # see Compiler.calls, offsets relative to text
+        self.dependencies = dependencies   # imported modules, see cache.ModuleLoader
+        self.stamps = file_stamps(dependencies)
+
+class IncrementalCompiler:
+    #    compiler = IncrementalCompiler(path='rules.nova')
+    #    bytecode, functions, local_names = compiler.compile(source)
+    #    ... edit one function ...
+    #    bytecode, functions, local_names = compiler.compile(edited_source)  # one unit recompiled
+    def __init__(self, loader=None, path=None):
+        self.loader = loader if loader is not None else DEFAULT_LOADER
+        self.path = path
+        # Top-level scope shared by every unit and kept across compiles
+        self.local_names = []
+        self.slots = {}
+        # The last compile: its source, and per unit in order the end offset in the source,
+        # whether it is a function, the Unit, where its code starts and its relocated
+        # function entries
+        self.source = ''
+        self.ends = []
+        self.is_function = []
+        self.linked = []
+        self.offsets = []
+        self.entries = []
+        self.bytecode = []
+        self.units = {}       # unit text -> Unit
+        # Units compiled / reused by the last compile()
+        self.compiled = self.reused = 0
+
+    def rescan(self, source):
+        #Returns (keep, spans, resume): the first `keep` units of the last compile are unchanged,
+        #followed by the new units at `spans`, then the old units from index `resume` on
+        old, ends, is_function = self.source, self.ends, self.is_function
+        limit = min(len(old), len(source))
+        prefix = common_length(old, source, limit)
+        suffix = common_length(old, source, limit - prefix, from_end=True)
+        delta = len(source) - len(old)
+        # Restart after the last function that ends inside the unchanged prefix: the scan state
+        # is clean there, while a statement run's end depends on the text after it
+        keep = bisect_right(ends, prefix)
+        while keep and not is_function[keep - 1]: keep -= 1
+        spans, resume = [], len(ends)
+        for start, end, function in scan_units(source, ends[keep - 1] if keep else 0):
+            spans.append((start, end, function))
+            if function and end >= len(source) - suffix:
+                # The rest of the source is the old text after the same function end
+                old_index = bisect_left(ends, end - delta)
+                if old_index < len(ends) and ends[old_index] == end - delta and is_function[old_index]:
+                    resume = old_index + 1
+                    break
+        return keep, spans, resume
+
+    def compile(self, source):
+        #Returns (bytecode, functions, local_names), compiling only the units not seen before
+        keep, spans, resume = self.rescan(source)
+        middle, compiled = [], 0
+        for start, end, function in spans:
+            text = source[start:end]
+            unit = self.units.get(text)
+            if unit is None or unit.stamps != file_stamps(unit.dependencies):
+                unit = self.compile_unit(text)
+                compiled += 1
+            middle.append(unit)
+        units = self.linked[:keep] + middle + self.linked[resume:]
+        for i, unit in enumerate(units):
+            # Units that import modules are stale when a module changed
+            if unit.dependencies and unit.stamps != file_stamps(unit.dependencies):
+                units[i] = self.compile_unit(unit.text)
+                compiled += 1
+
+        delta = len(source) - len(self.source)
+        self.ends = self.ends[:keep] + [end for start, end, function in spans] + [end + delta for end in self.ends[resume:]]
+        self.is_function = (self.is_function[:keep] + [function for start, end, function in spans]
+                            + self.is_function[resume:])
+        self.source = source
+        self.units = {unit.text: unit for unit in units}
+        self.compiled, self.reused = compiled, len(units) - compiled
+        self.link(units)
+        functions = {}
+        for entries in self.entries: functions.update(entries)
+        for unit, end in zip(units, self.ends):
+            check_calls(unit.calls, functions, source, end - len(unit.text))
+        return list(self.bytecode), functions, list(self.local_names)
+
+    def compile_unit(self, text):
+        compiler = Compiler(self.loader, self.path)
+        compiler.local_names, compiler.slots = self.local_names, self.slots
+        compiler.compile(Parser(Lexer(text).iter_tokens(), keep_tokens=False).parse())
+        return Unit(text, compiler.bytecode, compiler.functions, compiler.calls, compiler.dependencies)
+
+    def link(self, units):
+        #Relinks the units that changed since the last link. Units after them keep their code
+        #when the changed code has the same length, and are relocated otherwise.
+        old = self.linked
+        limit = min(len(units), len(old))
+        keep = 0
+        while keep < limit and units[keep] is old[keep]: keep += 1
+        tail = 0
+        while tail < limit - keep and units[-1 - tail] is old[-1 - tail]: tail += 1
+        start = self.offsets[keep] if keep < len(old) else len(self.bytecode)
+        old_end = self.offsets[len(old) - tail] if tail else len(self.bytecode)
+        if sum(len(unit.bytecode) for unit in units[keep:len(units) - tail]) != old_end - start:
+            tail, old_end = 0, len(self.bytecode)
+        code, offsets, entries = [], [], []
+        for unit in units[keep:len(units) - tail]:
+            offset = start + len(code)
+            code.extend(unit.bytecode)
+            for i in unit.jumps:
+                opcode, arg = code[offset - start + i]
+                code[offset - start + i] = (opcode, arg + offset)
+            offsets.append(offset)
+            entries.append({name: dict(info, start_pos=info['start_pos'] + offset)
+                            for name, info in unit.functions.items()})
+        self.bytecode[start:old_end] = code
+        self.offsets[keep:len(old) - tail] = offsets
+        self.entries[keep:len(old) - tail] = entries
+        self.linked = units
@@ -1,4 +1,12 @@
-from tree import NumberNode, StringNode, BoolNode, VarAccessNode, VarAssignNode, BinOpNode, PrintNode, StatementsNode, IfNode
+import os
+import sys
+from time import perf_counter
+
+from output import BufferedSink
+from limits import CallDepthExceeded
+from cache import DEFAULT_LOADER
+from arrays import NovaArray, BUILTIN_FUNCTIONS, index_value
+from tree import NumberNode, StringNode, BoolNode, VarAccessNode, VarAssignNode, BinOpNode, PrintNode, StatementsNode, IfNode, WhileNode, FunctionDefNode, FunctionCallNode, ReturnNode, ArrayNode, IndexNode
 
 class SymbolTable:
     #table to store variable values
@@ -19,8 +27,10 @@ class SymbolTable:
 class Interpreter:
   #  The interpreter, responsible for executing the code from the AST.
     
-    def __init__(self):
+    def __init__(self, output=None):
         self.symbol_table = SymbolTable()
+        # visit() has no end-of-program hook, so the default sink writes every line
+        self.output = output if output is not None else BufferedSink(buffer_size=0)
 
     def visit(self, node):
         #The main visit method, which dispatches to other visit methods
@@ -75,9 +85,15 @@ class Interpreter:
             
         raise Exception(f"Unknown operator: {node.op}")
 
+    def visit_ArrayNode(self, node):
+        return NovaArray.from_values([self.visit(element) for element in node.element_nodes])
+
+    def visit_IndexNode(self, node):
+        return index_value(self.visit(node.target_node), self.visit(node.index_node))
+
     def visit_PrintNode(self, node):
         value = self.visit(node.value_node)
-        print(value) # This is where the actual output happens
+        self.output.write(value) # This is where the actual output happens
         return value
 
     def visit_StatementsNode(self, node):
@@ -92,3 +108,292 @@ class Interpreter:
             return self.visit(node.if_body_node)
         elif node.else_body_node:
             return self.visit(node.else_body_node)
+
+
+# Closure compilation: the tree is walked once and every node becomes a Python closure with
+# its operator, constants and variable slots baked in, so running the program never looks
+# at a node again. Semantics follow the bytecode VM: each function call gets its own slot
+# list, functions are registered by name at compile time and `return` at the top level
+# ends the program. `return f(...)` hands a TailCall back to the caller's trampoline, so
+# tail recursion runs in constant Python stack; other recursion uses the Python stack.
+
+# Returned by statement closures that complete without executing a `return`
+NO_RETURN = object()
+
+# Binary operator -> factory of the closure evaluating it, for a variable right operand
+# and for a constant right operand
+BINARY_CLOSURES = {
+    '+': lambda l, r: lambda env: l(env) + r(env),
+    '-': lambda l, r: lambda env: l(env) - r(env),
+    '*': lambda l, r: lambda env: l(env) * r(env),
+    '/': lambda l, r: lambda env: l(env) / r(env),
+    '==': lambda l, r: lambda env: l(env) == r(env),
+    '!=': lambda l, r: lambda env: l(env) != r(env),
+    '<': lambda l, r: lambda env: l(env) < r(env),
+    '>': lambda l, r: lambda env: l(env) > r(env),
+}
+BINARY_CONSTANT_CLOSURES = {
+    '+': lambda l, c: lambda env: l(env) + c,
+    '-': lambda l, c: lambda env: l(env) - c,
+    '*': lambda l, c: lambda env: l(env) * c,
+    '/': lambda l, c: lambda env: l(env) / c,
+    '==': lambda l, c: lambda env: l(env) == c,
+    '!=': lambda l, c: lambda env: l(env) != c,
+    '<': lambda l, c: lambda env: l(env) < c,
+    '>': lambda l, c: lambda env: l(env) > c,
+}
+
+# Nova calls that are not tail calls nest as Python calls here, so the Python recursion limit
+# (1000 by default) would stop recursion ~150 calls deep. The engine counts nested calls
+# instead: past MAX_CALL_DEPTH it raises CallDepthExceeded, and as recursion gets deeper it
+# raises the recursion limit, in steps of DEPTH_STEP calls, to what that depth needs. Python
+# 3.11+ runs these calls without growing the C stack. The limit is restored when the run ends.
+MAX_CALL_DEPTH = 200000
+DEPTH_STEP = 1000
+# Python frames allowed per nested call: `return 1 + f(n - 1)` takes about six, calls nested
+# deeper in expressions and blocks take more
+FRAMES_PER_CALL = 16
+
+def stack_depth():
+    frame, depth = sys._getframe(1), 0
+    while frame is not None:
+        frame, depth = frame.f_back, depth + 1
+    return depth
+
+class CallDepth:
+    #Nested Nova calls of a running program, and how deep the recursion limit lets them go
+    __slots__ = ('depth', 'allowed', 'frames', 'previous_limit', 'started')
+
+    def start(self):
+        self.depth = 0
+        self.frames = stack_depth()
+        self.previous_limit = sys.getrecursionlimit()
+        self.allowed = max(0, self.previous_limit - self.frames) // FRAMES_PER_CALL
+        self.started = perf_counter()
+
+    def finish(self):
+        if sys.getrecursionlimit() != self.previous_limit: sys.setrecursionlimit(self.previous_limit)
+
+    def usage(self):
+        #Same counters as VM.usage(); the closure engine counts neither instructions nor memory
+        return {'instructions': 0, 'call_depth': self.depth, 'stack': 0, 'memory': 0,
+                'seconds': perf_counter() - self.started}
+
+    def grow(self):
+        #Called when depth passes allowed
+        if self.depth > MAX_CALL_DEPTH: raise CallDepthExceeded(MAX_CALL_DEPTH, self.usage())
+        self.allowed = min(self.depth + DEPTH_STEP, MAX_CALL_DEPTH)
+        needed = self.frames + self.allowed * FRAMES_PER_CALL
+        if sys.getrecursionlimit() < needed: sys.setrecursionlimit(needed)
+
+class NovaFunction:
+    #A compiled function; body is filled in when its definition is compiled
+    __slots__ = ('name', 'nargs', 'nlocals', 'body')
+
+    def __init__(self, name):
+        self.name = name
+        self.nargs = self.nlocals = 0
+        self.body = None
+
+class TailCall:
+    #A call whose frame is ready but whose body has not run yet
+    __slots__ = ('function', 'frame')
+
+    def __init__(self, function, frame):
+        self.function = function
+        self.frame = frame
+
+class ClosureCompiler:
+    #Turns an AST into a callable program made of specialized closures
+    def __init__(self, output=None, loader=None, path=None):
+        self.functions = {}
+        # Imports, as in the RegisterCompiler: modules are found and checked by the module
+        # loader (cache.ModuleLoader) and compiled in once, relative to path
+        self.loader = loader if loader is not None else DEFAULT_LOADER
+        self.path = path
+        self.imported = set()
+        # PRINT destination, flushed when the program returns or fails
+        self.output = output if output is not None else BufferedSink()
+        # Slot table of the scope being compiled, as in the bytecode Compiler
+        self.local_names = []
+        self.slots = {}
+        self.calls = CallDepth()
+
+    def compile_program(self, node):
+        #Returns a zero-argument callable that runs the program
+        body = self.statement(node)
+        nlocals, output, calls = len(self.local_names), self.output, self.calls
+        def program():
+            calls.start()
+            try:
+                result = body([None] * nlocals)
+                while type(result) is TailCall:
+                    result = result.function.body(result.frame)
+            except RecursionError:
+                # Calls nested in expressions deeper than FRAMES_PER_CALL allows
+                raise CallDepthExceeded(calls.depth, calls.usage()) from None
+            finally:
+                calls.finish()
+                output.flush()
+        return program
+
+    def slot(self, name):
+        slot = self.slots.get(name)
+        if slot is None:
+            slot = self.slots[name] = len(self.local_names)
+            self.local_names.append(name)
+        return slot
+
+    def function(self, name):
+        function = self.functions.get(name)
+        if function is None: function = self.functions[name] = NovaFunction(name)
+        return function
+
+    def dispatch(self, kind, node):
+        method = getattr(self, f'{kind}_{type(node).__name__}', None)
+        if method is None: raise Exception(f'No {kind} closure for {type(node).__name__}')
+        return method(node)
+
+    def expression(self, node): return self.dispatch('expr', node)
+
+    def statement(self, node):
+        method = getattr(self, f'stmt_{type(node).__name__}', None)
+        if method is not None: return method(node)
+        # Expression statement: evaluated for its effects, value discarded
+        expr = self.expression(node)
+        def run(env):
+            expr(env)
+            return NO_RETURN
+        return run
+
+    def expr_NumberNode(self, node):
+        value = node.value
+        return lambda env: value
+
+    expr_StringNode = expr_BoolNode = expr_NumberNode
+
+    def expr_VarAccessNode(self, node):
+        slot, name = self.slot(node.name), node.name
+        def load(env):
+            value = env[slot]
+            if value is None: raise NameError(f"Variable '{name}' is not defined.")
+            return value
+        return load
+
+    def expr_BinOpNode(self, node):
+        if node.op not in BINARY_CLOSURES: raise Exception(f"Unknown operator {node.op}")
+        left = self.expression(node.left_node)
+        if isinstance(node.right_node, (NumberNode, StringNode, BoolNode)):
+            return BINARY_CONSTANT_CLOSURES[node.op](left, node.right_node.value)
+        return BINARY_CLOSURES[node.op](left, self.expression(node.right_node))
+
+    def prepare_call(self, node):
+        #Returns a closure that evaluates the arguments into a new frame, as a TailCall
+        function, name = self.function(node.name), node.name
+        args = [self.expression(arg) for arg in node.arg_nodes]
+        nargs = len(args)
+        def prepare(env):
+            if function.body is None: raise NameError(f"Function '{name}' is not defined.")
+            if nargs != function.nargs:
+                raise Exception(f"Function '{name}' takes {function.nargs} arguments, got {nargs}")
+            frame = [arg(env) for arg in args]
+            frame.extend([None] * (function.nlocals - nargs))
+            return TailCall(function, frame)
+        return prepare
+
+    def expr_ArrayNode(self, node):
+        elements, build = tuple(self.expression(element) for element in node.element_nodes), NovaArray.from_values
+        return lambda env: build([element(env) for element in elements])
+
+    def expr_IndexNode(self, node):
+        target, index = self.expression(node.target_node), self.expression(node.index_node)
+        return lambda env: index_value(target(env), index(env))
+
+    def expr_FunctionCallNode(self, node):
+        if node.name in BUILTIN_FUNCTIONS:
+            if len(node.arg_nodes) != 1: raise Exception(f"{node.name}() takes 1 argument, got {len(node.arg_nodes)}")
+            builtin, arg = BUILTIN_FUNCTIONS[node.name], self.expression(node.arg_nodes[0])
+            return lambda env: builtin(arg(env))
+        prepare, calls = self.prepare_call(node), self.calls
+        def call(env):
+            result = prepare(env)
+            # Not decremented when the call raises: the program stops, and program() reports
+            # the depth it failed at
+            calls.depth += 1
+            if calls.depth > calls.allowed: calls.grow()
+            while type(result) is TailCall:
+                result = result.function.body(result.frame)
+            calls.depth -= 1
+            return None if result is NO_RETURN else result
+        return call
+
+    def stmt_VarAssignNode(self, node):
+        slot, value = self.slot(node.name), self.expression(node.value_node)
+        def store(env):
+            env[slot] = value(env)
+            return NO_RETURN
+        return store
+
+    def stmt_PrintNode(self, node):
+        value, write = self.expression(node.value_node), self.output.write
+        def run(env):
+            write(value(env))
+            return NO_RETURN
+        return run
+
+    def stmt_StatementsNode(self, node):
+        statements = tuple(self.statement(stmt) for stmt in node.statements)
+        if len(statements) == 1: return statements[0]
+        def block(env):
+            for statement in statements:
+                result = statement(env)
+                if result is not NO_RETURN: return result
+            return NO_RETURN
+        return block
+
+    def stmt_IfNode(self, node):
+        condition, if_body = self.expression(node.condition_node), self.statement(node.if_body_node)
+        else_body = self.statement(node.else_body_node) if node.else_body_node else None
+        def run(env):
+            if condition(env): return if_body(env)
+            if else_body is not None: return else_body(env)
+            return NO_RETURN
+        return run
+
+    def stmt_WhileNode(self, node):
+        condition, body = self.expression(node.condition_node), self.statement(node.body_node)
+        def run(env):
+            while condition(env):
+                result = body(env)
+                if result is not NO_RETURN: return result
+            return NO_RETURN
+        return run
+
+    def stmt_FunctionDefNode(self, node):
+        if node.name in BUILTIN_FUNCTIONS: raise Exception(f"'{node.name}' is a built-in function")
+        function = self.function(node.name)
+        outer_scope = self.local_names, self.slots
+        self.local_names, self.slots = list(node.arg_names), {name: i for i, name in enumerate(node.arg_names)}
+        function.body = self.statement(node.body_node)
+        function.nargs, function.nlocals = len(node.arg_names), len(self.local_names)
+        self.local_names, self.slots = outer_scope
+        # Definitions take effect at compile time, so running one does nothing
+        return lambda env: NO_RETURN
+
+    def stmt_ImportNode(self, node):
+        #Compiles the module's functions in, once; like every definition, importing takes
+        #effect at compile time
+        path, tree = self.loader.parse_module(node.name, os.path.dirname(self.path) if self.path else None)
+        if path not in self.imported:
+            self.imported.add(path)
+            outer, self.path = self.path, path
+            self.statement(tree)
+            self.path = outer
+        return lambda env: NO_RETURN
+
+    def stmt_ReturnNode(self, node):
+        if isinstance(node.value_node, FunctionCallNode) and node.value_node.name not in BUILTIN_FUNCTIONS:
+            # Tail call: the caller's trampoline runs the callee after this frame is gone
+            return self.prepare_call(node.value_node)
+        value = self.expression(node.value_node)
+        return lambda env: value(env)
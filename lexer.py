@@ -1,10 +1,16 @@
 # lexer.py
 
+import re
+import sys
+
 class Token:
-    #A simple class to represent a token
-    def __init__(self, type, value):
+    #A simple class to represent a token; pos is its offset in the source text
+    __slots__ = ('type', 'value', 'pos')
+
+    def __init__(self, type, value, pos=None):
         self.type = type
         self.value = value
+        self.pos = pos
 
     def __repr__(self):
         """String representation of the class instance."""
@@ -21,91 +27,67 @@ TT_RBRACE     = 'RBRACE'    # }
 TT_LPAREN     = 'LPAREN'    # (
 TT_RPAREN     = 'RPAREN'    # )
 TT_COMMA      = 'COMMA'     # ,
+TT_LBRACKET   = 'LBRACKET'  # [
+TT_RBRACKET   = 'RBRACKET'  # ]
 TT_EOF        = 'EOF'       # End of File
 
 # Keywords in the Nova language
-KEYWORDS = [
+KEYWORDS = {
     'let', 'if', 'else', 'print', 'true', 'false', 'while',
-    'fun', 'return'
-]
+    'fun', 'return', 'import'
+}
+
+# One master pattern for the whole token set; alternatives are tried in order,
+# so comments win over the '/' operator and '==' over '='.
+TOKEN_PATTERN = re.compile(r"""
+    (?P<SKIP>\s+|//[^\n]*)
+  | (?P<INT>\d+)
+  | (?P<NAME>[^\W\d_][^\W_]*)
+  | (?P<STRING>"[^"]*"?)
+  | (?P<OPERATOR>==|!=|[=+\-*/<>])
+  | (?P<PUNCT>[{}(),\[\]])
+""", re.VERBOSE)
+
+PUNCTUATION = {'{': TT_LBRACE, '}': TT_RBRACE, '(': TT_LPAREN, ')': TT_RPAREN, ',': TT_COMMA,
+               '[': TT_LBRACKET, ']': TT_RBRACKET}
 
 class Lexer:
-    #The lexer, responsible for breaking code into tokens
+    #The lexer, responsible for breaking code into tokens.
+    #Scans with TOKEN_PATTERN and slices matches out of the source, so no
+    #per-character work happens in Python.
     def __init__(self, text):
         self.text = text
         self.pos = 0
-        self.current_char = self.text[self.pos] if self.pos < len(self.text) else None
-
-    def advance(self):
-        self.pos += 1
-        self.current_char = self.text[self.pos] if self.pos < len(self.text) else None
-
-    def skip_whitespace(self):
-        while self.current_char is not None and self.current_char.isspace():
-            self.advance()
-
-    def skip_comment(self):
-        while self.current_char is not None and self.current_char != '\n':
-            self.advance()
-
-    def number(self):
-        result = ''
-        while self.current_char is not None and self.current_char.isdigit():
-            result += self.current_char
-            self.advance()
-        return Token(TT_INT, int(result))
-
-    def string(self):
-        result = ''
-        self.advance()
-        while self.current_char is not None and self.current_char != '"':
-            result += self.current_char
-            self.advance()
-        self.advance()
-        return Token(TT_STRING, result)
-
-    def identifier(self):
-        result = ''
-        while self.current_char is not None and self.current_char.isalnum():
-            result += self.current_char
-            self.advance()
-        
-        return Token(TT_KEYWORD, result) if result in KEYWORDS else Token(TT_IDENTIFIER, result)
+        self.stream = None
+
+    def iter_tokens(self):
+        #Lazily yields tokens, ending with a single EOF token
+        text, match = self.text, TOKEN_PATTERN.match
+        end = len(text)
+        while self.pos < end:
+            m = match(text, self.pos)
+            if m is None: raise Exception(f"Invalid character: '{text[self.pos]}'")
+            self.pos = m.end()
+            kind = m.lastgroup
+            if kind == 'SKIP': continue
+            value, start = m.group(), m.start()
+            if kind == 'NAME':
+                # Interned so every occurrence of a name shares one string object
+                yield Token(TT_KEYWORD if value in KEYWORDS else TT_IDENTIFIER, sys.intern(value), start)
+            elif kind == 'INT':
+                yield Token(TT_INT, int(value), start)
+            elif kind == 'STRING':
+                # An unterminated string runs to the end of the source
+                yield Token(TT_STRING, value[1:-1] if len(value) > 1 and value[-1] == '"' else value[1:], start)
+            elif kind == 'OPERATOR':
+                yield Token(TT_OPERATOR, sys.intern(value), start)
+            else:
+                yield Token(PUNCTUATION[value], value, start)
+        yield Token(TT_EOF, None, end)
 
     def get_next_token(self):
-        while self.current_char is not None:
-            if self.current_char.isspace(): self.skip_whitespace(); continue
-            if self.current_char == '/' and self.peek() == '/': self.skip_comment(); continue
-            if self.current_char.isdigit(): return self.number()
-            if self.current_char.isalpha(): return self.identifier()
-            if self.current_char == '"': return self.string()
-
-            if self.current_char == '=' and self.peek() == '=': self.advance(); self.advance(); return Token(TT_OPERATOR, '==')
-            if self.current_char == '!' and self.peek() == '=': self.advance(); self.advance(); return Token(TT_OPERATOR, '!=')
-
-            if self.current_char in ['=', '+', '-', '*', '/', '<', '>']:
-                op = self.current_char; self.advance(); return Token(TT_OPERATOR, op)
-            
-            
-            if self.current_char == '{': self.advance(); return Token(TT_LBRACE, '{')
-            if self.current_char == '}': self.advance(); return Token(TT_RBRACE, '}')
-            if self.current_char == '(': self.advance(); return Token(TT_LPAREN, '(')
-            if self.current_char == ')': self.advance(); return Token(TT_RPAREN, ')')
-            if self.current_char == ',': self.advance(); return Token(TT_COMMA, ',')
-            
-            raise Exception(f"Invalid character: '{self.current_char}'")
-
-        return Token(TT_EOF, None)
-
-    def peek(self):
-        peek_pos = self.pos + 1
-        return self.text[peek_pos] if peek_pos < len(self.text) else None
+        if self.stream is None: self.stream = self.iter_tokens()
+        return next(self.stream, Token(TT_EOF, None))
 
     def tokenize(self):
-        tokens = []
-        token = self.get_next_token()
-        while token.type != TT_EOF:
-            tokens.append(token)
-            token = self.get_next_token()
-        tokens.append(token)
-        return tokens
+        return list(self.iter_tokens())
@@ -0,0 +1,73 @@
+# limits.py
+
+import sys
+from itertools import chain
+
+# Resource limits for one execution of a VM (VM(..., limits=Limits(...))). A governed VM runs
+# in chunks of at most CHECK_INTERVAL instructions and checks the instruction count, wall-clock
+# time, operand stack size and (less often) memory between chunks, and once more when the code
+# has run to its end. Instructions that can build a large string or array in one step (string
+# and array arithmetic, array literals, built-ins such as range) also check their result against
+# the memory limit, and the clock, right away. The instruction limit is exact and call depth is
+# checked exactly, on every CALL. An exceeded limit raises the
+# matching ResourceLimitExceeded subclass, which reports the usage counters at that point.
+# A limited VM cannot also be profiled.
+
+# Instructions executed between two limit checks
+CHECK_INTERVAL = 1000
+# Memory is estimated by scanning every live value, so it is checked at most once per this
+# many instructions per value scanned last time, which keeps the scans' cost a small,
+# constant fraction of the run time however much data the program holds
+MEMORY_CHECK_RATIO = 16
+# Bytes charged per operand stack entry or local slot, on top of the value it holds
+SLOT_BYTES = 8
+
+
+class Limits:
+    #Per-execution limits; None means unlimited. stack, the memory total and seconds are checked
+    #between chunks, so a program can exceed them by what CHECK_INTERVAL cheap instructions do,
+    #e.g. push up to CHECK_INTERVAL more stack entries, before it is stopped.
+    __slots__ = ('instructions', 'call_depth', 'stack', 'memory', 'seconds')
+
+    def __init__(self, instructions=None, call_depth=None, stack=None, memory=None, seconds=None):
+        self.instructions = instructions   # instructions executed
+        self.call_depth = call_depth       # nested Nova function frames
+        self.stack = stack                 # operand stack entries
+        self.memory = memory               # approximate bytes held by stack and frames
+        self.seconds = seconds             # wall-clock time
+
+    def __repr__(self):
+        set_limits = ', '.join(f'{name}={getattr(self, name)}' for name in self.__slots__ if getattr(self, name) is not None)
+        return f'Limits({set_limits})'
+
+class ResourceLimitExceeded(Exception):
+    #Base of the limit errors; usage holds the counters when the limit was hit
+    #(instructions, call_depth, stack, memory, seconds). An error raised inside a chunk gets
+    #its usage filled in by the VM once the chunk's instruction count is known.
+    limit_name = None
+    # Limits checked only between chunks say so in their message
+    checked_between_chunks = False
+
+    def __init__(self, limit, usage=None):
+        super().__init__(limit, usage)
+        self.limit = limit
+        self.usage = usage
+
+    def __str__(self):
+        counters = ', '.join(f'{name}={value:.3f}' if type(value) is float else f'{name}={value}'
+                             for name, value in (self.usage or {}).items())
+        checked = f', checked between {CHECK_INTERVAL}-instruction chunks' if self.checked_between_chunks else ''
+        return f"{self.limit_name} limit of {self.limit} exceeded{checked} ({counters})"
+
+class InstructionLimitExceeded(ResourceLimitExceeded): limit_name = 'Instruction'
+class CallDepthExceeded(ResourceLimitExceeded): limit_name = 'Call depth'
+class StackLimitExceeded(ResourceLimitExceeded): limit_name, checked_between_chunks = 'Stack', True
+class MemoryLimitExceeded(ResourceLimitExceeded): limit_name = 'Memory'
+class TimeLimitExceeded(ResourceLimitExceeded): limit_name = 'Time'
+
+def approximate_memory(stack, call_stack):
+    #Returns (bytes, values scanned): SLOT_BYTES per stack entry and local slot, plus the size
+    #of every distinct value they hold (strings, ropes and arrays include their contents)
+    values = {id(value): value for value in chain(stack, *(frame.locals for frame in call_stack))}
+    slots = len(stack) + sum(len(frame.locals) for frame in call_stack)
+    return slots * SLOT_BYTES + sum(map(sys.getsizeof, values.values())), slots
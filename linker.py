@@ -0,0 +1,114 @@
+# linker.py
+
+from operator import itemgetter
+
+from opcodes import OP_CALL, OP_TAIL_CALL, OP_CALL_LINKED, OP_TAIL_CALL_LINKED, R_CALL, R_TAIL_CALL, R_CALL_LINKED, R_TAIL_CALL_LINKED
+
+# Static call linking, in two steps.
+#
+# Compile time: the compilers record every call to a Nova function they emit as (name,
+# argument count, source offset). Once a whole program or module is compiled, and its imports
+# linked in, check_calls() matches those calls against the function table: a call to an
+# undefined function or with the wrong number of arguments fails the compile, instead of
+# raising only if the call runs or, for a wrong count, silently misaligning the operand stack.
+#
+# Load time: compiled bytecode keeps calls by name, as CALL / TAIL_CALL (name, argument count),
+# since .novac files, images, modules and the analyses (purity, the native tier) are position
+# independent and name based. A VM links its private copy of the code when it is built:
+# link_calls() rewrites every CALL / TAIL_CALL into CALL_LINKED / TAIL_CALL_LINKED whose operand
+# is a CallSite (callee entry address, argument count, frame padding), so a call does no lookup
+# and no check at all. link_register_calls() does the same for register code. Calls to
+# undefined functions stay unlinked and raise when they run. After changing a VM's function
+# table, the host relinks with VM.invalidate_call_caches(); a call whose argument count no
+# longer matches its callee raises LinkError then, and nothing is relinked.
+
+CALL_OPCODES = frozenset((OP_CALL, OP_TAIL_CALL, OP_CALL_LINKED, OP_TAIL_CALL_LINKED))
+LINKED_OPCODES = {OP_CALL: OP_CALL_LINKED, OP_TAIL_CALL: OP_TAIL_CALL_LINKED,
+                  OP_CALL_LINKED: OP_CALL_LINKED, OP_TAIL_CALL_LINKED: OP_TAIL_CALL_LINKED}
+UNLINKED_OPCODES = {OP_CALL: OP_CALL, OP_TAIL_CALL: OP_TAIL_CALL,
+                    OP_CALL_LINKED: OP_CALL, OP_TAIL_CALL_LINKED: OP_TAIL_CALL}
+REGISTER_LINKED_OPCODES = {R_CALL: R_CALL_LINKED, R_TAIL_CALL: R_TAIL_CALL_LINKED}
+
+
+class LinkError(Exception):
+    pass
+
+class CallSite:
+    #Operand of a linked call: the argument count the call passes, which is checked against
+    #the callee, the callee's entry address and frame layout, plus its name and memo cache for
+    #the memo / native shortcuts and the profiler
+    __slots__ = ('name', 'func_info', 'nargs', 'padding', 'start_pos', 'names', 'memo')
+
+    def __init__(self, name, nargs, func_info, memo):
+        if len(func_info['args']) != nargs:
+            raise LinkError(f"Function '{name}' takes {len(func_info['args'])} arguments, got {nargs}")
+        self.name = name
+        self.func_info = func_info
+        self.nargs = nargs
+        self.padding = [None] * (len(func_info['locals']) - self.nargs)
+        self.start_pos = func_info['start_pos']
+        self.names = func_info['locals']
+        self.memo = memo
+
+    def __repr__(self): return self.name
+
+def call_operand(arg):
+    #(name, argument count) of a CALL / TAIL_CALL operand, linked or not
+    return (arg.name, arg.nargs) if type(arg) is CallSite else arg
+
+def line_of(source, pos):
+    return source.count('\n', 0, pos) + 1
+
+def check_calls(calls, functions, source=None, offset=0):
+    #Raises LinkError for the first call that does not match `functions`. Call offsets are
+    #relative to `offset` in `source`; with the source, errors name the line.
+    for name, nargs, pos in calls:
+        info = functions.get(name)
+        if info is not None and len(info['args']) == nargs: continue
+        where = f" (line {line_of(source, pos + offset)})" if source is not None and pos is not None else ''
+        if info is None: raise LinkError(f"Function '{name}' is not defined{where}")
+        raise LinkError(f"Function '{name}' takes {len(info['args'])} arguments, got {nargs}{where}")
+
+def call_site(operand, functions, memo):
+    #CallSite for an unlinked (name, argument count) operand, None if the function is undefined
+    name, nargs = operand
+    info = functions.get(name)
+    return CallSite(name, nargs, info, memo.get(name)) if info is not None else None
+
+def call_indices(code):
+    #Indices of the call instructions, found by searching a byte string of the opcodes, which
+    #keeps linking a large program cheap next to building the VM
+    ops = bytes(map(itemgetter(0), code))
+    indices = []
+    for opcode in CALL_OPCODES:
+        i = ops.find(opcode)
+        while i >= 0:
+            indices.append(i)
+            i = ops.find(opcode, i + 1)
+    return indices
+
+def link_calls(code, functions, memo):
+    #Links (or relinks) every call in `code` in place; calls to undefined functions are left,
+    #or put back, in their unlinked form. Raises LinkError, leaving `code` unchanged, if a call
+    #does not pass its callee's argument count.
+    sites, linked = {}, []
+    for i in call_indices(code):
+        opcode, arg = code[i]
+        operand = call_operand(arg)
+        if operand not in sites: sites[operand] = call_site(operand, functions, memo)
+        site = sites[operand]
+        linked.append((i, (UNLINKED_OPCODES[opcode], operand) if site is None else (LINKED_OPCODES[opcode], site)))
+    for i, instruction in linked: code[i] = instruction
+
+def link_register_calls(code, functions):
+    #Returns a copy of register code with every call to a defined function linked: operand b
+    #becomes (entry address, register template). Arity is checked here, once per call site.
+    linked = list(code)
+    for i, (opcode, a, b, c) in enumerate(code):
+        if opcode not in REGISTER_LINKED_OPCODES: continue
+        info = functions.get(b)
+        if info is None: continue
+        if len(c) != len(info['args']):
+            raise LinkError(f"Function '{b}' takes {len(info['args'])} arguments, got {len(c)}")
+        linked[i] = (REGISTER_LINKED_OPCODES[opcode], a, (info['start_pos'], info['template']), c)
+    return linked
@@ -1,52 +1,234 @@
+import argparse
+import json
+import os
+import time
+
 from lexer import Lexer
 from parser import Parser
-from compiler import Compiler
-from vm import VM
+from interpreter import ClosureCompiler
+from cache import load_program
+from vm import DEFAULT_MEMO_SIZE, DEFAULT_TIER_THRESHOLD
+from profiler import Profiler
+from opcodes import disassemble, disassemble_registers
+from regcompiler import compile_source as compile_registers
+from regvm import RegisterVM
+from batch import collect_paths, run_batch, summarize
+from output import BufferedSink, DEFAULT_BUFFER_SIZE
+from image import IMAGE_SUFFIX, ImageError, load_image, write_image, make_vm
+from incremental import IncrementalCompiler
+from limits import Limits
 
 # Define the path to the source file
 NOVA_FILE_PATH = 'examples/test.nova'
+# Seconds between checks of a --watch'ed file
+WATCH_INTERVAL = 0.25
+
+def parse_args():
+    arg_parser = argparse.ArgumentParser(description='Compile and run a Nova program.')
+    arg_parser.add_argument('paths', nargs='*', default=[NOVA_FILE_PATH],
+                            help='Nova source file; several files or a directory run as a parallel batch')
+    arg_parser.add_argument('--engine', choices=('vm', 'register', 'closure'), default='vm',
+                            help='stack bytecode VM, register VM, or the closure-compiled tree walker for short scripts')
+    arg_parser.add_argument('-O', dest='opt_level', type=int, choices=(0, 1, 2), default=0,
+                            help='bytecode optimization level (0 = off)')
+    arg_parser.add_argument('--memo-size', type=int, default=DEFAULT_MEMO_SIZE,
+                            help='cached results per pure function (0 disables memoization)')
+    arg_parser.add_argument('--tier-threshold', type=int, default=DEFAULT_TIER_THRESHOLD,
+                            help='calls before a function is compiled to native Python code (0 disables)')
+    arg_parser.add_argument('--watch', action='store_true',
+                            help='re-run the program whenever the file changes, recompiling only the edited parts')
+    arg_parser.add_argument('--write-image', metavar='IMAGE_FILE',
+                            help=f'also write the compiled program as a packed {IMAGE_SUFFIX} image')
+    arg_parser.add_argument('--profile', metavar='JSON_FILE',
+                            help='profile the VM run and write opcode/function/ip statistics as JSON')
+    arg_parser.add_argument('--flamegraph', metavar='TEXT_FILE',
+                            help='profile the VM run and write collapsed stacks for flamegraph tools')
+    arg_parser.add_argument('--max-instructions', type=int, default=None, metavar='N',
+                            help='stop the VM after executing N instructions')
+    arg_parser.add_argument('--max-call-depth', type=int, default=None, metavar='N',
+                            help='stop the VM when Nova calls nest deeper than N')
+    arg_parser.add_argument('--max-stack', type=int, default=None, metavar='N',
+                            help='stop the VM when its operand stack exceeds N entries')
+    arg_parser.add_argument('--max-memory', type=int, default=None, metavar='BYTES',
+                            help='stop the VM when its values take more than about BYTES bytes')
+    arg_parser.add_argument('--max-seconds', type=float, default=None, metavar='SECONDS',
+                            help='stop the VM after SECONDS of wall-clock time')
+    arg_parser.add_argument('--output-buffer', type=int, default=DEFAULT_BUFFER_SIZE, metavar='CHARS',
+                            help='characters of program output buffered between writes (0 = write every line)')
+    arg_parser.add_argument('-j', '--jobs', type=int, default=None,
+                            help='worker processes for batch runs (default: one per core)')
+    arg_parser.add_argument('--timeout', type=float, default=None,
+                            help='per-script time limit in seconds for batch runs')
+    arg_parser.add_argument('--show-output', action='store_true', help='print each batch script\'s output')
+    arg_parser.add_argument('--results', metavar='JSON_FILE',
+                            help='write per-script batch results (output, error, timings) as JSON')
+    args = arg_parser.parse_args()
+    # A limited VM runs in checked chunks, which the profiler's dispatch loop does not
+    if (args.profile or args.flamegraph) and limits_from_args(args) is not None:
+        arg_parser.error('--profile/--flamegraph cannot be combined with --max-* limits')
+    return args
+
+def limits_from_args(args):
+    # None when no --max-* option is given, so unlimited runs keep the native tier
+    values = (args.max_instructions, args.max_call_depth, args.max_stack, args.max_memory, args.max_seconds)
+    if all(value is None for value in values): return None
+    return Limits(*values)
+
+def run_closure(source_code, output, path):
+    # Lexer -> Parser -> ClosureCompiler, no bytecode at all
+    try:
+        program = ClosureCompiler(output, path=path).compile_program(Parser(Lexer(source_code).iter_tokens(), keep_tokens=False).parse())
+    except Exception as e:
+        print(f"Compile Error: {e}")
+        return
+    print("\n--- Program Output ---")
+    try:
+        program()
+    except Exception as e:
+        print(f"Runtime Error: {e}")
+
+def run_register(source_code, output, path):
+    # Lexer -> Parser -> RegisterCompiler -> RegisterVM (not cached, no memo or native tier)
+    try:
+        code, functions, main_frame = compile_registers(source_code, path)
+    except Exception as e:
+        print(f"Compile Error: {e}")
+        return
+    print("\n--- Generated Register Code ---")
+    for line in disassemble_registers(code):
+        print(line)
+    print("\n--- Program Output ---")
+    try:
+        RegisterVM(code, functions, main_frame, output).run()
+    except Exception as e:
+        print(f"Runtime Error: {e}")
+
+def run_many(args, paths):
+    # Every script runs in a worker process with its own VM; output is captured per script
+    start = time.perf_counter()
+    results = []
+    for result in run_batch(paths, jobs=args.jobs, engine=args.engine, opt_level=args.opt_level,
+                            memo_size=args.memo_size, tier_threshold=args.tier_threshold, timeout=args.timeout,
+                            limits=limits_from_args(args)):
+        results.append(result)
+        status = 'ok  ' if result['ok'] else 'FAIL'
+        print(f"{status} {result['path']} ({(result['compile_s'] + result['run_s']) * 1000:.1f} ms)")
+        if result['error']: print(f"     {result['error']}")
+        if args.show_output and result['output']:
+            print(''.join(f"     | {line}\n" for line in result['output'].splitlines()), end='')
+    summary = summarize(results, time.perf_counter() - start)
+    print(f"\n{summary['passed']}/{summary['files']} passed, {summary['failed']} failed in {summary['wall_s']:.2f}s "
+          f"(compile {summary['compile_s']:.2f}s, run {summary['run_s']:.2f}s across workers)")
+    if args.results:
+        results.sort(key=lambda result: result['path'])
+        with open(args.results, 'w', encoding='utf-8') as f:
+            json.dump({'summary': summary, 'results': results}, f, indent=2)
+    return summary['failed'] == 0
+
+def run_vm(args, bytecode, functions, local_names):
+    print("\n--- Generated Bytecode ---")
+    for line in disassemble(bytecode):
+        print(line)
+
+    # VM -> Executes Bytecode and produces output
+    print("\n--- Program Output ---")
+    # Pass the 'functions' dictionary to the VM
+    profiler = Profiler() if args.profile or args.flamegraph else None
+    vm = make_vm(bytecode, functions, local_names, memo_size=args.memo_size, tier_threshold=args.tier_threshold,
+                 profiler=profiler, output=BufferedSink(buffer_size=args.output_buffer), limits=limits_from_args(args))
+    try:
+        vm.run()
+    except Exception as e:
+        print(f"Runtime Error: {e}")
+
+    if args.profile:
+        with open(args.profile, 'w', encoding='utf-8') as f:
+            f.write(profiler.to_json())
+    if args.flamegraph:
+        with open(args.flamegraph, 'w', encoding='utf-8') as f:
+            f.write(profiler.collapsed())
+
+def run_watch(args, path):
+    # Hot reload: every change recompiles only the edited top-level units and reruns the program
+    compiler = IncrementalCompiler(path=path)
+    stamp = None
+    try:
+        while True:
+            try:
+                current = os.stat(path).st_mtime_ns
+            except OSError:
+                current = None
+            if current != stamp:
+                stamp = current
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        source_code = f.read()
+                    start = time.perf_counter()
+                    bytecode, functions, local_names = compiler.compile(source_code)
+                    print(f"\n--- {path}: {compiler.compiled} unit(s) compiled, {compiler.reused} reused "
+                          f"in {(time.perf_counter() - start) * 1000:.2f} ms ---")
+                except Exception as e:
+                    print(f"\nCompile Error: {e}")
+                else:
+                    vm = make_vm(bytecode, functions, local_names, memo_size=args.memo_size,
+                                 tier_threshold=args.tier_threshold, output=BufferedSink(buffer_size=args.output_buffer),
+                                 limits=limits_from_args(args))
+                    try:
+                        vm.run()
+                    except Exception as e:
+                        print(f"Runtime Error: {e}")
+            time.sleep(WATCH_INTERVAL)
+    except KeyboardInterrupt:
+        pass
 
 def main():
     """
     The main function to run the lexer, parser, compiler, and VM.
+    Compiled code is cached next to the source file as a .novac file.
     """
+    args = parse_args()
+    if len(args.paths) > 1 or os.path.isdir(args.paths[0]):
+        if not run_many(args, collect_paths(args.paths)): raise SystemExit(1)
+        return
+    path = args.paths[0]
+    if args.watch:
+        run_watch(args, path)
+        return
+    if path.endswith(IMAGE_SUFFIX):
+        # A packed image runs in place from the mapped file: no source, no compilation
+        try:
+            bytecode, functions, local_names = load_image(path).program()
+        except (OSError, ImageError) as e:
+            print(f"Error: Cannot load image '{path}': {e}")
+            return
+        run_vm(args, bytecode, functions, local_names)
+        return
     try:
-        with open(NOVA_FILE_PATH, 'r', encoding='utf-8') as f:
+        with open(path, 'r', encoding='utf-8') as f:
             source_code = f.read()
     except FileNotFoundError:
-        print(f"Error: The file '{NOVA_FILE_PATH}' was not found.")
+        print(f"Error: The file '{path}' was not found.")
         return
 
     print("--- Source Code ---")
     print(source_code)
 
-    # Lexer -> Produces tokens
-    lexer = Lexer(source_code)
-    tokens = lexer.tokenize()
-    
-    # Parser -> Produces AST
-    parser = Parser(tokens)
-    ast = parser.parse()
-    
-    # Compiler -> Produces Bytecode and function table
-    compiler = Compiler()
-    compiler.compile(ast)
-    bytecode = compiler.bytecode
-    # Get the functions dictionary from the compiler
-    functions = compiler.functions 
-    
-    print("\n--- Generated Bytecode ---")
-    for i, instruction in enumerate(bytecode):
-        print(f"{i:04d} {instruction[0]:<15} {instruction[1] if instruction[1] is not None else ''}")
+    if args.engine == 'closure':
+        run_closure(source_code, BufferedSink(buffer_size=args.output_buffer), path)
+        return
+    if args.engine == 'register':
+        run_register(source_code, BufferedSink(buffer_size=args.output_buffer), path)
+        return
 
-    # VM -> Executes Bytecode and produces output
-    print("\n--- Program Output ---")
-    # Pass the 'functions' dictionary to the VM
-    vm = VM(bytecode, functions)
+    # Lexer -> Parser -> Compiler (-> Optimizer), skipped entirely when the .novac cache is fresh
     try:
-        vm.run()
+        bytecode, functions, local_names = load_program(path, source_code, args.opt_level)
     except Exception as e:
-        print(f"Runtime Error: {e}")
+        print(f"Compile Error: {e}")
+        return
+    if args.write_image:
+        write_image(args.write_image, bytecode, functions, local_names)
+    run_vm(args, bytecode, functions, local_names)
 
 
 if __name__ == '__main__':
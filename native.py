@@ -0,0 +1,171 @@
+# native.py
+
+import math
+
+from opcodes import (OP_PUSH, OP_ADD, OP_SUB, OP_MUL, OP_DIV, OP_COMPARE_EQ, OP_COMPARE_NE, OP_COMPARE_LT,
+                     OP_COMPARE_GT, OP_JUMP, OP_JUMP_IF_FALSE, OP_STORE_LOCAL, OP_LOAD_LOCAL, OP_PRINT, OP_CALL,
+                     OP_RETURN, OP_TAIL_CALL, OP_BUILD_ARRAY, OP_INDEX, OP_BUILTIN, OP_POP, JUMP_OPCODES,
+                     NO_FALLTHROUGH_OPCODES)
+from purity import function_body
+
+# Second execution tier: a Nova function's bytecode is translated into the source of an
+# equivalent Python function, which the VM compiles with compile() once the function is hot.
+#
+# Each basic block becomes one `if _b == <block>:` arm of a `while True` loop. Inside a block
+# the operand stack is simulated with Python expressions, so `n * fact(n - 1)` turns into
+# ordinary nested Python arithmetic on local variables. Calls go back through VM.invoke.
+# The generated code runs in a namespace providing _invoke, _print, _undefined, _array
+# (NovaArray.from_values), _index (arrays.index_value) and _builtins (arrays.BUILTIN_FUNCTIONS).
+
+BINARY_TEMPLATES = {
+    OP_ADD: '({} + {})', OP_SUB: '({} - {})', OP_MUL: '({} * {})', OP_DIV: '({} / {})',
+    OP_COMPARE_EQ: '({} == {})', OP_COMPARE_NE: '({} != {})', OP_COMPARE_LT: '({} < {})', OP_COMPARE_GT: '({} > {})',
+}
+
+class NativeCompileError(Exception):
+    #Raised for functions the native tier cannot translate; they stay interpreted
+    pass
+
+def undefined(name):
+    raise NameError(f"Variable '{name}' is not defined.")
+
+def constant(value):
+    #Python literal for a PUSH argument
+    if value is None or type(value) in (bool, int, str): return repr(value)
+    if type(value) is float and math.isfinite(value): return repr(value)
+    raise NativeCompileError(f"Unsupported constant {value!r}")
+
+def translate_function(bytecode, functions, name):
+    #Returns the source of `def nova_<name>(...)`, or raises NativeCompileError
+    func_info = functions[name]
+    start, names, nargs = func_info['start_pos'], func_info['locals'], len(func_info['args'])
+    body = function_body(bytecode, start)
+    leaders = {start}
+    for i in sorted(body):
+        opcode, arg = bytecode[i]
+        if opcode in JUMP_OPCODES: leaders.add(arg)
+        if opcode in JUMP_OPCODES or opcode in NO_FALLTHROUGH_OPCODES: leaders.add(i + 1)
+    leaders = sorted(leader for leader in leaders if leader in body or leader == start)
+    block_ids = {pos: n for n, pos in enumerate(leaders)}
+
+    params = ', '.join(f'l{k}' for k in range(nargs))
+    lines = [f'def nova_{name}({params}):']
+    for k in range(nargs, len(names)):
+        lines.append(f'    l{k} = None')
+    lines.append(f'    _b = {block_ids[start]}')
+    lines.append('    while True:')
+    temps = 0
+
+    for n, pos in enumerate(leaders):
+        out = []
+        stack = []
+
+        def pop():
+            if not stack: raise NativeCompileError(f"Stack underflow in '{name}'")
+            return stack.pop()
+
+        def flush():
+            #Evaluates every pending expression into a temporary, keeping evaluation order
+            nonlocal temps
+            for j, expr in enumerate(stack):
+                if not expr.isidentifier(): # temporaries, True, False and None need no evaluation
+                    out.append(f't{temps} = {expr}')
+                    stack[j] = f't{temps}'
+                    temps += 1
+
+        def call_args(callee, count):
+            if callee not in functions: raise NativeCompileError(f"Call to undefined function '{callee}'")
+            if count != len(functions[callee]['args']): raise NativeCompileError(f"Bad argument count for '{callee}'")
+            args = [pop() for _ in range(count)][::-1]
+            return f"({''.join(f'{a}, ' for a in args)})"
+
+        def end_block():
+            #Values cannot be carried from one block to the next
+            flush()
+            if stack: raise NativeCompileError(f"Unbalanced stack at a block boundary in '{name}'")
+
+        def goto(target):
+            out.append(f'_b = {block_ids[target]}')
+            if block_ids[target] <= n: out.append('continue')
+
+        i = pos
+        while True:
+            opcode, arg = bytecode[i]
+            if opcode == OP_PUSH:
+                stack.append(constant(arg))
+            elif opcode == OP_LOAD_LOCAL:
+                stack.append(f'(l{arg} if l{arg} is not None else _undefined({names[arg]!r}))')
+            elif opcode == OP_STORE_LOCAL:
+                value = pop()
+                flush()
+                out.append(f'l{arg} = {value}')
+            elif opcode in BINARY_TEMPLATES:
+                right = pop()
+                stack.append(BINARY_TEMPLATES[opcode].format(pop(), right))
+            elif opcode == OP_BUILD_ARRAY:
+                values = [pop() for _ in range(arg)][::-1]
+                stack.append(f"_array(({''.join(f'{v}, ' for v in values)}))")
+            elif opcode == OP_INDEX:
+                index = pop()
+                stack.append(f'_index({pop()}, {index})')
+            elif opcode == OP_BUILTIN:
+                stack.append(f'_builtins[{arg!r}]({pop()})')
+            elif opcode == OP_POP:
+                value = pop()
+                flush()
+                # Still evaluated, for the errors it may raise
+                if not value.isidentifier(): out.append(value)
+            elif opcode == OP_PRINT:
+                value = pop()
+                flush()
+                out.append(f'_print({value})')
+            elif opcode == OP_CALL:
+                callee, count = arg
+                args = call_args(callee, count)
+                flush()
+                out.append(f't{temps} = _invoke({callee!r}, {args})')
+                stack.append(f't{temps}')
+                temps += 1
+            elif opcode == OP_TAIL_CALL:
+                callee, count = arg
+                args = call_args(callee, count)
+                flush()
+                if callee == name:
+                    # Self tail call: rebind the parameters and loop
+                    if nargs: out.append(f'{params}, = {args}')
+                    for k in range(nargs, len(names)): out.append(f'l{k} = None')
+                    goto(start)
+                else:
+                    out.append(f'return _invoke({callee!r}, {args})')
+                break
+            elif opcode == OP_RETURN:
+                value = pop()
+                flush()
+                out.append(f'return {value}')
+                break
+            elif opcode == OP_JUMP:
+                end_block()
+                goto(arg)
+                break
+            elif opcode == OP_JUMP_IF_FALSE:
+                condition = pop()
+                end_block()
+                out.append(f'if not {condition}:')
+                out.append(f'    _b = {block_ids[arg]}')
+                if block_ids[arg] <= n: out.append('    continue')
+                out.append('else:')
+                out.append(f'    _b = {block_ids[i + 1]}')
+                if block_ids[i + 1] <= n: out.append('    continue')
+                break
+            else:
+                raise NativeCompileError(f"Unsupported opcode {opcode}")
+            i += 1
+            if i in block_ids:
+                # Falls through into the next block
+                end_block()
+                goto(i)
+                break
+
+        lines.append(f'        if _b == {n}:')
+        lines.extend(f'            {line}' for line in out)
+    return '\n'.join(lines) + '\n'
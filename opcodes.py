@@ -0,0 +1,136 @@
+# opcodes.py
+
+from rope import Rope
+
+# Integer opcodes shared by the compiler and the VM. The string names are
+# only used for disassembly listings.
+OP_PUSH          = 0
+OP_ADD           = 1
+OP_SUB           = 2
+OP_MUL           = 3
+OP_DIV           = 4
+OP_COMPARE_EQ    = 5
+OP_COMPARE_NE    = 6
+OP_COMPARE_LT    = 7
+OP_COMPARE_GT    = 8
+OP_JUMP          = 9
+OP_JUMP_IF_FALSE = 10
+OP_STORE_LOCAL   = 11
+OP_LOAD_LOCAL    = 12
+OP_PRINT         = 13
+OP_CALL          = 14
+OP_RETURN        = 15
+OP_TAIL_CALL     = 16
+OP_BUILD_ARRAY   = 17
+OP_INDEX         = 18
+OP_BUILTIN       = 19
+OP_POP           = 20
+
+# Quickened forms, never emitted by the compiler: the VM rewrites instructions in its private
+# copy of the code into these once it has seen the operand types or the call target
+OP_ADD_INT             = 21
+OP_ADD_STR             = 22
+OP_SUB_INT             = 23
+OP_COMPARE_LT_INT      = 24
+OP_COMPARE_GT_INT      = 25
+OP_CALL_LINKED         = 26
+OP_TAIL_CALL_LINKED    = 27
+
+# Indexed by opcode
+OPCODE_NAMES = [
+    'PUSH', 'ADD', 'SUB', 'MUL', 'DIV',
+    'COMPARE_EQ', 'COMPARE_NE', 'COMPARE_LT', 'COMPARE_GT',
+    'JUMP', 'JUMP_IF_FALSE', 'STORE_LOCAL', 'LOAD_LOCAL', 'PRINT', 'CALL', 'RETURN',
+    'TAIL_CALL', 'BUILD_ARRAY', 'INDEX', 'BUILTIN', 'POP',
+    'ADD_INT', 'ADD_STR', 'SUB_INT', 'COMPARE_LT_INT', 'COMPARE_GT_INT', 'CALL_LINKED', 'TAIL_CALL_LINKED',
+]
+
+# Source operator -> opcode
+BINARY_OPS = {
+    '+': OP_ADD, '-': OP_SUB, '*': OP_MUL, '/': OP_DIV,
+    '==': OP_COMPARE_EQ, '!=': OP_COMPARE_NE, '<': OP_COMPARE_LT, '>': OP_COMPARE_GT,
+}
+
+# (generic opcode, left operand type, right operand type) -> specialized opcode
+SPECIALIZATIONS = {
+    (OP_ADD, int, int): OP_ADD_INT,
+    (OP_ADD, str, str): OP_ADD_STR,
+    (OP_ADD, Rope, str): OP_ADD_STR,
+    (OP_ADD, str, Rope): OP_ADD_STR,
+    (OP_ADD, Rope, Rope): OP_ADD_STR,
+    (OP_SUB, int, int): OP_SUB_INT,
+    (OP_COMPARE_LT, int, int): OP_COMPARE_LT_INT,
+    (OP_COMPARE_GT, int, int): OP_COMPARE_GT_INT,
+}
+
+# Opcodes whose argument is an absolute bytecode index
+JUMP_OPCODES = frozenset((OP_JUMP, OP_JUMP_IF_FALSE))
+
+# Opcodes after which execution never falls through to the next instruction
+NO_FALLTHROUGH_OPCODES = frozenset((OP_JUMP, OP_RETURN, OP_TAIL_CALL))
+
+
+def disassemble(bytecode):
+    #Yields one listing line per instruction
+    for i, (opcode, arg) in enumerate(bytecode):
+        yield f"{i:04d} {OPCODE_NAMES[opcode]:<15} {arg if arg is not None else ''}"
+
+
+# Register instruction set, used by regcompiler.py and regvm.py. An instruction is an
+# (opcode, a, b, c) tuple whose operands address frame registers directly: `let i = i + 1`
+# is a single ADD. The destination register is a, and jump targets are always c.
+R_MOVE            = 0   # a = b
+R_ADD             = 1   # a = b + c
+R_SUB             = 2
+R_MUL             = 3
+R_DIV             = 4
+R_COMPARE_EQ      = 5
+R_COMPARE_NE      = 6
+R_COMPARE_LT      = 7
+R_COMPARE_GT      = 8
+R_CHECK           = 9   # NameError for variable b unless register a holds a value
+R_JUMP            = 10  # ip = c
+R_JUMP_IF_FALSE   = 11  # if not a: ip = c
+R_JUMP_UNLESS_EQ  = 12  # if not a == b: ip = c
+R_JUMP_UNLESS_NE  = 13
+R_JUMP_UNLESS_LT  = 14
+R_JUMP_UNLESS_GT  = 15
+R_PRINT           = 16  # print a
+R_CALL            = 17  # a = function b called with the registers in tuple c
+R_TAIL_CALL       = 18  # return function b called with the registers in tuple c
+R_RETURN          = 19  # return a
+R_BUILD_ARRAY     = 20  # a = array of the registers in tuple b
+R_INDEX           = 21  # a = b[c]
+R_BUILTIN         = 22  # a = built-in b applied to c
+# Linked calls (linker.py): b is (entry address, register template) instead of a name
+R_CALL_LINKED      = 23
+R_TAIL_CALL_LINKED = 24
+
+REG_OPCODE_NAMES = [
+    'MOVE', 'ADD', 'SUB', 'MUL', 'DIV',
+    'COMPARE_EQ', 'COMPARE_NE', 'COMPARE_LT', 'COMPARE_GT', 'CHECK',
+    'JUMP', 'JUMP_IF_FALSE', 'JUMP_UNLESS_EQ', 'JUMP_UNLESS_NE', 'JUMP_UNLESS_LT', 'JUMP_UNLESS_GT',
+    'PRINT', 'CALL', 'TAIL_CALL', 'RETURN', 'BUILD_ARRAY', 'INDEX', 'BUILTIN',
+    'CALL_LINKED', 'TAIL_CALL_LINKED',
+]
+
+REG_BINARY_OPS = {
+    '+': R_ADD, '-': R_SUB, '*': R_MUL, '/': R_DIV,
+    '==': R_COMPARE_EQ, '!=': R_COMPARE_NE, '<': R_COMPARE_LT, '>': R_COMPARE_GT,
+}
+
+# Comparison used as a condition -> fused compare-and-branch
+REG_BRANCH_OPS = {'==': R_JUMP_UNLESS_EQ, '!=': R_JUMP_UNLESS_NE, '<': R_JUMP_UNLESS_LT, '>': R_JUMP_UNLESS_GT}
+
+REG_JUMP_OPCODES = frozenset((R_JUMP, R_JUMP_IF_FALSE) + tuple(REG_BRANCH_OPS.values()))
+
+
+def disassemble_registers(code):
+    #Yields one listing line per register instruction; rN is register N
+    def operand(value):
+        if type(value) is int: return f'r{value}'
+        if type(value) is tuple: return f"({', '.join(f'r{r}' for r in value)})"
+        return '' if value is None else str(value)
+    for i, (opcode, a, b, c) in enumerate(code):
+        operands = [operand(a), operand(b), str(c) if opcode in REG_JUMP_OPCODES else operand(c)]
+        yield f"{i:04d} {REG_OPCODE_NAMES[opcode]:<15} {' '.join(o for o in operands if o)}"
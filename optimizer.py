@@ -0,0 +1,138 @@
+# optimizer.py
+
+import operator
+
+from opcodes import (OP_PUSH, OP_ADD, OP_SUB, OP_MUL, OP_DIV, OP_COMPARE_EQ, OP_COMPARE_NE, OP_COMPARE_LT,
+                     OP_COMPARE_GT, OP_JUMP, OP_JUMP_IF_FALSE, JUMP_OPCODES, NO_FALLTHROUGH_OPCODES)
+
+# Binary opcodes that can be evaluated at compile time when both operands are constants
+FOLDABLE_OPS = {
+    OP_ADD: operator.add, OP_SUB: operator.sub, OP_MUL: operator.mul, OP_DIV: operator.truediv,
+    OP_COMPARE_EQ: operator.eq, OP_COMPARE_NE: operator.ne, OP_COMPARE_LT: operator.lt, OP_COMPARE_GT: operator.gt,
+}
+
+# Folded string constants longer than this stay as runtime operations ("x" * 100000)
+MAX_FOLDED_STRING = 256
+
+
+class Optimizer:
+    #Bytecode-to-bytecode optimizer run between Compiler.compile and the VM.
+    #  level 0: no changes
+    #  level 1: constant folding, constant conditions and jump threading
+    #  level 2: level 1 plus removal of unreachable code and jumps to the next instruction
+    def __init__(self, level=1):
+        self.level = level
+
+    def optimize(self, bytecode, functions):
+        #Returns a new (bytecode, functions) pair; the inputs are left untouched
+        bytecode = list(bytecode)
+        functions = {name: dict(info) for name, info in functions.items()}
+        if self.level >= 1:
+            bytecode = self.fold_constants(bytecode, functions)
+            self.thread_jumps(bytecode)
+        if self.level >= 2:
+            bytecode = self.remove_dead_code(bytecode, functions)
+        return bytecode, functions
+
+    def entry_points(self, functions):
+        return {0} | {info['start_pos'] for info in functions.values()}
+
+    def jump_targets(self, bytecode, functions):
+        targets = self.entry_points(functions)
+        for opcode, arg in bytecode:
+            if opcode in JUMP_OPCODES: targets.add(arg)
+        return targets
+
+    def relocate(self, bytecode, functions, index_map):
+        #Rewrites jump arguments and function entry points through index_map (old index -> new index)
+        for i, (opcode, arg) in enumerate(bytecode):
+            if opcode in JUMP_OPCODES: bytecode[i] = (opcode, index_map[arg])
+        for info in functions.values():
+            info['start_pos'] = index_map[info['start_pos']]
+
+    def fold_constants(self, bytecode, functions):
+        #Folds PUSH a, PUSH b, <op> into PUSH (a op b), and PUSH c, JUMP_IF_FALSE into a JUMP or nothing.
+        #Instructions are only merged into their predecessor when nothing jumps between them; a jump
+        #to the first instruction of a merged group lands on its replacement.
+        targets = self.jump_targets(bytecode, functions)
+        out = []
+        # For each emitted instruction, whether control can enter it other than by falling through
+        entered = []
+        index_map = [0] * (len(bytecode) + 1)
+        for i, (opcode, arg) in enumerate(bytecode):
+            index_map[i] = len(out)
+            if i not in targets and out and out[-1][0] == OP_PUSH:
+                fold = FOLDABLE_OPS.get(opcode)
+                if fold and not entered[-1] and len(out) >= 2 and out[-2][0] == OP_PUSH:
+                    value = self.evaluate(fold, out[-2][1], out[-1][1])
+                    if value is not None:
+                        out.pop(); entered.pop()
+                        out[-1] = (OP_PUSH, value)
+                        index_map[i] = len(out) - 1
+                        continue
+                if opcode == OP_JUMP_IF_FALSE:
+                    condition = out.pop(); entered.pop()
+                    index_map[i] = len(out)
+                    if not condition[1]:
+                        out.append((OP_JUMP, arg)); entered.append(False)
+                    continue
+            out.append((opcode, arg))
+            entered.append(i in targets)
+        index_map[len(bytecode)] = len(out)
+        self.relocate(out, functions, index_map)
+        return out
+
+    def evaluate(self, fold, left, right):
+        #Returns the folded constant, or None when the operation must stay a runtime operation
+        if left is None or right is None: return None
+        try:
+            value = fold(left, right)
+        except Exception:
+            return None # e.g. division by zero or a type error, which must still happen at run time
+        if isinstance(value, str) and len(value) > MAX_FOLDED_STRING: return None
+        return value
+
+    def thread_jumps(self, bytecode):
+        #Points jumps that land on an unconditional JUMP straight at its final destination
+        for i, (opcode, arg) in enumerate(bytecode):
+            if opcode not in JUMP_OPCODES: continue
+            target, seen = arg, set()
+            while target < len(bytecode) and bytecode[target][0] == OP_JUMP and target not in seen:
+                seen.add(target)
+                target = bytecode[target][1]
+            if target != arg: bytecode[i] = (opcode, target)
+
+    def remove_dead_code(self, bytecode, functions):
+        #Drops instructions unreachable from the program start or any function entry, then
+        #jumps to the instruction that follows them, until nothing changes
+        while True:
+            keep = self.reachable(bytecode, functions)
+            for i, (opcode, arg) in enumerate(bytecode):
+                if opcode == OP_JUMP and keep[i] and arg == self.next_kept(keep, i):
+                    keep[i] = False
+            if all(keep): return bytecode
+            index_map = [0] * (len(bytecode) + 1)
+            out = []
+            for i, instruction in enumerate(bytecode):
+                index_map[i] = len(out)
+                if keep[i]: out.append(instruction)
+            index_map[len(bytecode)] = len(out)
+            self.relocate(out, functions, index_map)
+            bytecode = out
+
+    def reachable(self, bytecode, functions):
+        keep = [False] * len(bytecode)
+        work = [pos for pos in self.entry_points(functions) if pos < len(bytecode)]
+        while work:
+            i = work.pop()
+            if i >= len(bytecode) or keep[i]: continue
+            keep[i] = True
+            opcode, arg = bytecode[i]
+            if opcode in JUMP_OPCODES: work.append(arg)
+            if opcode not in NO_FALLTHROUGH_OPCODES: work.append(i + 1)
+        return keep
+
+    def next_kept(self, keep, i):
+        i += 1
+        while i < len(keep) and not keep[i]: i += 1
+        return i
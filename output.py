@@ -0,0 +1,60 @@
+# output.py
+
+import sys
+
+# Characters buffered by a BufferedSink before it writes a block
+DEFAULT_BUFFER_SIZE = 64 * 1024
+
+# Destinations for PRINT. A sink has write(value), which prints one value as a line, and
+# flush(); engines call flush() when a program finishes or fails.
+
+
+class BufferedSink:
+    #Block-buffered output: lines are collected as str and written as one joined, encoded
+    #block once buffer_size characters are pending (buffer_size=0 writes every line).
+    #stream=None writes to whatever sys.stdout is at flush time, so redirect_stdout works.
+    def __init__(self, stream=None, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self.parts = []
+        self.size = 0
+
+    def write(self, value):
+        text = str(value)
+        self.parts.append(text)
+        self.size += len(text) + 1
+        if self.size > self.buffer_size: self.flush()
+
+    def flush(self):
+        if not self.parts: return
+        parts, self.parts, self.size = self.parts, [], 0
+        parts.append('')
+        text = '\n'.join(parts)
+        stream = self.stream if self.stream is not None else sys.stdout
+        binary = getattr(stream, 'buffer', None)
+        if binary is None:
+            stream.write(text)
+            stream.flush()
+            return
+        # Encode the whole block once and bypass the text layer; anything already
+        # printed through the text layer goes first to keep the order
+        stream.flush()
+        binary.write(text.encode(stream.encoding or 'utf-8', getattr(stream, 'errors', None) or 'strict'))
+        binary.flush()
+
+class CollectorSink:
+    #Keeps the output in memory, e.g. for tests or for returning it from a service
+    def __init__(self):
+        self.lines = []
+
+    def write(self, value): self.lines.append(str(value))
+    def flush(self): pass
+    def getvalue(self): return ''.join(f'{line}\n' for line in self.lines)
+
+class CallbackSink:
+    #Hands every printed line to callback(text)
+    def __init__(self, callback):
+        self.callback = callback
+
+    def write(self, value): self.callback(str(value))
+    def flush(self): pass
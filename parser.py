@@ -1,13 +1,22 @@
-from lexer import TT_INT, TT_KEYWORD, TT_IDENTIFIER, TT_OPERATOR, TT_STRING, TT_LBRACE, TT_RBRACE, TT_LPAREN, TT_RPAREN, TT_COMMA, TT_EOF
-from tree import NumberNode, StringNode, BoolNode, VarAccessNode, VarAssignNode, BinOpNode, PrintNode, StatementsNode, IfNode, WhileNode, FunctionDefNode, FunctionCallNode, ReturnNode
+from lexer import TT_INT, TT_KEYWORD, TT_IDENTIFIER, TT_OPERATOR, TT_STRING, TT_LBRACE, TT_RBRACE, TT_LPAREN, TT_RPAREN, TT_COMMA, TT_LBRACKET, TT_RBRACKET, TT_EOF
+from tree import NumberNode, StringNode, BoolNode, VarAccessNode, VarAssignNode, BinOpNode, PrintNode, StatementsNode, IfNode, WhileNode, FunctionDefNode, FunctionCallNode, ReturnNode, ArrayNode, IndexNode, ImportNode
 
 class Parser:
-    def __init__(self, tokens):
-        self.tokens, self.pos, self.current_token = tokens, 0, tokens[0]
+    def __init__(self, tokens, keep_tokens=True):
+        # Any token iterable works: a list from Lexer.tokenize() or the lazy Lexer.iter_tokens()
+        self.tokens = iter(tokens)
+        self.current_token = next(self.tokens)
+        # With keep_tokens=False nodes only keep their values and source offsets,
+        # so the Token objects can be freed as soon as they are consumed
+        self.keep_tokens = keep_tokens
+
+    def node(self, node):
+        if not self.keep_tokens: node.drop_tokens()
+        return node
 
     def advance(self):
-        self.pos += 1
-        if self.pos < len(self.tokens): self.current_token = self.tokens[self.pos]
+        # Stays on the EOF token once the stream is exhausted
+        self.current_token = next(self.tokens, self.current_token)
         return self.current_token
 
     def parse(self): return self.statements()
@@ -26,6 +35,7 @@ class Parser:
             if self.current_token.value == 'while': return self.parse_while_statement()
             if self.current_token.value == 'fun': return self.parse_function_definition()
             if self.current_token.value == 'return': return self.parse_return_statement()
+            if self.current_token.value == 'import': return self.parse_import_statement()
         return self.expression()
 
     def parse_let_statement(self):
@@ -36,7 +46,7 @@ class Parser:
         if self.current_token.value != '=': raise Exception("Expected '='")
         self.advance()
         value = self.expression()
-        return VarAssignNode(name, value)
+        return self.node(VarAssignNode(name, value))
     
     def parse_print_statement(self):
         self.advance()
@@ -93,29 +103,47 @@ class Parser:
         body = self.statements()
         if self.current_token.type != TT_RBRACE: raise Exception("Expected '}'")
         self.advance()
-        return FunctionDefNode(name, args, body)
+        return self.node(FunctionDefNode(name, args, body))
 
     def parse_return_statement(self):
         self.advance()
         return ReturnNode(self.expression())
 
+    def parse_import_statement(self):
+        self.advance()
+        if self.current_token.type != TT_IDENTIFIER: raise Exception("Expected module name")
+        name = self.current_token
+        self.advance()
+        return self.node(ImportNode(name))
+
     def expression(self):
         node = self.term()
         while self.current_token.value in ('+', '-', '==', '!=', '<', '>'):
-            op = self.current_token; self.advance(); node = BinOpNode(node, op, self.term())
+            op = self.current_token; self.advance(); node = self.node(BinOpNode(node, op, self.term()))
         return node
 
     def term(self):
         node = self.factor()
         while self.current_token.value in ('*', '/'):
-            op = self.current_token; self.advance(); node = BinOpNode(node, op, self.factor())
+            op = self.current_token; self.advance(); node = self.node(BinOpNode(node, op, self.factor()))
         return node
 
     def factor(self):
+        node = self.atom()
+        while self.current_token.type == TT_LBRACKET: # Indexing, e.g. a[i] or a[i][j]
+            token = self.current_token
+            self.advance()
+            index = self.expression()
+            if self.current_token.type != TT_RBRACKET: raise Exception("Expected ']'")
+            self.advance()
+            node = self.node(IndexNode(node, token, index))
+        return node
+
+    def atom(self):
         token = self.current_token
-        if token.type == TT_INT: self.advance(); return NumberNode(token)
-        if token.type == TT_STRING: self.advance(); return StringNode(token)
-        if token.value in ('true', 'false'): self.advance(); return BoolNode(token)
+        if token.type == TT_INT: self.advance(); return self.node(NumberNode(token))
+        if token.type == TT_STRING: self.advance(); return self.node(StringNode(token))
+        if token.value in ('true', 'false'): self.advance(); return self.node(BoolNode(token))
         if token.type == TT_IDENTIFIER:
             self.advance()
             if self.current_token.type == TT_LPAREN: # Function call
@@ -128,6 +156,17 @@ class Parser:
                         arg_nodes.append(self.expression())
                 if self.current_token.type != TT_RPAREN: raise Exception("Expected ')' or ','")
                 self.advance()
-                return FunctionCallNode(token, arg_nodes)
-            return VarAccessNode(token) # Variable access
+                return self.node(FunctionCallNode(token, arg_nodes))
+            return self.node(VarAccessNode(token)) # Variable access
+        if token.type == TT_LBRACKET: # Array literal
+            self.advance()
+            element_nodes = []
+            if self.current_token.type != TT_RBRACKET:
+                element_nodes.append(self.expression())
+                while self.current_token.type == TT_COMMA:
+                    self.advance()
+                    element_nodes.append(self.expression())
+            if self.current_token.type != TT_RBRACKET: raise Exception("Expected ']' or ','")
+            self.advance()
+            return self.node(ArrayNode(token, element_nodes))
         raise Exception(f"Invalid syntax: {token}")
\ No newline at end of file
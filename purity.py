@@ -0,0 +1,56 @@
+# purity.py
+
+from opcodes import OP_PRINT, OP_CALL, OP_TAIL_CALL, JUMP_OPCODES, NO_FALLTHROUGH_OPCODES
+
+# Opcodes with an effect visible outside the executing frame
+IMPURE_OPCODES = frozenset((OP_PRINT,))
+CALL_OPCODES = frozenset((OP_CALL, OP_TAIL_CALL))
+
+
+def function_body(bytecode, start_pos):
+    #Indices of the instructions reachable from a function entry without following calls
+    seen, work = set(), [start_pos]
+    while work:
+        i = work.pop()
+        if i in seen or i >= len(bytecode): continue
+        seen.add(i)
+        opcode, arg = bytecode[i]
+        if opcode in JUMP_OPCODES: work.append(arg)
+        if opcode not in NO_FALLTHROUGH_OPCODES: work.append(i + 1)
+    return seen
+
+def call_graph(bytecode, functions):
+    #Returns ({function name: names it calls directly}, names of functions whose body prints)
+    impure, callees = set(), {}
+    for name, info in functions.items():
+        callees[name] = set()
+        for i in function_body(bytecode, info['start_pos']):
+            opcode, arg = bytecode[i]
+            if opcode in IMPURE_OPCODES: impure.add(name)
+            elif opcode in CALL_OPCODES: callees[name].add(arg[0])
+    return callees, impure
+
+def callers_of(callees, names):
+    #`names` plus every function that calls one of them, directly or transitively
+    reached, changed = set(names), True
+    while changed:
+        changed = False
+        for name, called in callees.items():
+            if name not in reached and not called.isdisjoint(reached):
+                reached.add(name)
+                changed = True
+    return reached
+
+def find_pure_functions(bytecode, functions):
+    #Returns the names of functions whose result depends only on their arguments.
+    #Frames cannot see each other's variables, so a function is pure unless its body
+    #prints or it calls (directly or transitively) an impure or undefined function.
+    callees, impure = call_graph(bytecode, functions)
+    changed = True
+    while changed:
+        changed = False
+        for name, called in callees.items():
+            if name not in impure and any(c not in functions or c in impure for c in called):
+                impure.add(name)
+                changed = True
+    return {name for name in functions if name not in impure}
@@ -0,0 +1,279 @@
+# regcompiler.py
+
+import os
+
+from lexer import Lexer
+from parser import Parser
+from tree import NumberNode, StringNode, BoolNode, VarAssignNode, BinOpNode, StatementsNode, IfNode, WhileNode, FunctionCallNode
+from opcodes import (R_MOVE, R_CHECK, R_JUMP, R_JUMP_IF_FALSE, R_PRINT, R_CALL, R_TAIL_CALL, R_RETURN, R_BUILD_ARRAY,
+                     R_INDEX, R_BUILTIN, REG_BINARY_OPS, REG_BRANCH_OPS)
+from arrays import BUILTIN_FUNCTIONS
+from linker import check_calls
+from cache import DEFAULT_LOADER
+
+# Code generator for the register VM (regvm.py). Every scope (the top level and each function
+# body) has its own register file:
+#   - variables get a register on first use, arguments take the first ones
+#   - every distinct constant gets a register, preloaded from the scope's template when a
+#     frame is created, so constants are operands like any other register
+#   - expression temporaries are allocated on demand and reused once consumed
+# Reading a variable costs nothing unless it may still be undefined: a definite-assignment pass
+# emits a CHECK only before reads that are not preceded, on every path, by an assignment or an
+# earlier CHECK. Call results may be None (a function that falls off its end), so assigning one
+# does not make a variable definitely assigned, and neither does being an argument.
+
+
+class Scope:
+    #Register allocation state of the scope being compiled
+    __slots__ = ('slots', 'nregs', 'constants', 'temps', 'free', 'assigned')
+
+    def __init__(self):
+        self.slots = {}       # variable name -> register
+        self.nregs = 0
+        self.constants = {}   # (type, value) -> register
+        self.temps = set()
+        self.free = []        # temporaries available for reuse
+        self.assigned = set() # variables definitely holding a value at this point
+
+    def template(self):
+        #Initial register file of a frame: constants in place, everything else None
+        registers = [None] * self.nregs
+        for (kind, value), register in self.constants.items():
+            registers[register] = value
+        return registers
+
+def call_assigned_names(node):
+    #Variables assigned a call result anywhere in a statement tree (not in nested functions)
+    names = set()
+    if isinstance(node, VarAssignNode):
+        value = node.value_node
+        if isinstance(value, FunctionCallNode) and value.name not in BUILTIN_FUNCTIONS: names.add(node.name)
+    elif isinstance(node, StatementsNode):
+        for statement in node.statements: names |= call_assigned_names(statement)
+    elif isinstance(node, IfNode):
+        names |= call_assigned_names(node.if_body_node)
+        if node.else_body_node: names |= call_assigned_names(node.else_body_node)
+    elif isinstance(node, WhileNode):
+        names |= call_assigned_names(node.body_node)
+    return names
+
+class RegisterCompiler:
+    def __init__(self, loader=None, path=None):
+        self.code = []
+        self.functions = {}
+        self.scope = Scope()
+        # (name, argument count, source offset) of every call emitted, for linker.check_calls
+        self.calls = []
+        # Imports: the module loader (cache.ModuleLoader) finds and checks every module, the
+        # source file imports are resolved relative to, and the modules compiled in so far
+        self.loader = loader if loader is not None else DEFAULT_LOADER
+        self.path = path
+        self.imported = set()
+
+    def compile_program(self, node, source=None):
+        #Returns (code, functions, main), where main describes the top-level frame
+        self.statement(node)
+        check_calls(self.calls, self.functions, source)
+        return self.code, self.functions, {'nregs': self.scope.nregs, 'template': self.scope.template()}
+
+    def emit(self, opcode, a=None, b=None, c=None):
+        self.code.append((opcode, a, b, c))
+        return len(self.code) - 1
+
+    def patch(self, index, target):
+        self.code[index] = self.code[index][:3] + (target,)
+
+    # Registers
+
+    def new_register(self):
+        register = self.scope.nregs
+        self.scope.nregs += 1
+        return register
+
+    def local(self, name):
+        register = self.scope.slots.get(name)
+        if register is None: register = self.scope.slots[name] = self.new_register()
+        return register
+
+    def constant(self, value):
+        key = (type(value), value)
+        register = self.scope.constants.get(key)
+        if register is None: register = self.scope.constants[key] = self.new_register()
+        return register
+
+    def temp(self):
+        if self.scope.free: return self.scope.free.pop()
+        register = self.new_register()
+        self.scope.temps.add(register)
+        return register
+
+    def release(self, *registers):
+        for register in registers:
+            if register in self.scope.temps and register not in self.scope.free: self.scope.free.append(register)
+
+    # Expressions: expression(node, dst) returns the register holding the value, which is dst when
+    # the value could be computed straight into it
+
+    def expression(self, node, dst=None):
+        method = getattr(self, f'expr_{type(node).__name__}', None)
+        if method is None: raise Exception(f'No register code for {type(node).__name__}')
+        return method(node, dst)
+
+    def expr_NumberNode(self, node, dst): return self.constant(node.value)
+    expr_StringNode = expr_BoolNode = expr_NumberNode
+
+    def expr_VarAccessNode(self, node, dst):
+        register = self.local(node.name)
+        if node.name not in self.scope.assigned:
+            self.emit(R_CHECK, register, node.name)
+            self.scope.assigned.add(node.name)
+        return register
+
+    def expr_BinOpNode(self, node, dst):
+        opcode = REG_BINARY_OPS.get(node.op)
+        if opcode is None: raise Exception(f"Unknown operator {node.op}")
+        left = self.expression(node.left_node)
+        right = self.expression(node.right_node)
+        self.release(left, right)
+        if dst is None: dst = self.temp()
+        self.emit(opcode, dst, left, right)
+        return dst
+
+    def call_registers(self, node):
+        registers = tuple(self.expression(arg) for arg in node.arg_nodes)
+        self.release(*registers)
+        return registers
+
+    def expr_FunctionCallNode(self, node, dst):
+        if node.name in BUILTIN_FUNCTIONS:
+            if len(node.arg_nodes) != 1: raise Exception(f"{node.name}() takes 1 argument, got {len(node.arg_nodes)}")
+            arg = self.expression(node.arg_nodes[0])
+            self.release(arg)
+            if dst is None: dst = self.temp()
+            self.emit(R_BUILTIN, dst, node.name, arg)
+            return dst
+        registers = self.call_registers(node)
+        if dst is None: dst = self.temp()
+        self.calls.append((node.name, len(registers), node.pos))
+        self.emit(R_CALL, dst, node.name, registers)
+        return dst
+
+    def expr_ArrayNode(self, node, dst):
+        registers = tuple(self.expression(element) for element in node.element_nodes)
+        self.release(*registers)
+        if dst is None: dst = self.temp()
+        self.emit(R_BUILD_ARRAY, dst, registers)
+        return dst
+
+    def expr_IndexNode(self, node, dst):
+        target = self.expression(node.target_node)
+        index = self.expression(node.index_node)
+        self.release(target, index)
+        if dst is None: dst = self.temp()
+        self.emit(R_INDEX, dst, target, index)
+        return dst
+
+    def branch(self, node):
+        #Emits a jump taken when the condition is false; returns its index for patching
+        if isinstance(node, BinOpNode) and node.op in REG_BRANCH_OPS:
+            left = self.expression(node.left_node)
+            right = self.expression(node.right_node)
+            self.release(left, right)
+            return self.emit(REG_BRANCH_OPS[node.op], left, right)
+        condition = self.expression(node)
+        self.release(condition)
+        return self.emit(R_JUMP_IF_FALSE, condition)
+
+    # Statements
+
+    def statement(self, node):
+        method = getattr(self, f'stmt_{type(node).__name__}', None)
+        if method is not None: return method(node)
+        # Expression statement: evaluated for its effects
+        self.release(self.expression(node))
+
+    def stmt_StatementsNode(self, node):
+        for statement in node.statements: self.statement(statement)
+
+    def stmt_VarAssignNode(self, node):
+        register = self.local(node.name)
+        value = self.expression(node.value_node, register)
+        if value != register: self.emit(R_MOVE, register, value)
+        self.release(value)
+        if isinstance(node.value_node, FunctionCallNode) and node.value_node.name not in BUILTIN_FUNCTIONS:
+            self.scope.assigned.discard(node.name)
+        else:
+            self.scope.assigned.add(node.name)
+
+    def stmt_PrintNode(self, node):
+        value = self.expression(node.value_node)
+        self.release(value)
+        self.emit(R_PRINT, value)
+
+    def stmt_IfNode(self, node):
+        false_jump = self.branch(node.condition_node)
+        before = set(self.scope.assigned)
+        self.statement(node.if_body_node)
+        if node.else_body_node:
+            after_if, self.scope.assigned = self.scope.assigned, before
+            end_jump = self.emit(R_JUMP)
+            self.patch(false_jump, len(self.code))
+            self.statement(node.else_body_node)
+            self.patch(end_jump, len(self.code))
+            self.scope.assigned &= after_if
+        else:
+            self.patch(false_jump, len(self.code))
+            self.scope.assigned &= before
+
+    def stmt_WhileNode(self, node):
+        # The loop head is reached from before the loop and from the end of the body; the body
+        # only adds names to the assigned set, except by assigning call results
+        self.scope.assigned -= call_assigned_names(node.body_node)
+        start = len(self.code)
+        false_jump = self.branch(node.condition_node)
+        after_condition = set(self.scope.assigned)
+        self.statement(node.body_node)
+        self.emit(R_JUMP, c=start)
+        self.patch(false_jump, len(self.code))
+        self.scope.assigned = after_condition
+
+    def stmt_FunctionDefNode(self, node):
+        if node.name in BUILTIN_FUNCTIONS: raise Exception(f"'{node.name}' is a built-in function")
+        skip = self.emit(R_JUMP)
+        outer = self.scope
+        self.scope = Scope()
+        for name in node.arg_names: self.local(name)
+        info = self.functions[node.name] = {'start_pos': len(self.code), 'args': list(node.arg_names)}
+        self.statement(node.body_node)
+        self.emit(R_RETURN, self.constant(None))
+        info['nregs'], info['template'] = self.scope.nregs, self.scope.template()
+        self.scope = outer
+        self.patch(skip, len(self.code))
+
+    def stmt_ImportNode(self, node):
+        #Compiles the module's functions into the program, once. The loader already checked
+        #their calls against the module, so they are not recorded again.
+        path, tree = self.loader.parse_module(node.name, os.path.dirname(self.path) if self.path else None)
+        if path in self.imported: return
+        self.imported.add(path)
+        outer = self.path, self.calls
+        self.path, self.calls = path, []
+        self.statement(tree)
+        self.path, self.calls = outer
+
+    def stmt_ReturnNode(self, node):
+        value = node.value_node
+        if isinstance(value, FunctionCallNode) and value.name not in BUILTIN_FUNCTIONS:
+            # Tail call: the callee's frame replaces this one
+            self.calls.append((value.name, len(value.arg_nodes), value.pos))
+            self.emit(R_TAIL_CALL, None, value.name, self.call_registers(value))
+            return
+        register = self.expression(value)
+        self.release(register)
+        self.emit(R_RETURN, register)
+
+def compile_source(source, path=None, loader=None):
+    #Lexer -> Parser -> RegisterCompiler; returns (code, functions, main). Imports resolve
+    #relative to path.
+    compiler = RegisterCompiler(loader, path)
+    return compiler.compile_program(Parser(Lexer(source).iter_tokens(), keep_tokens=False).parse(), source)
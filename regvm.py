@@ -0,0 +1,112 @@
+# regvm.py
+
+from opcodes import REG_OPCODE_NAMES
+from output import BufferedSink
+from arrays import NovaArray, BUILTIN_FUNCTIONS, index_value
+from linker import link_register_calls
+
+
+class RegisterVM:
+    #Executes register code from regcompiler.py. The current frame is a flat list of registers
+    #(self.regs); a call pushes (return ip, caller registers, destination register) and gives
+    #the callee a fresh copy of its register template, with the arguments in the first registers.
+    #Deep recursion grows call_stack, not the Python stack. Calls are linked when the VM is
+    #built (linker.link_register_calls), so a call neither looks up nor checks its callee.
+    def __init__(self, code, functions, main, output=None):
+        self.code = link_register_calls(code, functions)
+        self.functions = functions
+        self.regs = list(main['template'])
+        self.call_stack = []
+        self.ip = 0
+        self.handlers = [getattr(self, f'op_{name.lower()}') for name in REG_OPCODE_NAMES]
+        self.output = output if output is not None else BufferedSink()
+        self.write = self.output.write
+
+    def run(self):
+        try:
+            self.execute()
+        finally:
+            self.output.flush()
+
+    def execute(self):
+        code, handlers = self.code, self.handlers
+        end = len(code)
+        while self.ip < end:
+            opcode, a, b, c = code[self.ip]
+            self.ip += 1
+            handlers[opcode](a, b, c)
+
+    def op_move(self, a, b, c): self.regs[a] = self.regs[b]
+
+    def op_add(self, a, b, c): regs = self.regs; regs[a] = regs[b] + regs[c]
+    def op_sub(self, a, b, c): regs = self.regs; regs[a] = regs[b] - regs[c]
+    def op_mul(self, a, b, c): regs = self.regs; regs[a] = regs[b] * regs[c]
+    def op_div(self, a, b, c): regs = self.regs; regs[a] = regs[b] / regs[c]
+
+    def op_compare_eq(self, a, b, c): regs = self.regs; regs[a] = regs[b] == regs[c]
+    def op_compare_ne(self, a, b, c): regs = self.regs; regs[a] = regs[b] != regs[c]
+    def op_compare_lt(self, a, b, c): regs = self.regs; regs[a] = regs[b] < regs[c]
+    def op_compare_gt(self, a, b, c): regs = self.regs; regs[a] = regs[b] > regs[c]
+
+    def op_check(self, a, b, c):
+        if self.regs[a] is None: raise NameError(f"Variable '{b}' is not defined.")
+
+    def op_jump(self, a, b, c): self.ip = c
+
+    def op_jump_if_false(self, a, b, c):
+        if not self.regs[a]: self.ip = c
+
+    def op_jump_unless_eq(self, a, b, c):
+        regs = self.regs
+        if not regs[a] == regs[b]: self.ip = c
+    def op_jump_unless_ne(self, a, b, c):
+        regs = self.regs
+        if not regs[a] != regs[b]: self.ip = c
+    def op_jump_unless_lt(self, a, b, c):
+        regs = self.regs
+        if not regs[a] < regs[b]: self.ip = c
+    def op_jump_unless_gt(self, a, b, c):
+        regs = self.regs
+        if not regs[a] > regs[b]: self.ip = c
+
+    def op_print(self, a, b, c): self.write(self.regs[a])
+
+    # Unlinked calls: the callee was not defined when the code was linked
+    def op_call(self, a, b, c): raise NameError(f"Function '{b}' is not defined.")
+    def op_tail_call(self, a, b, c): raise NameError(f"Function '{b}' is not defined.")
+
+    def callee_registers(self, template, arg_registers):
+        #A fresh register file from the callee's template, arguments in place
+        regs, callee = self.regs, list(template)
+        for i, register in enumerate(arg_registers):
+            callee[i] = regs[register]
+        return callee
+
+    def op_call_linked(self, a, b, c):
+        start_pos, template = b
+        callee = self.callee_registers(template, c)
+        self.call_stack.append((self.ip, self.regs, a))
+        self.regs = callee
+        self.ip = start_pos
+
+    def op_tail_call_linked(self, a, b, c):
+        start_pos, template = b
+        self.regs = self.callee_registers(template, c)
+        self.ip = start_pos
+
+    def op_return(self, a, b, c):
+        value = self.regs[a]
+        if not self.call_stack:
+            # return at the top level ends the program
+            self.ip = len(self.code)
+            return
+        self.ip, self.regs, dst = self.call_stack.pop()
+        self.regs[dst] = value
+
+    def op_build_array(self, a, b, c):
+        regs = self.regs
+        regs[a] = NovaArray.from_values([regs[register] for register in b])
+
+    def op_index(self, a, b, c): regs = self.regs; regs[a] = index_value(regs[b], regs[c])
+
+    def op_builtin(self, a, b, c): regs = self.regs; regs[a] = BUILTIN_FUNCTIONS[b](regs[c])
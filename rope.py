@@ -0,0 +1,75 @@
+# rope.py
+
+# Lazy string concatenation. `let s = s + piece` in a loop copies the whole string on every
+# iteration when strings are plain str. Once a concatenation result reaches MIN_ROPE_LENGTH
+# characters the VM produces a Rope instead: a list of pieces that later concatenations append
+# to, flattened into one str (and cached) only when the value is printed, compared, hashed,
+# indexed, measured or returned to Python (VM.call / invoke). Building an n-character string
+# from k pieces costs O(n + k).
+#
+# Ropes are immutable values like str. A rope is a prefix of a piece list that may be shared:
+# appending to the newest rope on a list extends it in place, appending to an older one copies
+# its prefix first, so `let a = s + "x"` and `let b = s + "y"` stay independent.
+
+# Shorter concatenation results are plain str: copying them is cheaper than a Rope
+MIN_ROPE_LENGTH = 256
+
+
+class Rope:
+    __slots__ = ('parts', 'count', 'length', 'flat')
+
+    def __init__(self, parts, count, length):
+        self.parts = parts      # shared piece list, this rope is parts[:count]
+        self.count = count
+        self.length = length
+        self.flat = None        # the flattened str once computed
+
+    def __str__(self):
+        if self.flat is None: self.flat = ''.join(self.parts[:self.count])
+        return self.flat
+
+    def __repr__(self): return repr(str(self))
+    def __len__(self): return self.length
+    def __sizeof__(self): return object.__sizeof__(self) + self.length + 8 * self.count
+    def __hash__(self): return hash(str(self))
+    def __getitem__(self, index): return str(self)[index]
+
+    def append(self, text):
+        #A new Rope for self + text, text a str
+        if self.flat is not None: return Rope([self.flat, text], 2, self.length + len(text))
+        parts = self.parts
+        if len(parts) != self.count: parts = parts[:self.count]
+        parts.append(text)
+        return Rope(parts, self.count + 1, self.length + len(text))
+
+    def __add__(self, other):
+        if type(other) is str: return self.append(other)
+        if type(other) is Rope: return self.append(str(other))
+        # Anything else fails (or succeeds) exactly as it would with a str
+        return str(self) + other
+
+    def __radd__(self, other):
+        if type(other) is str: return Rope([other], 1, len(other)).append(str(self))
+        return other + str(self)
+
+    # Python reflects comparisons itself: "a" < rope calls rope.__gt__("a"). Strings of
+    # different lengths are unequal without flattening.
+    def __eq__(self, other):
+        if type(other) in STRING_TYPES and len(other) != self.length: return False
+        return str(self) == text_of(other)
+    def __ne__(self, other):
+        if type(other) in STRING_TYPES and len(other) != self.length: return True
+        return str(self) != text_of(other)
+    def __lt__(self, other): return str(self) < text_of(other)
+    def __gt__(self, other): return str(self) > text_of(other)
+
+def text_of(value):
+    return str(value) if type(value) is Rope else value
+
+def concat(left, right):
+    #left + right for str operands: a str while short, a Rope from MIN_ROPE_LENGTH characters
+    if len(left) + len(right) < MIN_ROPE_LENGTH: return left + right
+    return Rope([left, right], 2, len(left) + len(right))
+
+# Operand types of string concatenation
+STRING_TYPES = frozenset((str, Rope))
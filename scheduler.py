@@ -0,0 +1,68 @@
+# scheduler.py
+
+import asyncio
+from collections import deque
+
+# Instructions a VM may execute before it yields to the next one
+DEFAULT_SLICE = 1000
+
+
+class Task:
+    #One Nova program under a Scheduler
+    __slots__ = ('name', 'vm', 'done', 'error', 'slices')
+
+    def __init__(self, name, vm):
+        self.name = name
+        self.vm = vm
+        self.done = False
+        self.error = None       # the exception that stopped the program, if any
+        self.slices = 0
+
+    def __repr__(self):
+        state = 'failed' if self.error else 'done' if self.done else 'running'
+        return f"Task({self.name}, {state})"
+
+class Scheduler:
+    #Round-robin green threads: every VM runs for one slice of instructions in turn, all on the
+    #calling thread. A runtime error finishes only the task that raised it.
+    def __init__(self, slice_size=DEFAULT_SLICE):
+        self.slice_size = slice_size
+        self.ready = deque()
+        self.tasks = []
+
+    def spawn(self, vm, name=None):
+        task = Task(name if name is not None else f'task-{len(self.tasks)}', vm)
+        self.tasks.append(task)
+        self.ready.append(task)
+        return task
+
+    def step(self):
+        #Runs one slice of the next ready task; returns False when no task is left
+        if not self.ready: return False
+        task = self.ready.popleft()
+        try:
+            task.done = task.vm.run_slice(self.slice_size)
+        except Exception as e:
+            task.done, task.error = True, e
+        task.slices += 1
+        if not task.done: self.ready.append(task)
+        return True
+
+    def run(self):
+        #Runs every task to completion and returns the task list
+        while self.step(): pass
+        return self.tasks
+
+    async def run_async(self, slices_per_yield=1):
+        #Like run(), but hands control back to the event loop every `slices_per_yield` slices,
+        #so the scripts share the thread with the loop's network I/O
+        while self.ready:
+            for _ in range(slices_per_yield):
+                if not self.step(): break
+            await asyncio.sleep(0)
+        return self.tasks
+
+async def run_vm(vm, slice_size=DEFAULT_SLICE):
+    #Runs one VM as an asyncio coroutine, yielding to the event loop after every slice
+    while not vm.run_slice(slice_size):
+        await asyncio.sleep(0)
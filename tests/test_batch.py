@@ -0,0 +1,44 @@
+# tests/test_batch.py
+
+import os
+
+import pytest
+
+import batch
+from batch import run_batch, run_file, summarize
+
+def crashing_run_file(path, **options):
+    # Stands in for run_file in the workers: kills the process the way a crash in native code would
+    if os.path.basename(path) == 'crash.nova': os._exit(3)
+    return run_file(path, **options)
+
+def scripts(tmp_path, count):
+    paths = []
+    for k in range(count):
+        path = tmp_path / f's{k}.nova'
+        path.write_text(f'print {k} * 2\n', encoding='utf-8')
+        paths.append(str(path))
+    return paths
+
+def test_batch_runs_every_script(tmp_path):
+    paths = scripts(tmp_path, 4)
+    (tmp_path / 'bad.nova').write_text('print nope(1)\n', encoding='utf-8')
+    results = {os.path.basename(result['path']): result for result in run_batch(paths + [str(tmp_path / 'bad.nova')], jobs=2)}
+    assert [results[f's{k}.nova']['output'] for k in range(4)] == ['0\n', '2\n', '4\n', '6\n']
+    assert results['bad.nova']['error'].startswith('Compile Error')
+    assert summarize(list(results.values()), 1.0)['failed'] == 1
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_crashed_worker_fails_only_its_script(tmp_path, monkeypatch, jobs):
+    monkeypatch.setattr(batch, 'run_file', crashing_run_file)
+    crash = tmp_path / 'crash.nova'
+    crash.write_text('print 1\n', encoding='utf-8')
+    paths = scripts(tmp_path, 6)
+    # Queued before, with and after the crashing script
+    results = list(run_batch(paths[:1] + [str(crash)] + paths[1:], jobs=jobs))
+    assert sorted(result['path'] for result in results) == sorted(paths + [str(crash)])
+    failed = [result for result in results if not result['ok']]
+    assert [result['path'] for result in failed] == [str(crash)]
+    assert failed[0]['error'].startswith('Worker Error: BrokenProcessPool')
+    outputs = {result['path']: result['output'] for result in results if result['ok']}
+    assert outputs == {path: f'{k * 2}\n' for k, path in enumerate(paths)}
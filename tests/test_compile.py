@@ -0,0 +1,114 @@
+# tests/test_compile.py
+
+import os
+
+import pytest
+
+from cache import compile_source, load_program, read_cache, cache_path, source_hash, ModuleLoader
+from incremental import IncrementalCompiler
+from linker import LinkError
+from regcompiler import compile_source as compile_registers
+from vm import VM
+from output import CollectorSink
+
+SOURCE = '''fun square(n) {
+    return n * n
+}
+fun total(n, acc) {
+    if n == 0 {
+        return acc
+    }
+    return total(n - 1, acc + square(n))
+}
+let x = 3
+print total(x, 0)
+fun shout(s) {
+    return s + "!"
+}
+print shout("hi")
+'''
+
+EDITS = [
+    # Same length body change
+    ('return n * n', 'return n + n'),
+    # Longer function: everything after it moves
+    ('return n + n', 'let m = n * n\n    return m * n'),
+    # Top-level code between functions
+    ('let x = 3', 'let x = 4\nprint x'),
+    # New function at the front, called further down
+    ('fun square(n)', 'fun twice(n) {\n    return n * 2\n}\nfun square(n)'),
+    ('print shout("hi")', 'print shout("hi")\nprint twice(x)'),
+    # Shorter function in the middle
+    ('    return s + "!"', '    return s'),
+]
+
+
+def output_of(program):
+    output = CollectorSink()
+    VM(*program, output=output).run()
+    return output.getvalue()
+
+
+def test_incremental_compile_matches_full_compile():
+    compiler = IncrementalCompiler()
+    source = SOURCE
+    assert compiler.compile(source) == compile_source(source)
+    for old, new in EDITS:
+        assert old in source
+        source = source.replace(old, new)
+        program = compiler.compile(source)
+        assert compiler.reused, (old, new)
+        assert program == compile_source(source), (old, new)
+        assert output_of(program) == output_of(compile_source(source))
+
+def test_incremental_compile_reports_the_line_of_a_bad_call():
+    compiler = IncrementalCompiler()
+    compiler.compile(SOURCE)
+    with pytest.raises(LinkError, match=r"'missing' is not defined \(line 16\)"):
+        compiler.compile(SOURCE + 'print missing(1)\n')
+    with pytest.raises(LinkError, match=r"'square' takes 1 arguments, got 2 \(line 2\)"):
+        compiler.compile('fun f(n) {\n    return square(n, n)\n}\n' + SOURCE)
+
+
+@pytest.mark.parametrize('compile', [compile_source, compile_registers])
+def test_check_calls_reports_line(compile):
+    source = 'fun f(a, b) {\n    return a + b\n}\n\nprint f(1)\n'
+    with pytest.raises(LinkError, match=r"'f' takes 2 arguments, got 1 \(line 5\)"):
+        compile(source)
+    with pytest.raises(LinkError, match=r"'g' is not defined \(line 3\)"):
+        compile('print 1\nlet x = 2\nprint g(x)\n')
+
+def test_check_calls_accepts_calls_to_later_functions():
+    program = compile_source('print f(2)\nfun f(n) {\n    return n + 1\n}\n')
+    assert output_of(program) == '3\n'
+
+
+def write(path, text):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+def test_cache_is_invalidated_by_a_changed_dependency(tmp_path):
+    lib, main = tmp_path / 'lib.nova', tmp_path / 'main.nova'
+    write(lib, 'fun value() {\n    return 1\n}\n')
+    write(main, 'import lib\nprint value()\n')
+    source = main.read_text(encoding='utf-8')
+    program = load_program(str(main), source, loader=ModuleLoader())
+    assert output_of(program) == '1\n'
+    cached = read_cache(cache_path(str(main)), source_hash(source))
+    assert cached is not None and str(lib) in cached[3]
+
+    # The importing script did not change, but the module it links in did
+    write(lib, 'fun value() {\n    return 22\n}\n')
+    assert read_cache(cache_path(str(main)), source_hash(source)) is None
+    program = load_program(str(main), source, loader=ModuleLoader())
+    assert output_of(program) == '22\n'
+    assert read_cache(cache_path(str(main)), source_hash(source)) is not None
+
+def test_cache_is_invalidated_by_a_removed_dependency(tmp_path):
+    lib, main = tmp_path / 'lib.nova', tmp_path / 'main.nova'
+    write(lib, 'fun value() {\n    return 1\n}\n')
+    write(main, 'import lib\nprint value()\n')
+    source = main.read_text(encoding='utf-8')
+    load_program(str(main), source, loader=ModuleLoader())
+    os.remove(lib)
+    assert read_cache(cache_path(str(main)), source_hash(source)) is None
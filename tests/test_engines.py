@@ -0,0 +1,159 @@
+# tests/test_engines.py
+# Differential tests: every engine must print the same output for the same program
+
+import glob
+import os
+
+import pytest
+
+from cache import compile_source
+from vm import VM
+from image import PackedVM, pack_program, unpack
+from interpreter import ClosureCompiler
+from lexer import Lexer
+from parser import Parser
+from regcompiler import compile_source as compile_registers
+from regvm import RegisterVM
+from output import CollectorSink
+
+EXAMPLES = sorted(glob.glob(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'examples', '*.nova')))
+
+RECURSION = '''
+fun fib(n) {
+    if n < 2 {
+        return n
+    }
+    return fib(n - 1) + fib(n - 2)
+}
+fun count(n, acc) {
+    if n == 0 {
+        return acc
+    }
+    return count(n - 1, acc + 1)
+}
+fun depth(n) {
+    if n == 0 {
+        return 0
+    }
+    return 1 + depth(n - 1)
+}
+fun even(n) {
+    if n == 0 {
+        return true
+    }
+    return odd(n - 1)
+}
+fun odd(n) {
+    if n == 0 {
+        return false
+    }
+    return even(n - 1)
+}
+print fib(15)
+print count(20000, 0)
+print depth(3000)
+print even(1001)
+'''
+
+STRINGS = '''
+fun greet(name) {
+    return "hello " + name
+}
+let report = ""
+let i = 0
+while i < 300 {
+    let report = report + "row;"
+    let i = i + 1
+}
+print report == ""
+print len(report)
+print greet("nova")
+print greet("a" + "b") == "hello ab"
+let mixed = 1 + 2
+print mixed
+'''
+
+ARRAYS = '''
+fun total(xs) {
+    return sum(xs)
+}
+let xs = range(50)
+let ys = xs * 3 - 7
+print ys[10]
+print total(xs * ys)
+print min(ys) + max(ys)
+print sum(xs > 25)
+print len([1, 2, 3])
+print [10, 20, 30][1]
+'''
+
+# Expression statements: the value of a bare call must not change what the caller computes
+EFFECTS = '''
+fun g() {
+    return 1
+}
+fun h() {
+    g()
+    2 + g()
+    return 10
+}
+let i = 0
+while i < 4 {
+    print 100 + h()
+    let i = i + 1
+}
+'''
+
+PROGRAMS = {'recursion': RECURSION, 'strings': STRINGS, 'arrays': ARRAYS, 'effects': EFFECTS}
+PROGRAMS.update((os.path.basename(path), open(path, encoding='utf-8').read()) for path in EXAMPLES)
+
+
+def run_vm(source, **options):
+    output = CollectorSink()
+    VM(*compile_source(source), output=output, **options).run()
+    return output.getvalue()
+
+def run_packed(source):
+    output = CollectorSink()
+    PackedVM(*unpack(pack_program(*compile_source(source))).program(), output=output).run()
+    return output.getvalue()
+
+def run_register(source):
+    output = CollectorSink()
+    RegisterVM(*compile_registers(source), output).run()
+    return output.getvalue()
+
+def run_closure(source):
+    output = CollectorSink()
+    ClosureCompiler(output).compile_program(Parser(Lexer(source).iter_tokens(), keep_tokens=False).parse())()
+    return output.getvalue()
+
+ENGINES = {
+    'vm_plain': lambda source: run_vm(source, memo_size=0, tier_threshold=0),
+    # Low tier thresholds, so functions tier up while the program runs
+    'vm_native': lambda source: run_vm(source, tier_threshold=1),
+    'vm_native_memo': lambda source: run_vm(source, tier_threshold=2),
+    'vm_native_plain': lambda source: run_vm(source, memo_size=0, tier_threshold=2),
+    'packed': run_packed,
+    'register': run_register,
+    'closure': run_closure,
+}
+
+
+@pytest.mark.parametrize('name', sorted(PROGRAMS))
+@pytest.mark.parametrize('engine', sorted(ENGINES))
+def test_engine_matches_vm(engine, name):
+    source = PROGRAMS[name]
+    assert ENGINES[engine](source) == run_vm(source)
+
+def test_examples_found():
+    assert EXAMPLES
+
+def test_effects_program_output():
+    assert run_vm(EFFECTS) == '110\n' * 4
+
+def test_native_tier_translates_expression_statements():
+    vm = VM(*compile_source(EFFECTS), output=CollectorSink(), memo_size=0, tier_threshold=2)
+    vm.run()
+    assert {'g', 'h'} <= vm.native.keys()
+    assert vm.output.getvalue() == '110\n' * 4
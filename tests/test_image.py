@@ -0,0 +1,83 @@
+# tests/test_image.py
+# Packed images: written to a file, mapped back and run in place, and rejected when damaged
+
+import pytest
+
+from cache import compile_source
+from compiler import COMPILER_VERSION
+from image import (ImageError, IMAGE_HEADER, IMAGE_MAGIC, IMAGE_VERSION, PackedVM, PackedCode, load_image,
+                   pack_program, write_image)
+from optimizer import Optimizer
+from vm import VM
+from output import CollectorSink
+from test_engines import PROGRAMS
+
+def run(vm_class, program, **options):
+    output = CollectorSink()
+    vm_class(*program, output=output, **options).run()
+    return output.getvalue()
+
+@pytest.mark.parametrize('opt_level', [0, 2])
+@pytest.mark.parametrize('name', sorted(PROGRAMS))
+def test_load_image_runs_like_the_vm(tmp_path, name, opt_level):
+    program = compile_source(PROGRAMS[name], opt_level)
+    path = str(tmp_path / 'program.novai')
+    write_image(path, *program)
+    image = load_image(path)
+    try:
+        assert isinstance(image.code, PackedCode)
+        assert run(PackedVM, image.program()) == run(VM, program)
+        assert run(PackedVM, image.program(), memo_size=0, tier_threshold=0) == run(VM, program)
+    finally:
+        image.close()
+
+def test_image_decodes_to_the_compiled_program(tmp_path):
+    bytecode, functions, local_names = compile_source(PROGRAMS['recursion'])
+    bytecode, functions = Optimizer(2).optimize(bytecode, functions)
+    path = str(tmp_path / 'program.novai')
+    write_image(path, bytecode, functions, local_names)
+    image = load_image(path)
+    try:
+        assert list(image.code) == bytecode
+        assert image.functions == functions
+        assert image.local_names == local_names
+    finally:
+        image.close()
+
+def image_bytes():
+    return pack_program(*compile_source(PROGRAMS['recursion']))
+
+def write_bytes(tmp_path, data):
+    path = str(tmp_path / 'damaged.novai')
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+@pytest.mark.parametrize('size', [0, IMAGE_HEADER.size - 1, IMAGE_HEADER.size, IMAGE_HEADER.size + 8, -1])
+def test_truncated_image(tmp_path, size):
+    data = image_bytes()
+    path = write_bytes(tmp_path, data[:size])
+    with pytest.raises(ImageError, match='Truncated image'):
+        load_image(path)
+
+def test_bad_magic(tmp_path):
+    path = write_bytes(tmp_path, b'NOVC' + image_bytes()[len(IMAGE_MAGIC):])
+    with pytest.raises(ImageError, match='Not a Nova image'):
+        load_image(path)
+
+@pytest.mark.parametrize('version, compiler_version', [(IMAGE_VERSION + 1, COMPILER_VERSION),
+                                                       (IMAGE_VERSION, COMPILER_VERSION - 1)])
+def test_version_mismatch(tmp_path, version, compiler_version):
+    data = image_bytes()
+    magic, old_version, old_compiler_version, *rest = IMAGE_HEADER.unpack_from(data)
+    header = IMAGE_HEADER.pack(magic, version, compiler_version, *rest)
+    path = write_bytes(tmp_path, header + data[IMAGE_HEADER.size:])
+    with pytest.raises(ImageError, match='different Nova version'):
+        load_image(path)
+
+def test_corrupt_tables(tmp_path):
+    data = image_bytes()
+    # Overwrite the end of the last marshalled section, keeping the file length
+    path = write_bytes(tmp_path, data[:-4] + b'\xff\xff\xff\xff')
+    with pytest.raises(ImageError, match='Corrupt image'):
+        load_image(path)
@@ -0,0 +1,67 @@
+# tests/test_interpreter.py
+
+import sys
+
+import pytest
+
+import interpreter
+from interpreter import ClosureCompiler
+from lexer import Lexer
+from parser import Parser
+from cache import compile_source
+from vm import VM
+from limits import CallDepthExceeded, Limits
+from output import CollectorSink
+
+DEEP = '''
+fun down(n) {
+    if n < 1 {
+        return 0
+    }
+    return 1 + down(n - 1)
+}
+print down(DEPTH)
+'''
+
+
+def compile_closures(source):
+    output = CollectorSink()
+    return ClosureCompiler(output).compile_program(Parser(Lexer(source).iter_tokens(), keep_tokens=False).parse()), output
+
+def test_deep_recursion_restores_the_recursion_limit():
+    limit = sys.getrecursionlimit()
+    program, output = compile_closures(DEEP.replace('DEPTH', '20000'))
+    program()
+    assert output.getvalue() == '20000\n'
+    assert sys.getrecursionlimit() == limit
+
+def test_shallow_program_keeps_the_recursion_limit(monkeypatch):
+    limits = []
+    monkeypatch.setattr(sys, 'setrecursionlimit', limits.append)
+    program, output = compile_closures(DEEP.replace('DEPTH', '20'))
+    program()
+    assert output.getvalue() == '20\n' and limits == []
+
+def test_call_depth_error_matches_the_vm(monkeypatch):
+    monkeypatch.setattr(interpreter, 'MAX_CALL_DEPTH', 500)
+    limit = sys.getrecursionlimit()
+    program, output = compile_closures(DEEP.replace('DEPTH', '1000'))
+    with pytest.raises(CallDepthExceeded) as error:
+        program()
+    assert error.value.limit == 500
+    assert error.value.usage['call_depth'] == 501
+    assert sys.getrecursionlimit() == limit
+
+    source = DEEP.replace('DEPTH', '1000')
+    with pytest.raises(CallDepthExceeded) as vm_error:
+        VM(*compile_source(source), output=CollectorSink(), limits=Limits(call_depth=500)).run()
+    assert error.value.usage.keys() == vm_error.value.usage.keys()
+
+def test_program_can_run_again_after_a_depth_error(monkeypatch):
+    monkeypatch.setattr(interpreter, 'MAX_CALL_DEPTH', 100)
+    program, output = compile_closures(DEEP.replace('DEPTH', '200'))
+    with pytest.raises(CallDepthExceeded):
+        program()
+    monkeypatch.setattr(interpreter, 'MAX_CALL_DEPTH', 1000)
+    program()
+    assert output.getvalue() == '200\n'
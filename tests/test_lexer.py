@@ -0,0 +1,117 @@
+# tests/test_lexer.py
+# The regex scanner against the original character-at-a-time lexer: same tokens, same
+# positions (and so the same line numbers in errors), same failures at the same place
+
+import pytest
+
+from lexer import Lexer, KEYWORDS, TT_INT, TT_KEYWORD, TT_IDENTIFIER, TT_OPERATOR, TT_STRING, TT_EOF
+from linker import line_of
+
+PUNCTUATION = {'{': 'LBRACE', '}': 'RBRACE', '(': 'LPAREN', ')': 'RPAREN', ',': 'COMMA', '[': 'LBRACKET', ']': 'RBRACKET'}
+
+def reference_tokens(text):
+    #The baseline lexer's scanning rules, recording where each token starts. Returns
+    #([(type, value, pos)], error position or None)
+    tokens, pos, end = [], 0, len(text)
+    while pos < end:
+        char, start = text[pos], pos
+        if char.isspace():
+            pos += 1
+        elif text.startswith('//', pos):
+            while pos < end and text[pos] != '\n': pos += 1
+        elif char.isdigit():
+            while pos < end and text[pos].isdigit(): pos += 1
+            tokens.append((TT_INT, int(text[start:pos]), start))
+        elif char.isalpha():
+            while pos < end and text[pos].isalnum(): pos += 1
+            name = text[start:pos]
+            tokens.append((TT_KEYWORD if name in KEYWORDS else TT_IDENTIFIER, name, start))
+        elif char == '"':
+            pos += 1
+            while pos < end and text[pos] != '"': pos += 1
+            tokens.append((TT_STRING, text[start + 1:pos], start))
+            pos += 1
+        elif text.startswith('==', pos) or text.startswith('!=', pos):
+            tokens.append((TT_OPERATOR, text[pos:pos + 2], start))
+            pos += 2
+        elif char in '=+-*/<>':
+            tokens.append((TT_OPERATOR, char, start))
+            pos += 1
+        elif char in PUNCTUATION:
+            tokens.append((PUNCTUATION[char], char, start))
+            pos += 1
+        else:
+            return tokens, pos
+    tokens.append((TT_EOF, None, end))
+    return tokens, None
+
+def scan(text):
+    #Same shape as reference_tokens, from Lexer.iter_tokens
+    lexer, tokens = Lexer(text), []
+    try:
+        for token in lexer.iter_tokens():
+            tokens.append((token.type, token.value, token.pos))
+    except Exception as e:
+        assert str(e) == f"Invalid character: '{text[lexer.pos]}'"
+        return tokens, lexer.pos
+    return tokens, None
+
+SOURCES = {
+    'program': 'let x = 10\nif x > 5 {\n    print "big"\n} else {\n    print x - 1\n}\nprint f(x, [1, 2])[0]\n',
+    'operators': 'a==b!=c=d+e-f*g/h<i>j',
+    'string': 'print "hello world"',
+    'empty string': 'print ""\nprint 1',
+    'string with comment': 'print "a // b" // c\nprint 2',
+    'string with newlines': 'let s = "one\ntwo\nthree"\nprint s\nprint 3',
+    'string with braces': '"{ } ( ) [ ] ="x',
+    'adjacent strings': '"a""b"  "c"',
+    'unterminated string': 'print 1\nprint "runs to the end\nprint 2',
+    'lone quote': '"',
+    'comment': '// only a comment',
+    'comments': '// first\nlet a = 1 // trailing\n//\n// last',
+    'comment at end': 'print 1 //',
+    'division and comment': 'print 8 / 2 // 4\nprint 8/ /2',
+    'whitespace': ' \t\r\n let\t\ty =\r\n 3 \n',
+    'keywords': 'let if else print true false while fun return import lets iff x1 y2z',
+    'unicode names': 'let café = 1\nprint café',
+    'empty': '',
+    'bad character': 'let x = 1\nlet y = x @ 2\n',
+    'bad character first': '#comment',
+    'bang': 'print !x',
+    'underscore': 'let my_var = 1',
+    'dollar after string': 'print "a$b" $',
+    'bad character after comment': '// fine\n// still fine\n  ;',
+    'bad character in last line': 'print 1\nprint 2\nprint 3 % 2',
+}
+
+@pytest.mark.parametrize('name', sorted(SOURCES))
+def test_tokens_match_baseline(name):
+    text = SOURCES[name]
+    tokens, error = scan(text)
+    # Equal offsets give equal line numbers in every error that reports one
+    assert (tokens, error) == reference_tokens(text)
+
+def test_strings_and_comments():
+    tokens, error = scan('print "a // b" // c\nprint "x\ny" "')
+    assert error is None
+    assert [(kind, value, line_of('print "a // b" // c\nprint "x\ny" "', pos)) for kind, value, pos in tokens] == [
+        (TT_KEYWORD, 'print', 1), (TT_STRING, 'a // b', 1),
+        (TT_KEYWORD, 'print', 2), (TT_STRING, 'x\ny', 2), (TT_STRING, '', 3), (TT_EOF, None, 3)]
+
+@pytest.mark.parametrize('text, char, line', [
+    ('let x = 1\nlet y = x @ 2\n', '@', 2),
+    ('"ok" // fine\n\n  ;', ';', 3),
+    ('print "#" #', '#', 1),
+    ('print 1\nlet a_b = 2', '_', 2),
+])
+def test_invalid_character_position(text, char, line):
+    lexer = Lexer(text)
+    with pytest.raises(Exception, match=f"Invalid character: '{char}'"):
+        lexer.tokenize()
+    assert text[lexer.pos] == char
+    assert line_of(text, lexer.pos) == line
+
+def test_get_next_token_streams_to_eof():
+    lexer = Lexer('print 1')
+    kinds = [lexer.get_next_token().type for _ in range(4)]
+    assert kinds == [TT_KEYWORD, TT_INT, TT_EOF, TT_EOF]
@@ -0,0 +1,91 @@
+# tests/test_limits.py
+
+import pytest
+
+from cache import compile_source
+from vm import VM
+from limits import (Limits, CallDepthExceeded, InstructionLimitExceeded, StackLimitExceeded, MemoryLimitExceeded,
+                    TimeLimitExceeded, CHECK_INTERVAL)
+from profiler import Profiler
+from image import PackedVM, pack_program, unpack
+from output import CollectorSink
+
+DEEP = '''
+fun down(n) {
+    if n < 1 {
+        return 0
+    }
+    return 1 + down(n - 1)
+}
+print down(200)
+'''
+
+# 27 doublings: a 268M character string in far fewer instructions than one chunk
+DOUBLING = '''
+let s = "ab"
+let i = 0
+while i < 27 {
+    let s = s + s
+    let i = i + 1
+}
+print len(s)
+'''
+
+
+def run(source, **limits):
+    VM(*compile_source(source), output=CollectorSink(), limits=Limits(**limits)).run()
+
+def test_call_depth_error_counts_instructions_of_the_current_chunk():
+    with pytest.raises(CallDepthExceeded) as error:
+        run(DEEP, call_depth=50)
+    usage = error.value.usage
+    assert usage['call_depth'] == 50
+    assert 0 < usage['instructions'] < CHECK_INTERVAL
+    assert f"instructions={usage['instructions']}" in str(error.value)
+
+def test_instruction_limit_is_exact():
+    with pytest.raises(InstructionLimitExceeded) as error:
+        run(DEEP, instructions=500)
+    assert error.value.usage['instructions'] == 500
+
+def test_stack_limit_message_names_the_check_interval():
+    with pytest.raises(StackLimitExceeded, match=f'checked between {CHECK_INTERVAL}-instruction chunks'):
+        run(DEEP, stack=20)
+
+def test_limits_reject_a_profiler():
+    with pytest.raises(Exception, match='both limited and profiled'):
+        VM(*compile_source(DEEP), profiler=Profiler(), limits=Limits(instructions=10))
+
+def test_program_within_limits_runs():
+    output = CollectorSink()
+    VM(*compile_source(DEEP), output=output, limits=Limits(instructions=10000, call_depth=300, stack=1000)).run()
+    assert output.getvalue() == '200\n'
+
+def test_string_growth_is_stopped_inside_a_chunk():
+    with pytest.raises(MemoryLimitExceeded) as error:
+        run(DOUBLING, memory=1_000_000)
+    assert error.value.usage['instructions'] < CHECK_INTERVAL
+
+def test_time_limit_is_checked_after_allocations():
+    with pytest.raises(TimeLimitExceeded):
+        run(DOUBLING, seconds=0.001)
+
+def test_range_is_refused_before_allocating():
+    source = 'let r = range(30000000)\nprint len(r)\n'
+    with pytest.raises(MemoryLimitExceeded) as error:
+        run(source, memory=1_000_000)
+    assert error.value.usage['memory'] < 1_000_000
+    packed = PackedVM(*unpack(pack_program(*compile_source(source))).program(), limits=Limits(memory=1_000_000))
+    with pytest.raises(MemoryLimitExceeded):
+        packed.run()
+
+def test_repetition_is_checked():
+    with pytest.raises(MemoryLimitExceeded) as error:
+        run('let s = "ab" * 5000000\nprint len(s)\n', memory=1_000_000)
+    assert error.value.usage['instructions'] == 2
+
+def test_short_program_is_checked_when_it_ends():
+    # Each array fits, both together do not, and the program ends within its first chunk
+    with pytest.raises(MemoryLimitExceeded):
+        run('let a = range(5000)\nlet b = range(5000)\nprint 1\n', memory=60_000)
+    run('let a = range(5000)\nprint 1\n', memory=60_000)
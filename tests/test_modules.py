@@ -0,0 +1,118 @@
+# tests/test_modules.py
+# import on every engine: the stack VM links modules as bytecode, the register VM and the
+# closure engine compile them in from their source
+
+import pytest
+
+from cache import load_program, read_cache, cache_path, source_hash, ModuleLoader
+from vm import VM
+from image import PackedVM, pack_program, unpack
+from interpreter import ClosureCompiler
+from lexer import Lexer
+from parser import Parser
+from regcompiler import compile_source as compile_registers
+from regvm import RegisterVM
+from output import CollectorSink
+
+UTIL = '''fun twice(n) {
+    return n * 2
+}
+'''
+
+LIB = '''import util
+fun quad(n) {
+    return twice(twice(n))
+}
+'''
+
+MAIN = '''import lib
+import util
+print quad(3)
+print twice(5)
+'''
+
+def write(path, text):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+def run_vm(path, source, loader):
+    output = CollectorSink()
+    VM(*load_program(path, source, loader=loader), output=output).run()
+    return output.getvalue()
+
+def run_packed(path, source, loader):
+    output = CollectorSink()
+    PackedVM(*unpack(pack_program(*load_program(path, source, loader=loader))).program(), output=output).run()
+    return output.getvalue()
+
+def run_register(path, source, loader):
+    output = CollectorSink()
+    RegisterVM(*compile_registers(source, path, loader), output).run()
+    return output.getvalue()
+
+def run_closure(path, source, loader):
+    output = CollectorSink()
+    ClosureCompiler(output, loader, path).compile_program(Parser(Lexer(source).iter_tokens()).parse())()
+    return output.getvalue()
+
+ENGINES = {'vm': run_vm, 'packed': run_packed, 'register': run_register, 'closure': run_closure}
+
+def run(engine, path, loader=None):
+    with open(path, 'r', encoding='utf-8') as f:
+        source = f.read()
+    return ENGINES[engine](str(path), source, loader if loader is not None else ModuleLoader())
+
+@pytest.fixture
+def program(tmp_path):
+    write(tmp_path / 'util.nova', UTIL)
+    write(tmp_path / 'lib.nova', LIB)
+    write(tmp_path / 'main.nova', MAIN)
+    return tmp_path / 'main.nova'
+
+@pytest.mark.parametrize('engine', sorted(ENGINES))
+def test_nested_imports(engine, program):
+    assert run(engine, program) == '12\n10\n'
+
+@pytest.mark.parametrize('engine', sorted(ENGINES))
+def test_missing_module(engine, tmp_path):
+    write(tmp_path / 'main.nova', 'import nothere\n')
+    with pytest.raises(Exception, match="Module 'nothere' not found"):
+        run(engine, tmp_path / 'main.nova')
+
+@pytest.mark.parametrize('engine', sorted(ENGINES))
+def test_circular_import(engine, tmp_path):
+    write(tmp_path / 'a.nova', 'import b\nfun fa() {\n    return 1\n}\n')
+    write(tmp_path / 'b.nova', 'import a\nfun fb() {\n    return 2\n}\n')
+    write(tmp_path / 'main.nova', 'import a\nprint fa()\n')
+    with pytest.raises(Exception, match='Circular import'):
+        run(engine, tmp_path / 'main.nova')
+
+@pytest.mark.parametrize('engine', sorted(ENGINES))
+def test_bad_call_in_a_module(engine, tmp_path):
+    write(tmp_path / 'lib.nova', 'fun f(n) {\n    return g(n)\n}\n')
+    write(tmp_path / 'main.nova', 'import lib\nprint f(1)\n')
+    with pytest.raises(Exception, match="'g'"):
+        run(engine, tmp_path / 'main.nova')
+
+@pytest.mark.parametrize('engine', sorted(ENGINES))
+def test_changed_module_is_reloaded(engine, program):
+    # One loader for both runs, as in a long-lived process
+    loader = ModuleLoader()
+    assert run(engine, program, loader) == '12\n10\n'
+    write(program.parent / 'util.nova', UTIL.replace('n * 2', 'n * 3 + 0'))
+    assert run(engine, program, loader) == '27\n15\n'
+
+def test_cache_is_invalidated_through_nested_imports(program):
+    source = program.read_text(encoding='utf-8')
+    digest = source_hash(source)
+    assert run('vm', program) == '12\n10\n'
+    cached = read_cache(cache_path(str(program)), digest)
+    assert cached is not None and str(program.parent / 'util.nova') in cached[3]
+    assert read_cache(cache_path(str(program.parent / 'lib.nova')), source_hash(LIB)) is not None
+
+    # Only the module two imports down changes: the script's and lib's caches are both stale
+    write(program.parent / 'util.nova', UTIL.replace('n * 2', 'n * 3 + 0'))
+    assert read_cache(cache_path(str(program)), digest) is None
+    assert read_cache(cache_path(str(program.parent / 'lib.nova')), source_hash(LIB)) is None
+    assert run('vm', program) == '27\n15\n'
+    assert read_cache(cache_path(str(program)), digest) is not None
@@ -0,0 +1,129 @@
+# tests/test_optimizer.py
+# Each pass on small hand-written bytecode, then whole programs at every level
+
+import pytest
+
+from cache import compile_source
+from optimizer import Optimizer, MAX_FOLDED_STRING
+from opcodes import (OP_PUSH, OP_ADD, OP_MUL, OP_DIV, OP_COMPARE_LT, OP_JUMP, OP_JUMP_IF_FALSE, OP_LOAD_LOCAL,
+                     OP_PRINT, OP_RETURN)
+from vm import VM
+from output import CollectorSink
+from test_engines import PROGRAMS
+
+def function(start):
+    return {'start_pos': start, 'args': ['n'], 'locals': ['n']}
+
+# Constant folding
+
+def test_fold_binary_operations():
+    code = [(OP_PUSH, 1), (OP_PUSH, 2), (OP_ADD, None), (OP_PUSH, 3), (OP_MUL, None),
+            (OP_PUSH, 10), (OP_COMPARE_LT, None), (OP_PRINT, None)]
+    assert Optimizer().fold_constants(code, {}) == [(OP_PUSH, True), (OP_PRINT, None)]
+
+@pytest.mark.parametrize('left, right, opcode', [(1, 0, OP_DIV), ('a', 1, OP_ADD), ('x' * MAX_FOLDED_STRING, 'y', OP_ADD)])
+def test_fold_leaves_runtime_operations(left, right, opcode):
+    # Division by zero and type errors must happen at run time; long strings stay unbuilt
+    code = [(OP_PUSH, left), (OP_PUSH, right), (opcode, None), (OP_PRINT, None)]
+    assert Optimizer().fold_constants(code, {}) == code
+
+def test_fold_stops_at_jump_targets():
+    # if x { 1 } else { 2 } + 10: the ADD's left operand is not always the PUSH before it
+    code = [(OP_LOAD_LOCAL, 0), (OP_JUMP_IF_FALSE, 4), (OP_PUSH, 1), (OP_JUMP, 5),
+            (OP_PUSH, 2), (OP_PUSH, 10), (OP_ADD, None), (OP_PRINT, None)]
+    assert Optimizer().fold_constants(list(code), {}) == code
+
+def test_fold_stops_at_function_entries():
+    code = [(OP_PUSH, 1), (OP_PUSH, 2), (OP_ADD, None), (OP_RETURN, None)]
+    functions = {'f': function(1)}
+    assert Optimizer().fold_constants(list(code), functions) == code
+    assert functions['f']['start_pos'] == 1
+
+def test_fold_constant_conditions():
+    # false: the condition becomes a JUMP; true: condition and branch disappear
+    code = [(OP_PUSH, False), (OP_JUMP_IF_FALSE, 4), (OP_PUSH, 'a'), (OP_PRINT, None),
+            (OP_PUSH, 1), (OP_JUMP_IF_FALSE, 8), (OP_PUSH, 'b'), (OP_PRINT, None),
+            (OP_PUSH, 'c'), (OP_PRINT, None)]
+    assert Optimizer().fold_constants(code, {}) == [
+        (OP_JUMP, 3), (OP_PUSH, 'a'), (OP_PRINT, None),
+        (OP_PUSH, 'b'), (OP_PRINT, None), (OP_PUSH, 'c'), (OP_PRINT, None)]
+
+def test_fold_relocates_jumps_and_functions():
+    code = [(OP_PUSH, 1), (OP_PUSH, 2), (OP_ADD, None), (OP_PRINT, None), (OP_JUMP, 7),
+            (OP_LOAD_LOCAL, 0), (OP_RETURN, None), (OP_PUSH, 'end'), (OP_PRINT, None)]
+    functions = {'f': function(5)}
+    assert Optimizer().fold_constants(code, functions) == [
+        (OP_PUSH, 3), (OP_PRINT, None), (OP_JUMP, 5),
+        (OP_LOAD_LOCAL, 0), (OP_RETURN, None), (OP_PUSH, 'end'), (OP_PRINT, None)]
+    assert functions['f']['start_pos'] == 3
+
+# Jump threading
+
+def test_thread_jumps_follows_chains():
+    code = [(OP_LOAD_LOCAL, 0), (OP_JUMP_IF_FALSE, 3), (OP_JUMP, 4), (OP_JUMP, 2),
+            (OP_JUMP, 6), (OP_PRINT, None), (OP_PUSH, 'end'), (OP_PRINT, None)]
+    Optimizer().thread_jumps(code)
+    assert code[1] == (OP_JUMP_IF_FALSE, 6)
+    assert code[2:5] == [(OP_JUMP, 6), (OP_JUMP, 6), (OP_JUMP, 6)]
+
+def test_thread_jumps_stops_on_cycles():
+    code = [(OP_JUMP, 1), (OP_JUMP, 0)]
+    Optimizer().thread_jumps(code)
+    assert code == [(OP_JUMP, 1), (OP_JUMP, 0)]
+
+def test_thread_jumps_to_the_end():
+    code = [(OP_JUMP, 1), (OP_JUMP, 2)]
+    Optimizer().thread_jumps(code)
+    assert code == [(OP_JUMP, 2), (OP_JUMP, 2)]
+
+# Dead code removal
+
+def test_remove_unreachable_code_relocates_later_jumps():
+    code = [(OP_LOAD_LOCAL, 0), (OP_JUMP_IF_FALSE, 6), (OP_PUSH, 'a'), (OP_PRINT, None), (OP_JUMP, 8),
+            (OP_PRINT, None), (OP_PUSH, 'b'), (OP_PRINT, None), (OP_PUSH, 'c'), (OP_PRINT, None)]
+    assert Optimizer().remove_dead_code(code, {}) == [
+        (OP_LOAD_LOCAL, 0), (OP_JUMP_IF_FALSE, 5), (OP_PUSH, 'a'), (OP_PRINT, None), (OP_JUMP, 7),
+        (OP_PUSH, 'b'), (OP_PRINT, None), (OP_PUSH, 'c'), (OP_PRINT, None)]
+
+def test_remove_jumps_to_the_next_instruction():
+    # After the dead PRINT goes, the JUMP over it lands on the next instruction and goes too
+    code = [(OP_PUSH, 1), (OP_JUMP, 3), (OP_PRINT, None), (OP_PRINT, None)]
+    assert Optimizer().remove_dead_code(code, {}) == [(OP_PUSH, 1), (OP_PRINT, None)]
+
+def test_remove_dead_code_keeps_functions_and_moves_their_entry():
+    # The jump over the function body stays; the code after its RETURN is dropped
+    code = [(OP_JUMP, 5), (OP_LOAD_LOCAL, 0), (OP_RETURN, None), (OP_PUSH, 'dead'), (OP_PRINT, None),
+            (OP_PUSH, 'x'), (OP_JUMP, 8), (OP_PUSH, 'dead'), (OP_PRINT, None)]
+    functions = {'f': function(1)}
+    assert Optimizer().remove_dead_code(code, functions) == [
+        (OP_JUMP, 3), (OP_LOAD_LOCAL, 0), (OP_RETURN, None), (OP_PUSH, 'x'), (OP_PRINT, None)]
+    assert functions['f']['start_pos'] == 1
+
+def test_remove_dead_code_moves_entry_after_removed_code():
+    code = [(OP_PUSH, 1), (OP_RETURN, None), (OP_PRINT, None), (OP_LOAD_LOCAL, 0), (OP_RETURN, None)]
+    functions = {'f': function(3)}
+    assert Optimizer().remove_dead_code(code, functions) == [
+        (OP_PUSH, 1), (OP_RETURN, None), (OP_LOAD_LOCAL, 0), (OP_RETURN, None)]
+    assert functions['f']['start_pos'] == 2
+
+# Levels and whole programs
+
+def test_optimize_leaves_its_inputs_alone():
+    code = [(OP_PUSH, 1), (OP_PUSH, 2), (OP_ADD, None), (OP_JUMP, 4), (OP_PRINT, None)]
+    functions = {'f': function(4)}
+    for level in (0, 1, 2):
+        Optimizer(level).optimize(code, functions)
+    assert code == [(OP_PUSH, 1), (OP_PUSH, 2), (OP_ADD, None), (OP_JUMP, 4), (OP_PRINT, None)]
+    assert functions['f']['start_pos'] == 4
+    assert Optimizer(0).optimize(code, functions) == (code, functions)
+
+def run(source, opt_level):
+    output = CollectorSink()
+    VM(*compile_source(source, opt_level), output=output).run()
+    return output.getvalue()
+
+@pytest.mark.parametrize('level', [1, 2])
+@pytest.mark.parametrize('name', sorted(PROGRAMS))
+def test_optimized_programs_print_the_same(name, level):
+    source = PROGRAMS[name]
+    assert run(source, level) == run(source, 0)
@@ -0,0 +1,59 @@
+# tests/test_scheduler.py
+
+from cache import compile_source
+from vm import VM
+from scheduler import Scheduler
+from output import CollectorSink
+
+# spin() is hot enough to tier up at the threshold below, and no call repeats an argument, so
+# none is a memo hit; each call runs ~9 instructions a round
+HOT = '''
+fun spin(n) {
+    let i = 0
+    while i < n {
+        let i = i + 1
+    }
+    return i
+}
+let k = 0
+while k < 5 {
+    print spin(5000 + k)
+    let k = k + 1
+}
+'''
+
+QUICK = '''
+let j = 0
+while j < 50 {
+    let j = j + 1
+}
+print j
+'''
+
+
+def make_vm(source):
+    return VM(*compile_source(source), output=CollectorSink(), tier_threshold=2)
+
+def test_slices_stay_bounded_when_a_function_is_hot():
+    scheduler = Scheduler(slice_size=100)
+    hot = scheduler.spawn(make_vm(HOT), 'hot')
+    quick = scheduler.spawn(make_vm(QUICK), 'quick')
+    scheduler.run()
+    assert hot.error is None and quick.error is None
+    assert hot.vm.output.getvalue() == '5000\n5001\n5002\n5003\n5004\n'
+    assert quick.vm.output.getvalue() == '50\n'
+    # Every spin() round was interpreted and counted: none ran as one native call
+    assert not hot.vm.native
+    assert hot.slices > 5 * 5000 * 9 // 100
+    # The quick task got its turns while the hot one was still running
+    assert quick.slices < 10
+
+def test_round_robin_interleaves_tasks():
+    scheduler = Scheduler(slice_size=10)
+    tasks = [scheduler.spawn(make_vm(QUICK)) for _ in range(3)]
+    order = []
+    while scheduler.ready:
+        order.append(scheduler.ready[0].name)
+        scheduler.step()
+    assert order[:6] == ['task-0', 'task-1', 'task-2'] * 2
+    assert all(task.done and task.error is None for task in tasks)
@@ -0,0 +1,178 @@
+# tests/test_vm.py
+
+import pytest
+
+from cache import compile_source
+from vm import VM, GENERIC
+from image import PackedVM, pack_program, unpack
+from opcodes import (OP_ADD, OP_SUB, OP_COMPARE_LT, OP_COMPARE_GT, OP_ADD_INT, OP_ADD_STR, OP_SUB_INT,
+                     OP_COMPARE_LT_INT, OP_COMPARE_GT_INT, OP_CALL, OP_TAIL_CALL, OP_CALL_LINKED,
+                     OP_TAIL_CALL_LINKED)
+from arrays import NovaArray
+from linker import LinkError
+from output import CollectorSink
+
+BINARY = '''
+fun add(a, b) {
+    return a + b
+}
+fun sub(a, b) {
+    return a - b
+}
+fun less(a, b) {
+    return a < b
+}
+fun greater(a, b) {
+    return a > b
+}
+'''
+
+CALLS = '''
+fun double(n) {
+    return n * 2
+}
+fun triple(n) {
+    return n * 3
+}
+fun apply(n) {
+    return double(n) + 1
+}
+fun loop(n, acc) {
+    if n == 0 {
+        return acc
+    }
+    return loop(n - 1, acc + double(n))
+}
+'''
+
+
+def make_vm(source, **options):
+    # Memo caches and the native tier would answer calls without running the bytecode
+    options.setdefault('memo_size', 0)
+    options.setdefault('tier_threshold', 0)
+    return VM(*compile_source(source), output=CollectorSink(), **options)
+
+def instruction(vm, generic_opcode):
+    #The executing form of the one `generic_opcode` instruction in the program
+    positions = [i for i, (opcode, arg) in enumerate(vm.bytecode) if opcode == generic_opcode]
+    assert len(positions) == 1
+    return vm.code[positions[0]]
+
+
+@pytest.mark.parametrize('name, generic, specialized, first, second, expected', [
+    ('add', OP_ADD, OP_ADD_INT, (1, 2), ('a', 'b'), 'ab'),
+    ('add', OP_ADD, OP_ADD_STR, ('a', 'b'), (1, 2), 3),
+    ('sub', OP_SUB, OP_SUB_INT, (5, 3), (2.5, 1), 1.5),
+    ('less', OP_COMPARE_LT, OP_COMPARE_LT_INT, (1, 2), ('b', 'a'), False),
+    ('greater', OP_COMPARE_GT, OP_COMPARE_GT_INT, (1, 2), ('b', 'a'), True),
+])
+def test_quickening_deoptimizes_on_new_operand_types(name, generic, specialized, first, second, expected):
+    vm = make_vm(BINARY)
+    assert instruction(vm, generic) == (generic, None)
+    vm.call(name, *first)
+    assert instruction(vm, generic) == (specialized, None)
+    assert vm.call(name, *second) == expected
+    assert instruction(vm, generic) == (generic, GENERIC)
+    # Generic for good: the first operand types are still handled
+    vm.call(name, *first)
+    assert instruction(vm, generic) == (generic, GENERIC)
+
+def test_quickening_keeps_generic_form_for_unspecialized_types():
+    vm = make_vm(BINARY)
+    assert vm.call('add', 1.5, 2) == 3.5
+    assert instruction(vm, OP_ADD) == (OP_ADD, GENERIC)
+
+def test_add_str_flattens_ropes_for_python():
+    vm = make_vm(BINARY)
+    value = vm.call('add', 'x' * 5000, 'y' * 5000)
+    assert type(value) is str and value == 'x' * 5000 + 'y' * 5000
+
+def test_quickening_specializes_array_operands_generically():
+    vm = make_vm(BINARY)
+    result = vm.call('sub', NovaArray.from_values([3, 4]), 1)
+    assert list(result) == [2, 3]
+    assert instruction(vm, OP_SUB) == (OP_SUB, GENERIC)
+
+def test_calls_are_linked_when_the_vm_is_built():
+    vm = make_vm(CALLS)
+    calls = [vm.code[i] for i, (opcode, arg) in enumerate(vm.bytecode) if opcode in (OP_CALL, OP_TAIL_CALL)]
+    assert calls and all(opcode in (OP_CALL_LINKED, OP_TAIL_CALL_LINKED) for opcode, site in calls)
+    assert {site.name for opcode, site in calls} == {'double', 'loop'}
+    site = next(site for opcode, site in calls if site.name == 'double')
+    assert site.start_pos == vm.functions['double']['start_pos'] and site.nargs == 1
+    assert vm.call('apply', 4) == 9
+    assert vm.call('loop', 3, 0) == 12
+
+@pytest.mark.parametrize('options', [{}, {'memo_size': 64, 'tier_threshold': 1}])
+def test_invalidate_call_caches_relinks_changed_functions(options):
+    vm = make_vm(CALLS, **options)
+    for _ in range(3): assert vm.call('apply', 4) == 9
+    vm.functions['double'] = vm.functions['triple']
+    vm.invalidate_call_caches()
+    assert vm.call('apply', 4) == 13
+    assert vm.call('loop', 3, 0) == 18
+
+def test_invalidate_call_caches_unlinks_removed_functions():
+    vm = make_vm(CALLS)
+    assert vm.call('apply', 1) == 3
+    del vm.functions['double']
+    vm.invalidate_call_caches()
+    with pytest.raises(NameError, match="'double'"):
+        vm.call('apply', 1)
+
+@pytest.mark.parametrize('packed', [False, True])
+def test_relinking_checks_argument_counts(packed):
+    program = compile_source(CALLS)
+    if packed: vm = PackedVM(*unpack(pack_program(*program)).program(), output=CollectorSink())
+    else: vm = VM(*program, output=CollectorSink())
+    assert vm.call('apply', 4) == 9
+    vm.functions['double'] = vm.functions['loop']
+    with pytest.raises(LinkError, match="'double' takes 2 arguments, got 1"):
+        vm.invalidate_call_caches()
+    # Nothing was relinked
+    assert vm.call('apply', 4) == 9
+    vm.functions['double'] = vm.functions['triple']
+    vm.invalidate_call_caches()
+    assert vm.call('apply', 4) == 13
+
+def test_packed_vm_links_one_call_site_per_name():
+    vm = PackedVM(*unpack(pack_program(*compile_source(CALLS + 'print len([apply(1)])\n'))).program(),
+                  output=CollectorSink(), memo_size=0, tier_threshold=0)
+    sites = {entry: site for entry, site in zip(vm.names, vm.call_sites) if site is not None}
+    assert set(sites) == {('double', 1), ('loop', 2), ('apply', 1)}
+    assert vm.call_sites[vm.names.index('len')] is None
+    assert sites['double', 1].start_pos == vm.functions['double']['start_pos']
+    vm.run()
+    assert vm.output.getvalue() == '1\n'
+    assert vm.call('apply', 4) == 9
+    vm.functions['double'] = vm.functions['triple']
+    vm.invalidate_call_caches()
+    assert vm.call('apply', 4) == 13
+    del vm.functions['double']
+    vm.invalidate_call_caches()
+    with pytest.raises(NameError, match="'double'"):
+        vm.call('apply', 4)
+
+LEAK = '''
+fun g() {
+    return 1
+}
+fun h() {
+    g()
+    return 10
+}
+let i = 0
+while i < 4 {
+    print 100 + h()
+    let i = i + 1
+}
+'''
+
+@pytest.mark.parametrize('options', [{}, {'memo_size': 0, 'tier_threshold': 0}])
+def test_expression_statement_value_is_popped(options):
+    # The value of the bare g() used to stay on the stack, under h's result, so memo hits
+    # (which push only the result) printed something else than executed calls
+    vm = VM(*compile_source(LEAK), output=CollectorSink(), **options)
+    vm.run()
+    assert vm.output.getvalue() == '110\n' * 4
+    assert vm.stack == []
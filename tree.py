@@ -1,78 +1,119 @@
-class NumberNode:
+class Node:
+    #Base class for AST nodes. Every node declares __slots__ (no per-instance
+    #__dict__), and token_fields names the slots that hold lexer Tokens.
+    __slots__ = ()
+    token_fields = ()
+
+    def drop_tokens(self):
+        #Releases the Token objects; the node keeps its values and source offset (pos)
+        for field in self.token_fields:
+            setattr(self, field, None)
+
+class NumberNode(Node):
     #Represents an integer number in the AST
+    __slots__ = ('token', 'value', 'pos')
+    token_fields = ('token',)
+
     def __init__(self, token):
         self.token = token
         self.value = token.value
+        self.pos = token.pos
 
     def __repr__(self):
         return f"NumberNode({self.value})"
 
-class StringNode:
+class StringNode(Node):
     #Represents a string literal in the AST
+    __slots__ = ('token', 'value', 'pos')
+    token_fields = ('token',)
+
     def __init__(self, token):
         self.token = token
         self.value = token.value
+        self.pos = token.pos
 
     def __repr__(self):
         return f'StringNode("{self.value}")'
-        
-class BoolNode:
+
+class BoolNode(Node):
     """Represents a boolean literal i"""
+    __slots__ = ('token', 'value', 'pos')
+    token_fields = ('token',)
+
     def __init__(self, token):
         self.token = token
         self.value = token.value == 'true'
+        self.pos = token.pos
 
     def __repr__(self):
         return f"BoolNode({self.value})"
 
-class VarAccessNode:
+class VarAccessNode(Node):
     """Represents accessing the value of a variable."""
+    __slots__ = ('token', 'name', 'pos')
+    token_fields = ('token',)
+
     def __init__(self, token):
         self.token = token
         self.name = token.value
+        self.pos = token.pos
 
     def __repr__(self):
         return f"VarAccessNode({self.name})"
 
-class VarAssignNode:
+class VarAssignNode(Node):
     #variable declaraton
+    __slots__ = ('name_token', 'value_node', 'name', 'pos')
+    token_fields = ('name_token',)
+
     def __init__(self, name_token, value_node):
         self.name_token = name_token
         self.value_node = value_node
         self.name = name_token.value
+        self.pos = name_token.pos
 
     def __repr__(self):
         return f"VarAssignNode({self.name}, {self.value_node})"
 
-class BinOpNode:
+class BinOpNode(Node):
     # a binary operation
+    __slots__ = ('left_node', 'op_token', 'right_node', 'op', 'pos')
+    token_fields = ('op_token',)
+
     def __init__(self, left_node, op_token, right_node):
         self.left_node = left_node
         self.op_token = op_token
         self.right_node = right_node
         self.op = op_token.value
+        self.pos = op_token.pos
 
     def __repr__(self):
         return f"({self.left_node} {self.op} {self.right_node})"
 
-class PrintNode:
+class PrintNode(Node):
     # a print statement
+    __slots__ = ('value_node',)
+
     def __init__(self, value_node):
         self.value_node = value_node
 
     def __repr__(self):
         return f"PrintNode({self.value_node})"
 
-class StatementsNode:
+class StatementsNode(Node):
     #a block of statements, like in an if/else body."""
+    __slots__ = ('statements',)
+
     def __init__(self):
         self.statements = []
 
     def __repr__(self):
         return f"StatementsNode([\n  " + ",\n  ".join(map(str, self.statements)) + "\n])"
 
-class IfNode:
-    # if-else 
+class IfNode(Node):
+    # if-else
+    __slots__ = ('condition_node', 'if_body_node', 'else_body_node')
+
     def __init__(self, condition_node, if_body_node, else_body_node=None):
         self.condition_node = condition_node
         self.if_body_node = if_body_node
@@ -82,8 +123,10 @@ class IfNode:
         else_str = f", else={self.else_body_node}" if self.else_body_node else ""
         return f"IfNode(if={self.condition_node}, then={self.if_body_node}{else_str})"
 
-class WhileNode:
+class WhileNode(Node):
     #a while loop
+    __slots__ = ('condition_node', 'body_node')
+
     def __init__(self, condition_node, body_node):
         self.condition_node = condition_node
         self.body_node = body_node
@@ -91,14 +134,59 @@ class WhileNode:
     def __repr__(self):
         return f"WhileNode(while={self.condition_node}, do={self.body_node})"
 
-class FunctionDefNode:
-    def __init__(self, name_token, arg_name_tokens, body_node): self.name_token, self.arg_name_tokens, self.body_node, self.name = name_token, arg_name_tokens, body_node, name_token.value
-    def __repr__(self): return f"FunctionDefNode(name={self.name}, args={[t.value for t in self.arg_name_tokens]}, body={self.body_node})"
+class FunctionDefNode(Node):
+    __slots__ = ('name_token', 'arg_name_tokens', 'body_node', 'name', 'arg_names', 'pos')
+    token_fields = ('name_token', 'arg_name_tokens')
+    def __init__(self, name_token, arg_name_tokens, body_node): self.name_token, self.arg_name_tokens, self.body_node, self.name, self.arg_names, self.pos = name_token, arg_name_tokens, body_node, name_token.value, [t.value for t in arg_name_tokens], name_token.pos
+    def __repr__(self): return f"FunctionDefNode(name={self.name}, args={self.arg_names}, body={self.body_node})"
 
-class FunctionCallNode:
-    def __init__(self, name_token, arg_nodes): self.name_token, self.arg_nodes, self.name = name_token, arg_nodes, name_token.value
+class FunctionCallNode(Node):
+    __slots__ = ('name_token', 'arg_nodes', 'name', 'pos')
+    token_fields = ('name_token',)
+    def __init__(self, name_token, arg_nodes): self.name_token, self.arg_nodes, self.name, self.pos = name_token, arg_nodes, name_token.value, name_token.pos
     def __repr__(self): return f"FunctionCallNode(name={self.name}, args={self.arg_nodes})"
 
-class ReturnNode:
+class ReturnNode(Node):
+    __slots__ = ('value_node',)
     def __init__(self, value_node): self.value_node = value_node
-    def __repr__(self): return f"ReturnNode({self.value_node})"
\ No newline at end of file
+    def __repr__(self): return f"ReturnNode({self.value_node})"
+
+class ArrayNode(Node):
+    #an array literal [a, b, c]
+    __slots__ = ('token', 'element_nodes', 'pos')
+    token_fields = ('token',)
+
+    def __init__(self, token, element_nodes):
+        self.token = token
+        self.element_nodes = element_nodes
+        self.pos = token.pos
+
+    def __repr__(self):
+        return f"ArrayNode({self.element_nodes})"
+
+class IndexNode(Node):
+    #indexing: target[index]
+    __slots__ = ('target_node', 'token', 'index_node', 'pos')
+    token_fields = ('token',)
+
+    def __init__(self, target_node, token, index_node):
+        self.target_node = target_node
+        self.token = token
+        self.index_node = index_node
+        self.pos = token.pos
+
+    def __repr__(self):
+        return f"IndexNode({self.target_node}[{self.index_node}])"
+
+class ImportNode(Node):
+    #import name: links in the functions of the module name.nova
+    __slots__ = ('name_token', 'name', 'pos')
+    token_fields = ('name_token',)
+
+    def __init__(self, name_token):
+        self.name_token = name_token
+        self.name = name_token.value
+        self.pos = name_token.pos
+
+    def __repr__(self):
+        return f"ImportNode({self.name})"
@@ -1,59 +1,520 @@
+import sys
+from array import array
+from collections import OrderedDict
+from time import perf_counter
+
+from opcodes import (OPCODE_NAMES, OP_ADD, OP_SUB, OP_MUL, OP_DIV, OP_COMPARE_LT, OP_COMPARE_GT, OP_CALL,
+                     OP_CALL_LINKED, OP_BUILD_ARRAY, OP_BUILTIN, OP_ADD_STR, SPECIALIZATIONS)
+from purity import find_pure_functions, call_graph, callers_of
+from native import translate_function, undefined, NativeCompileError
+from output import BufferedSink
+from arrays import NovaArray, BUILTIN_FUNCTIONS, INT_TYPECODE, index_value
+from rope import Rope, concat, text_of, STRING_TYPES
+from linker import LinkError, link_calls
+from limits import (CHECK_INTERVAL, MEMORY_CHECK_RATIO, ResourceLimitExceeded, InstructionLimitExceeded,
+                    CallDepthExceeded, StackLimitExceeded, MemoryLimitExceeded, TimeLimitExceeded,
+                    approximate_memory)
+
+# Default number of cached results kept per pure function (0 disables memoization)
+DEFAULT_MEMO_SIZE = 4096
+# Calls after which a function is translated to native Python code (0 disables the native tier)
+DEFAULT_TIER_THRESHOLD = 1000
+# Native functions nested deeper than this are interpreted instead, so deep Nova recursion
+# grows call_stack rather than the Python stack
+MAX_NATIVE_DEPTH = 64
+
+MISSING = object()
+# Argument of a binary instruction whose operand types did not match any specialization;
+# it stays generic and is not specialized again
+GENERIC = 'generic'
+# Under memory or time limits, instructions that can build a large value in one step are
+# checked right after they run (see VM.allocation_limited)
+ALLOCATING_OPCODES = (OP_ADD, OP_ADD_STR, OP_SUB, OP_MUL, OP_DIV, OP_BUILD_ARRAY, OP_BUILTIN)
+SIZED_TYPES = (str, Rope, NovaArray)
+RANGE_ITEM_BYTES = array(INT_TYPECODE).itemsize
+
 
 class Frame:
-    #single function call frame
-    def __init__(self, return_ip):
+    #single function call frame; locals are a fixed-size list indexed by slot
+    __slots__ = ('return_ip', 'names', 'locals', 'memo')
+
+    def __init__(self, return_ip, names, locals):
         self.return_ip = return_ip
-        self.variables = {}
+        self.names = names      # slot -> variable name, for error messages
+        self.locals = locals
+        self.memo = None        # (MemoCache, key) when the return value should be cached
+
+class MemoCache:
+    #Bounded LRU cache of call results for one pure function
+    def __init__(self, size):
+        self.size = size
+        self.results = OrderedDict()
+        self.hits = self.misses = 0
+
+    def lookup(self, key):
+        value = self.results.get(key, MISSING)
+        if value is MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.results.move_to_end(key)
+        return value
+
+    def store(self, key, value):
+        self.results[key] = value
+        if len(self.results) > self.size: self.results.popitem(last=False)
 
 class VM:
-    def __init__(self, bytecode, functions):
+    def __init__(self, bytecode, functions, local_names=(), memo_size=DEFAULT_MEMO_SIZE,
+                 tier_threshold=DEFAULT_TIER_THRESHOLD, profiler=None, output=None, limits=None):
         self.bytecode = bytecode
+        # Execution runs on a private copy that is rewritten in place: calls are linked to their
+        # callee when the VM is built (see linker.py), and binary operations specialize to the
+        # operand types they see (quickening). Analyses (purity, the native tier) read the
+        # unmodified self.bytecode.
+        self.code = self.executable_code(bytecode)
         self.functions = functions
+        # The function table as last linked, to tell which entries a host changed
+        self.linked_functions = dict(functions)
         self.stack = []
         self.ip = 0
-        self.call_stack = [Frame(return_ip=len(bytecode))]
+        self.call_stack = [Frame(len(bytecode), local_names, [None] * len(local_names))]
+        # Dispatch table indexed by opcode, built once per VM
+        self.handlers = [getattr(self, f'op_{name.lower()}') for name in OPCODE_NAMES]
+        # Result caches for functions without side effects, by function name
+        self.memo_size = memo_size
+        self.memo = {}
+        if memo_size:
+            self.memo = {name: MemoCache(memo_size) for name in find_pure_functions(bytecode, functions)}
+        self.link()
+        # Native tier: per-function call counts and the compiled Python functions
+        self.tier_threshold = tier_threshold
+        self.call_counts = {}
+        self.native = {}
+        self.native_depth = 0
+        # Optional limits.Limits, enforced by execute_limited(); usage counters of the current execution
+        self.limits = limits
+        self.executed = 0
+        self.started = None
+        self.memory_check_at = 0
+        if limits is not None:
+            if profiler is not None: raise Exception("A VM cannot be both limited and profiled")
+            # Native code runs outside the instruction loop, where no limit can be checked
+            self.tier_threshold = 0
+            if limits.call_depth is not None:
+                for opcode in (OP_CALL, OP_CALL_LINKED):
+                    self.handlers[opcode] = self.depth_limited(self.handlers[opcode])
+            if limits.memory is not None or limits.seconds is not None:
+                for opcode in ALLOCATING_OPCODES:
+                    self.handlers[opcode] = self.allocation_limited(self.handlers[opcode], opcode == OP_BUILTIN)
+        # Optional profiler.Profiler; when set, run() executes through its instrumented loop
+        self.profiler = profiler
+        # PRINT destination (output.BufferedSink on stdout by default), flushed when a run ends
+        self.output = output if output is not None else BufferedSink()
+        self.write = self.output.write
 
     def current_frame(self): return self.call_stack[-1]
 
+    def executable_code(self, bytecode):
+        #The instruction sequence execute() runs: a private, rewritable copy
+        return list(bytecode)
+
+    def call_target(self, arg):
+        #Function name of a CALL / TAIL_CALL argument, before or after linking
+        return arg[0] if type(arg) is tuple else arg.name
+
+    def builtin_name(self, arg): return arg
+
+    def link(self):
+        #Links every call in self.code to its callee's CallSite
+        link_calls(self.code, self.functions, self.memo)
+
+    def invalidate_call_caches(self):
+        #Call after changing self.functions (adding, replacing or removing entries). Purity is
+        #recomputed; memo caches, native code and call counts are dropped for the changed
+        #functions and every function calling them, whose results or translation may differ;
+        #then every call site is relinked. Raises LinkError, leaving the VM as it was, if a call
+        #no longer passes its callee's argument count.
+        old, new = self.linked_functions, self.functions
+        changed = {name for name in old.keys() | new.keys() if old.get(name) is not new.get(name)}
+        callees, impure = call_graph(self.bytecode, new)
+        stale = callers_of(callees, changed)
+        memo = {}
+        if self.memo_size:
+            for name in find_pure_functions(self.bytecode, new):
+                cache = self.memo.get(name)
+                memo[name] = cache if cache is not None and name not in stale else MemoCache(self.memo_size)
+        old_memo, self.memo = self.memo, memo
+        try:
+            self.link()
+        except LinkError:
+            self.memo = old_memo
+            raise
+        for name in stale:
+            self.native.pop(name, None)
+            self.call_counts.pop(name, None)
+        self.linked_functions = dict(new)
+
+    def memo_stats(self):
+        return {name: {'hits': cache.hits, 'misses': cache.misses, 'entries': len(cache.results)}
+                for name, cache in self.memo.items()}
+
+    def tier_up(self, name):
+        #Compiles a hot function to native Python code; untranslatable functions stay interpreted
+        try:
+            source = translate_function(self.bytecode, self.functions, name)
+        except NativeCompileError:
+            return
+        namespace = {'_invoke': self.invoke, '_print': self.write, '_undefined': undefined,
+                     '_array': NovaArray.from_values, '_index': index_value, '_builtins': BUILTIN_FUNCTIONS}
+        exec(compile(source, f'<nova native {name}>', 'exec'), namespace)
+        self.native[name] = namespace[f'nova_{name}']
+
+    def call_native(self, native, args):
+        self.native_depth += 1
+        try:
+            return native(*args)
+        finally:
+            self.native_depth -= 1
+
+    def invoke(self, name, args):
+        #Calls a Nova function on behalf of native code (or call()) and returns its result;
+        #a Rope is flattened, so no Rope reaches Python code
+        func_info = self.functions.get(name)
+        if not func_info: raise NameError(f"Function '{name}' is not defined.")
+        value, memo = self.call_shortcut(name, list(args), self.memo.get(name))
+        if value is MISSING:
+            value = self.run_nested(func_info, list(args))
+            if memo is not None: memo[0].store(memo[1], value)
+        return text_of(value)
+
+    def reset(self):
+        #Drops the operand stack and every frame above the top-level one, e.g. after a call
+        #failed halfway; memo caches, call counts and native code are kept
+        del self.stack[:]
+        del self.call_stack[1:]
+        self.ip = len(self.bytecode)
+        self.native_depth = 0
+
+    def call(self, name, *args):
+        #Calls a Nova function from Python and returns its result. The VM is reusable: each
+        #call starts from a clean stack, so a failed call does not affect the next one.
+        func_info = self.functions.get(name)
+        if not func_info: raise NameError(f"Function '{name}' is not defined.")
+        if len(args) != len(func_info['args']):
+            raise Exception(f"Function '{name}' takes {len(func_info['args'])} arguments, got {len(args)}")
+        self.reset()
+        self.start_usage()
+        try:
+            return self.invoke(name, args)
+        finally:
+            self.output.flush()
+
+    def run_nested(self, func_info, args):
+        #Interprets one call to completion: the frame returns to the end of the bytecode,
+        #which stops execute(), and the caller's ip is restored afterwards
+        saved_ip = self.ip
+        args.extend([None] * (len(func_info['locals']) - len(args)))
+        self.call_stack.append(Frame(len(self.bytecode), func_info['locals'], args))
+        self.ip = func_info['start_pos']
+        self.execute()
+        self.ip = saved_ip
+        return self.stack.pop()
+
     def run(self):
-        while self.ip < len(self.bytecode):
-            opcode, arg = self.bytecode[self.ip]
+        #Runs to the end of the bytecode, then flushes the output sink
+        self.start_usage()
+        try:
+            self.execute()
+        finally:
+            self.output.flush()
+
+    def execute(self):
+        if self.limits is not None: return self.execute_limited()
+        if self.profiler is not None: return self.profiler.run(self)
+        bytecode, handlers = self.code, self.handlers
+        end = len(bytecode)
+        while self.ip < end:
+            opcode, arg = bytecode[self.ip]
             self.ip += 1
+            handlers[opcode](arg)
 
-            if opcode == 'PUSH': self.stack.append(arg)
-            
-            elif opcode == 'ADD': right, left = self.stack.pop(), self.stack.pop(); self.stack.append(left + right)
-            elif opcode == 'SUB': right, left = self.stack.pop(), self.stack.pop(); self.stack.append(left - right)
-            elif opcode == 'MUL': right, left = self.stack.pop(), self.stack.pop(); self.stack.append(left * right)
-            elif opcode == 'DIV': right, left = self.stack.pop(), self.stack.pop(); self.stack.append(left / right)
-            elif opcode == 'COMPARE':
-                right, left = self.stack.pop(), self.stack.pop()
-                if arg == '==': self.stack.append(left == right)
-                elif arg == '!=': self.stack.append(left != right)
-                elif arg == '<': self.stack.append(left < right)
-                elif arg == '>': self.stack.append(left > right)
-            elif opcode == 'JUMP': self.ip = arg
-            elif opcode == 'JUMP_IF_FALSE':
-                if not self.stack.pop(): self.ip = arg
-            elif opcode == 'STORE':
-                self.current_frame().variables[arg] = self.stack.pop()
-            elif opcode == 'LOAD':
-                value = self.current_frame().variables.get(arg)
-                if value is None: raise NameError(f"Variable '{arg}' is not defined.")
-                self.stack.append(value)
-            elif opcode == 'PRINT': print(self.stack.pop())
-            elif opcode == 'CALL':
-                func_info = self.functions.get(arg)
-                if not func_info: raise NameError(f"Function '{arg}' is not defined.")
-                new_frame = Frame(return_ip=self.ip)
-                for i in range(len(func_info['args'])):
-                    new_frame.variables[func_info['args'][-(i+1)]] = self.stack.pop()
-                self.call_stack.append(new_frame)
-                self.ip = func_info['start_pos']
-            elif opcode == 'RETURN':
-                return_value = self.stack.pop()
-                frame = self.call_stack.pop()
-                self.ip = frame.return_ip
-                self.stack.append(return_value)
+    def run_chunk(self, budget):
+        #Executes at most `budget` instructions and returns how many ran
+        bytecode, handlers = self.code, self.handlers
+        end = len(bytecode)
+        left = budget
+        try:
+            while left and self.ip < end:
+                opcode, arg = bytecode[self.ip]
+                self.ip += 1
+                handlers[opcode](arg)
+                left -= 1
+        finally:
+            # Read by execute_limited() when the chunk fails
+            self.chunk_ran = budget - left
+        return budget - left
+
+    def run_slice(self, budget):
+        #Executes at most `budget` instructions and returns True once the program has finished,
+        #so a scheduler can interleave many VMs. A call served by a memo cache counts as a single
+        #instruction. Limits apply to all slices together.
+        if self.tier_threshold or self.native:
+            # A native call, and every interpreted call it makes (run_nested), would run to its
+            # end as one instruction, so a sliced VM interprets everything
+            self.tier_threshold = 0
+            self.native.clear()
+        try:
+            if self.limits is None:
+                self.run_chunk(budget)
+            else:
+                if self.started is None: self.start_usage()
+                self.execute_limited(budget)
+        except Exception:
+            self.output.flush()
+            raise
+        if self.ip < len(self.code): return False
+        self.output.flush()
+        return True
+
+    def start_usage(self):
+        #Starts the usage counters of a new execution (run() or call())
+        self.executed = 0
+        self.started = perf_counter()
+        self.memory_check_at = 0
+
+    def usage(self):
+        #Resource usage of the current execution. Instructions are only counted under limits;
+        #memory is the approximate_memory() estimate.
+        memory, scanned = approximate_memory(self.stack, self.call_stack)
+        return {'instructions': self.executed, 'call_depth': len(self.call_stack) - 1, 'stack': len(self.stack),
+                'memory': memory, 'seconds': perf_counter() - self.started if self.started is not None else 0.0}
+
+    def execute_limited(self, budget=None):
+        #execute() (or run_slice()'s loop when given a budget) in chunks of at most
+        #CHECK_INTERVAL instructions, checking the limits before each one
+        end = len(self.code)
+        while self.ip < end and budget != 0:
+            chunk = self.check_limits()
+            if budget is not None and budget < chunk: chunk = budget
+            try:
+                ran = self.run_chunk(chunk)
+            except Exception as e:
+                self.executed += self.chunk_ran
+                if isinstance(e, ResourceLimitExceeded) and e.usage is None: e.usage = self.usage()
+                raise
+            self.executed += ran
+            if budget is not None: budget -= ran
+        # A program shorter than a chunk is checked too
+        if self.ip >= end: self.check_limits(final=True)
+
+    def check_limits(self, final=False):
+        #Raises the ResourceLimitExceeded of the first exceeded limit, otherwise returns how many
+        #instructions may run before the next check. The final check, once the code has run to
+        #its end, scans memory whatever the scan rate and has no instructions left to limit.
+        limits, chunk = self.limits, CHECK_INTERVAL
+        if limits.instructions is not None and not final:
+            left = limits.instructions - self.executed
+            if left <= 0: raise InstructionLimitExceeded(limits.instructions, self.usage())
+            if left < chunk: chunk = left
+        if limits.stack is not None and len(self.stack) > limits.stack:
+            raise StackLimitExceeded(limits.stack, self.usage())
+        if limits.seconds is not None and perf_counter() - self.started > limits.seconds:
+            raise TimeLimitExceeded(limits.seconds, self.usage())
+        if limits.memory is not None and (final or self.executed >= self.memory_check_at):
+            memory, scanned = approximate_memory(self.stack, self.call_stack)
+            if memory > limits.memory: raise MemoryLimitExceeded(limits.memory, self.usage())
+            self.memory_check_at = self.executed + max(CHECK_INTERVAL, scanned * MEMORY_CHECK_RATIO)
+        return chunk
+
+    def depth_limited(self, handler):
+        #Wraps a CALL handler with the exact call depth check
+        call_stack, limit = self.call_stack, self.limits.call_depth
+        def call(arg):
+            # Usage is filled in by execute_limited(), which knows the chunk's instruction count
+            if len(call_stack) > limit: raise CallDepthExceeded(limit)
+            handler(arg)
+        return call
+
+    def allocation_limited(self, handler, builtin=False):
+        #Wraps the handler of an instruction that can build a large string or array in one step,
+        #checking its result against the memory limit and the clock right away. range(n) is
+        #refused before it allocates.
+        stack, limits = self.stack, self.limits
+        def run(arg):
+            if (builtin and self.builtin_name(arg) == 'range' and limits.memory is not None and type(stack[-1]) is int
+                    and stack[-1] * RANGE_ITEM_BYTES > limits.memory):
+                raise MemoryLimitExceeded(limits.memory)
+            handler(arg)
+            value = stack[-1]
+            if limits.memory is not None and type(value) in SIZED_TYPES and sys.getsizeof(value) > limits.memory:
+                raise MemoryLimitExceeded(limits.memory)
+            if limits.seconds is not None and perf_counter() - self.started > limits.seconds:
+                raise TimeLimitExceeded(limits.seconds)
+        return run
+
+    def op_push(self, arg): self.stack.append(arg)
+
+    def specialize(self, opcode, left, right):
+        #Rewrites the executing binary instruction for the operand types it just saw
+        specialized = SPECIALIZATIONS.get((opcode, type(left), type(right)))
+        self.code[self.ip - 1] = (specialized, None) if specialized is not None else (opcode, GENERIC)
+
+    def deoptimize(self, opcode):
+        #A specialized instruction saw other operand types: it goes back to generic for good
+        self.code[self.ip - 1] = (opcode, GENERIC)
+
+    # Generic binary operations; an instruction that has not been specialized yet (arg None)
+    # specializes itself after its first run
+    def op_add(self, arg):
+        right = self.stack.pop(); left = self.stack[-1]
+        self.stack[-1] = concat(left, right) if type(left) is str and type(right) is str else left + right
+        if arg is None: self.specialize(OP_ADD, left, right)
+    def op_sub(self, arg):
+        right = self.stack.pop(); left = self.stack[-1]; self.stack[-1] = left - right
+        if arg is None: self.specialize(OP_SUB, left, right)
+    def op_mul(self, arg): right = self.stack.pop(); self.stack[-1] = self.stack[-1] * right
+    def op_div(self, arg): right = self.stack.pop(); self.stack[-1] = self.stack[-1] / right
+
+    def op_compare_eq(self, arg): right = self.stack.pop(); self.stack[-1] = self.stack[-1] == right
+    def op_compare_ne(self, arg): right = self.stack.pop(); self.stack[-1] = self.stack[-1] != right
+    def op_compare_lt(self, arg):
+        right = self.stack.pop(); left = self.stack[-1]; self.stack[-1] = left < right
+        if arg is None: self.specialize(OP_COMPARE_LT, left, right)
+    def op_compare_gt(self, arg):
+        right = self.stack.pop(); left = self.stack[-1]; self.stack[-1] = left > right
+        if arg is None: self.specialize(OP_COMPARE_GT, left, right)
+
+    # Specialized forms: the guard re-checks the operand types and deoptimizes on a mismatch
+    def op_add_int(self, arg):
+        stack = self.stack; right = stack.pop(); left = stack[-1]
+        if type(left) is not int or type(right) is not int: self.deoptimize(OP_ADD)
+        stack[-1] = left + right
+    def op_add_str(self, arg):
+        #Strings and ropes (see rope.py): long concatenation results are built lazily
+        stack = self.stack; right = stack.pop(); left = stack[-1]
+        if type(left) is str and type(right) is str:
+            stack[-1] = concat(left, right)
+            return
+        if type(left) not in STRING_TYPES or type(right) not in STRING_TYPES: self.deoptimize(OP_ADD)
+        stack[-1] = left + right
+    def op_sub_int(self, arg):
+        stack = self.stack; right = stack.pop(); left = stack[-1]
+        if type(left) is not int or type(right) is not int: self.deoptimize(OP_SUB)
+        stack[-1] = left - right
+    def op_compare_lt_int(self, arg):
+        stack = self.stack; right = stack.pop(); left = stack[-1]
+        if type(left) is not int or type(right) is not int: self.deoptimize(OP_COMPARE_LT)
+        stack[-1] = left < right
+    def op_compare_gt_int(self, arg):
+        stack = self.stack; right = stack.pop(); left = stack[-1]
+        if type(left) is not int or type(right) is not int: self.deoptimize(OP_COMPARE_GT)
+        stack[-1] = left > right
+
+    def op_jump(self, arg): self.ip = arg
+
+    def op_jump_if_false(self, arg):
+        if not self.stack.pop(): self.ip = arg
+
+    def op_store_local(self, arg):
+        self.call_stack[-1].locals[arg] = self.stack.pop()
+
+    def op_load_local(self, arg):
+        value = self.call_stack[-1].locals[arg]
+        if value is None: raise NameError(f"Variable '{self.call_stack[-1].names[arg]}' is not defined.")
+        self.stack.append(value)
+
+    def op_print(self, arg): self.write(self.stack.pop())
+
+    def op_pop(self, arg): self.stack.pop()
+
+    def op_build_array(self, arg):
+        if not arg:
+            self.stack.append(NovaArray.from_values(()))
+            return
+        values = self.stack[-arg:]
+        del self.stack[-arg:]
+        self.stack.append(NovaArray.from_values(values))
+
+    def op_index(self, arg): index = self.stack.pop(); self.stack[-1] = index_value(self.stack[-1], index)
+
+    def op_builtin(self, arg): self.stack[-1] = BUILTIN_FUNCTIONS[arg](self.stack[-1])
+
+    def memo_key(self, args):
+        #Types are part of the key so that f(1), f(true) and f(1.0) are cached separately
+        args = tuple(args)
+        return args, tuple(map(type, args))
+
+    def call_shortcut(self, name, args, cache):
+        #Tries to complete a call without interpreting it: from the function's memo cache or
+        #through its native code. Returns (value, memo); value is MISSING when the call must be
+        #interpreted, and memo is then the (cache, key) pair its result should be stored under.
+        memo = None
+        if cache is not None:
+            key = self.memo_key(args)
+            try:
+                value = cache.lookup(key)
+            except TypeError:
+                pass # unhashable arguments (arrays): this call is not cached
             else:
-                raise Exception(f"Unknown opcode {opcode}")
\ No newline at end of file
+                if value is not MISSING: return value, None
+                memo = (cache, key)
+        native = self.native.get(name)
+        if native is not None and self.native_depth < MAX_NATIVE_DEPTH:
+            value = self.call_native(native, args)
+            if memo is not None: memo[0].store(memo[1], value)
+            return value, None
+        if self.tier_threshold and native is None:
+            count = self.call_counts[name] = self.call_counts.get(name, 0) + 1
+            if count == self.tier_threshold: self.tier_up(name)
+        return MISSING, memo
+
+    def site_args(self, site):
+        if not site.nargs: return []
+        args = self.stack[-site.nargs:]
+        del self.stack[-site.nargs:]
+        return args
+
+    # Unlinked calls: the callee was not defined when the code was linked
+    def op_call(self, arg): raise NameError(f"Function '{arg[0]}' is not defined.")
+    def op_tail_call(self, arg): raise NameError(f"Function '{arg[0]}' is not defined.")
+
+    def op_call_linked(self, site):
+        args = self.site_args(site)
+        memo = None
+        if site.memo is not None or self.tier_threshold or self.native:
+            value, memo = self.call_shortcut(site.name, args, site.memo)
+            if value is not MISSING:
+                self.stack.append(value)
+                return
+        args.extend(site.padding)
+        frame = Frame(self.ip, site.names, args)
+        frame.memo = memo
+        self.call_stack.append(frame)
+        self.ip = site.start_pos
+
+    def op_tail_call_linked(self, site):
+        #Reuses the current frame, so the callee returns straight to our caller
+        args = self.site_args(site)
+        memo = None
+        if site.memo is not None or self.tier_threshold or self.native:
+            value, memo = self.call_shortcut(site.name, args, site.memo)
+            if value is not MISSING:
+                self.stack.append(value)
+                self.op_return(None)
+                return
+        frame = self.call_stack[-1]
+        # A frame already caching the outer call keeps that key: its result is the callee's result
+        if frame.memo is None: frame.memo = memo
+        args.extend(site.padding)
+        frame.names, frame.locals = site.names, args
+        self.ip = site.start_pos
+
+    def op_return(self, arg):
+        return_value = self.stack.pop()
+        frame = self.call_stack.pop()
+        if frame.memo is not None:
+            cache, key = frame.memo
+            cache.store(key, return_value)
+        self.ip = frame.return_ip
+        self.stack.append(return_value)